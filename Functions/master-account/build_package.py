@@ -0,0 +1,57 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+#Builds master-lambda-response-functions.zip, the bundle every function of response_cis-aws-benchmark.yaml
+#runs from. Run it after changing anything in cis/ or common/:
+#
+#   python Functions/master-account/build_package.py
+#
+#Entries are sorted and carry a fixed timestamp, so the zip only changes when the sources do.
+
+import os
+import sys
+import zipfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PACKAGE = os.path.join(ROOT, 'master-lambda-response-functions.zip')
+FOLDERS = ['cis', 'common']
+TIMESTAMP = (2020, 7, 14, 0, 0, 0)
+
+def sources():
+    #{path in the zip: path on disk} of every module the functions import
+    files = {}
+    for folder in FOLDERS:
+        for name in sorted(os.listdir(os.path.join(ROOT, folder))):
+            if name.endswith('.py'):
+                files[f'{folder}/{name}'] = os.path.join(ROOT, folder, name)
+    return files
+
+def build(path: str = PACKAGE):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        for name, source in sorted(sources().items()):
+            entry = zipfile.ZipInfo(name, TIMESTAMP)
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            entry.external_attr = 0o644 << 16
+            with open(source, 'rb') as f:
+                package.writestr(entry, f.read())
+    return path
+
+if __name__ == '__main__':
+    print(build(sys.argv[1] if len(sys.argv) > 1 else PACKAGE))
@@ -18,52 +18,72 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
  
-import boto3
-import json
 import datetime
 import os
+import io
+import csv
 import logging
-import argparse
 
-from common import account_session
-from common import sns_notification
+from concurrent.futures import ThreadPoolExecutor
+
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import readiness
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+#Bulk mode: users whose stale keys are deactivated at the same time, IAM calls are still paced by the rate limiter
+BULK_WORKERS = int(os.environ.get('IAM_BULK_WORKERS', '4'))
+CREDENTIAL_REPORT_TIMEOUT_SECONDS = int(os.environ.get('CREDENTIAL_REPORT_TIMEOUT_SECONDS', '60'))
+#Notes are shared by every finding, so findings are resolved with as few Security Hub calls as possible
+DEACTIVATED_NOTE = 'Non compliant access keys older than 90 days were deactivated sucessfully for this user.'
+COMPLIANT_NOTE = 'No active access key older than 90 days found for this user, no change was needed.'
+
 def lambda_handler(event, context):
+    deadline.start(context)
 
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
 
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck, remediateBatch=remediate_batch)
+
+def precheck(finding, session):
+
+    #Compliant when the user has no active access key older than 90 days
+    nonRotatedKeyUser = finding.resource.name
+    iam = client_registry.get_client('iam', session)
+
+    oldestAllowed = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=90)
+    for response in iam.get_paginator('list_access_keys').paginate(UserName=nonRotatedKeyUser):
+        for keyMetadata in response['AccessKeyMetadata']:
+            if keyMetadata['Status'] == 'Active' and keyMetadata['CreateDate'] < oldestAllowed:
+                return None
+    return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
+
     #Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    nonRotatedKeyUserArn = str(event['detail']['findings'][0]['Resources'][0]['Id'])
+    targetAccount=finding.accountId
+    nonRotatedKeyUserArn = finding.resource.id
 
-    nonRotatedKeyUser = nonRotatedKeyUserArn.split('/')[-1]
+    nonRotatedKeyUser = finding.resource.name
 
     logger.info(f"Deactiviating the user name: {nonRotatedKeyUser} from Id: {nonRotatedKeyUserArn}")
 
-    findingId = str(event['detail']['findings'][0]['Id'])
-    productArn=event["detail"]["findings"][0]["ProductArn"]  
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME'] 
-
     ##Future feature
-    # if event['detail']['findings'][0]['Resources'][0]['Type'] == "AwsIamUser":
-    #     finding=event["detail"]
-    # elif event['detail']['findings'][0]['Resources'][0]['Type'] == "AwsAccount":
-    #     #Notify but do not resolve
-    # else:
-    #     raise Exception("Neither GuardDuty nor SecurityHub event")
-
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
+    # if finding.resourceType == "AwsAccount":
+    #     #Notify but do not resolve, returning None leaves the finding open
+    #     return None
+    # elif finding.resourceType != "AwsIamUser":
+    #     raise Exception("Neither an IAM user nor an account finding")
 
     # Create bot3 clients and resource
-    iam = session.client('iam')
-    securityhub = boto3.client('securityhub')
-    iam_resource = session.resource('iam')
+    iam = client_registry.get_client('iam', session)
+    iam_resource = client_registry.get_resource('iam', session)
 
+    deactivatedKeys = []
     try:
         todaysDatetime = datetime.datetime.now(datetime.timezone.utc)
         paginator = iam.get_paginator('list_access_keys')
@@ -93,33 +113,93 @@ def lambda_handler(event, context):
                         if access_KeyId == accessKeyId:
                             if access_KeyStatus == 'Inactive':
                                 logger.info('Access key over 90 days old deactivated!')
-                                try:
-                                    logger.info(f"Updating Security Hub Finding Id: {findingId}, Product Arn: {productArn} with RESOLVED status")
-
-                                    response = securityhub.batch_update_findings(
-                                        FindingIdentifiers=[
-                                            {
-                                                'Id': findingId,
-                                                'ProductArn': productArn
-                                            },
-                                        ],
-                                        Note={
-                                            'Text': f'Non compliant access key {accessKeyId} was deactivated sucessfully for {nonRotatedKeyUser}.',
-                                            'UpdatedBy': lambdaFunctionName
-                                        },
-                                        Workflow={
-                                            'Status': 'RESOLVED'
-                                        },
-                                    )
-                                    logger.info(response)
-
-                                    #Send Notification
-                                    findingTitle=event["detail"]["findings"][0]["Title"]
-                                    message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-                                    sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-                                except Exception as e:
-                                    print(e)
-                                    raise
+                                deactivatedKeys.append(accessKeyId)
     except Exception as e:
         print(e)
-        raise
\ No newline at end of file
+        raise
+
+    if deactivatedKeys:
+        logger.info(f"Non compliant access key {', '.join(deactivatedKeys)} was deactivated sucessfully for {nonRotatedKeyUser}.")
+        return DEACTIVATED_NOTE
+
+def _key_user(finding):
+    return finding.resource.name
+
+def _users_with_stale_keys(iam, users):
+
+    #Reads the account credential report once instead of listing the keys of every user
+    readiness.wait_until(
+        lambda: iam.generate_credential_report()['State'] == 'COMPLETE',
+        'credential report is generated',
+        timeout=CREDENTIAL_REPORT_TIMEOUT_SECONDS
+    )
+    report = iam.get_credential_report()
+    content = report['Content']
+
+    oldestAllowed = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=90)
+    staleUsers = set()
+    for row in csv.DictReader(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8')):
+        if row['user'] not in users:
+            continue
+        for slot in ('1', '2'):
+            lastRotated = row[f'access_key_{slot}_last_rotated']
+            if row[f'access_key_{slot}_active'] == 'true' and lastRotated != 'N/A' and datetime.datetime.fromisoformat(lastRotated) < oldestAllowed:
+                staleUsers.add(row['user'])
+    return staleUsers, report['GeneratedTime']
+
+def _reported_after(finding, generatedTime):
+
+    #IAM serves a cached credential report for up to 4 hours, it only proves compliance for findings it is newer than
+    try:
+        updatedAt = datetime.datetime.fromisoformat(finding.updatedAt.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return False
+    return updatedAt <= generatedTime
+
+def _deactivate_stale_keys(iam, userName: str):
+
+    #The credential report has no key ids, so the keys of a flagged user are listed once
+    oldestAllowed = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=90)
+    deactivatedKeys = []
+    for response in iam.get_paginator('list_access_keys').paginate(UserName=userName):
+        for keyMetadata in response['AccessKeyMetadata']:
+            if keyMetadata['Status'] == 'Active' and keyMetadata['CreateDate'] < oldestAllowed:
+                iam.update_access_key(UserName=userName, AccessKeyId=keyMetadata['AccessKeyId'], Status='Inactive')
+                deactivatedKeys.append(keyMetadata['AccessKeyId'])
+    logger.info(f"Deactivated access keys {', '.join(deactivatedKeys)} for {userName}")
+    return deactivatedKeys
+
+def remediate_batch(findings, session):
+
+    #All 1.3/1.4 findings of an account: one credential report, then every flagged user in parallel
+    iam = client_registry.get_client('iam', session)
+    users = {}
+    for finding in findings:
+        users.setdefault(_key_user(finding), []).append(finding)
+
+    staleUsers, generatedTime = _users_with_stale_keys(iam, users)
+    logger.info(f'Credential report flagged {len(staleUsers)} of {len(users)} users in account {findings[0].accountId}')
+
+    #Users the report shows as compliant are only resolved if the report is newer than their findings, the others
+    #have their keys listed like the flagged users
+    outcomes = {}
+    checkUsers = set(staleUsers)
+    for userName in users.keys() - staleUsers:
+        if all(_reported_after(finding, generatedTime) for finding in users[userName]):
+            for finding in users[userName]:
+                outcomes[finding.id] = COMPLIANT_NOTE
+        else:
+            checkUsers.add(userName)
+
+    def deactivate(userName):
+        try:
+            return userName, DEACTIVATED_NOTE if _deactivate_stale_keys(iam, userName) else COMPLIANT_NOTE
+        except Exception as e:
+            print(e)
+            return userName, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(BULK_WORKERS, len(checkUsers)))) as executor:
+        for userName, outcome in executor.map(deactivate, checkUsers):
+            for finding in users[userName]:
+                outcomes[finding.id] = outcome
+    return outcomes
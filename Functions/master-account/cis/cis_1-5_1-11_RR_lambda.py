@@ -18,81 +18,93 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
 import os
 import logging
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import single_flight
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 def lambda_handler(event, context):
+    deadline.start(context)
 
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
+
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck)
+
+UPDATED_NOTE = 'IAM Password Policy Updated in this account sucessfully!'
+COMPLIANT_NOTE = 'IAM Password Policy in this account is already compliant, no change was needed.'
+
+#Password policy applied by remediate_finding
+PASSWORD_POLICY = {
+    'MinimumPasswordLength': 14,
+    'RequireSymbols': True,
+    'RequireNumbers': True,
+    'RequireUppercaseCharacters': True,
+    'RequireLowercaseCharacters': True,
+    'AllowUsersToChangePassword': True,
+    'MaxPasswordAge': 90,
+    'PasswordReusePrevention': 24,
+    'HardExpiry': True
+}
+
+def _check_policy(iam, targetAccount: str):
+
+    #Compliant when the current policy is at least as strict as PASSWORD_POLICY
+    try:
+        policy = iam.get_account_password_policy()['PasswordPolicy']
+    except iam.exceptions.NoSuchEntityException:
+        return None
+
+    if policy.get('MinimumPasswordLength', 0) < PASSWORD_POLICY['MinimumPasswordLength']:
+        return None
+    if not 0 < policy.get('MaxPasswordAge', 0) <= PASSWORD_POLICY['MaxPasswordAge']:
+        return None
+    if policy.get('PasswordReusePrevention', 0) < PASSWORD_POLICY['PasswordReusePrevention']:
+        return None
+    for setting in ('RequireSymbols', 'RequireNumbers', 'RequireUppercaseCharacters', 'RequireLowercaseCharacters', 'AllowUsersToChangePassword', 'HardExpiry'):
+        if not policy.get(setting, False):
+            return None
+    return COMPLIANT_NOTE
+
+def precheck(finding, session):
+
+    #The seven findings of an account share one read of the policy
+    targetAccount=finding.accountId
+    iam = client_registry.get_client('iam', session)
+
+    return single_flight.get_single_flight().do('cis1-5-11-check#' + targetAccount, lambda: _check_policy(iam, targetAccount), shared=False)
+
+def remediate_finding(finding, session):
     
     #Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
-    findingId=event["detail"]["findings"][0]["Id"]
-    productArn=event["detail"]["findings"][0]["ProductArn"]  
+    targetAccount=finding.accountId
+    findingId=finding.id
 
     logger.info(f"Security Hub Finding {findingId} trigged response in account {targetAccount}")
-     
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
 
     #Clients
-    iam = session.client('iam')
-    securityhub = boto3.client('securityhub')
+    iam = client_registry.get_client('iam', session)
 
-    try:
-        response = iam.update_account_password_policy(
-            MinimumPasswordLength=14,
-            RequireSymbols=True,
-            RequireNumbers=True,
-            RequireUppercaseCharacters=True,
-            RequireLowercaseCharacters=True,
-            AllowUsersToChangePassword=True,
-            MaxPasswordAge=90,
-            PasswordReusePrevention=24,
-            HardExpiry=True
-            )
+    def updatePolicy():
+        response = iam.update_account_password_policy(**PASSWORD_POLICY)
         logger.info(response)
         logger.info(f"IAM Password Policy Updated in account {targetAccount}")   
 
-        #Update Security Hub Finding
-        try: 
-
-            logger.info(f"Updating Security Hub Finding Id: {findingId}, Product Arn: {productArn} with RESOLVED status")
-
-            response = securityhub.batch_update_findings(
-                FindingIdentifiers=[
-                    {
-                        'Id': findingId,
-                        'ProductArn': productArn
-                    },
-                ],
-                Note={
-                    'Text': f'IAM Password Policy Updated in account {targetAccount} sucessfully!',
-                    'UpdatedBy': lambdaFunctionName
-                },
-                Workflow={
-                    'Status': 'RESOLVED'
-                },
-            )
-            logger.info(response)
-
-            #Send Notification
-            findingTitle=event["detail"]["findings"][0]["Title"]
-            message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-            sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-        except Exception as e:
-            print(e)
-            raise
+        return UPDATED_NOTE
 
+    #Findings 1.5 to 1.11 of the same account share one update, in this container and across containers.
+    #They all get the same note, so the findings of every account are resolved with one Security Hub update.
+    try:
+        return single_flight.get_single_flight().do('cis1-5-11#' + targetAccount, updatePolicy)
+    except single_flight.LockWaitTimeout as e:
+        #The sweep checks the finding again once the other container updated the policy
+        raise finding_runner.RemediationPending(str(e))
     except Exception as e:
         print(e)
-        raise
\ No newline at end of file
+        raise
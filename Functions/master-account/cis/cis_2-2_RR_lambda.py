@@ -18,74 +18,51 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
 import os
 import logging
-import argparse
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+ENABLED_NOTE = 'Re-enabled Log File Validation sucessfully for this trail.'
+COMPLIANT_NOTE = 'Log File Validation is already enabled for this trail, no change was needed.'
+
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
-   
-    #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    findingId=event["detail"]["findings"][0]["Id"]
-    productArn=event["detail"]["findings"][0]["ProductArn"]  
-    
-    # parse non-compliant trail from Security Hub finding
-    noncompliantTrailFull = str(event['detail']['findings'][0]['Resources'][0]['Id'])
-    noncompliantTrail = noncompliantTrailFull.split(':')[-1]
-    
-    findingId = str(event['detail']['findings'][0]['Id'])
 
-    # import lambda function name from env vars
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck)
 
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
+def precheck(finding, session):
 
-    # import boto3 clients for CT & SH
-    cloudtrail = session.client('cloudtrail')
-    securityhub = boto3.client('securityhub')      
+    #Compliant when log file validation is already enabled on the trail
+    noncompliantTrailFull = finding.resource.id
+    cloudtrail = client_registry.get_client('cloudtrail', session)
+
+    trails = cloudtrail.describe_trails(trailNameList=[noncompliantTrailFull])['trailList']
+    if trails and trails[0].get('LogFileValidationEnabled'):
+        return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
+   
+    # parse non-compliant trail from Security Hub finding
+    noncompliantTrail = finding.resource.name
+
+    # import boto3 client for CT
+    cloudtrail = client_registry.get_client('cloudtrail', session)
 
     # turn on cloudtrail log file validation
     try:
         response = cloudtrail.update_trail(Name=noncompliantTrail,EnableLogFileValidation=True)
         logger.info(response)
-        try:
-            response = securityhub.batch_update_findings(
-                FindingIdentifiers=[
-                    {
-                        'Id': findingId,
-                        'ProductArn': productArn
-                    },
-                ],
-                Note={
-                    'Text': f'Re-enabled Log File Validation sucessfully for {noncompliantTrail}.',
-                    'UpdatedBy': lambdaFunctionName
-                },
-                Workflow={
-                    'Status': 'RESOLVED'
-                },
-            )
-            logger.info(response)
-
-            #Send Notification
-            findingTitle=event["detail"]["findings"][0]["Title"]
-            message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-            sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-        except Exception as e:
-            print(e)
-            raise
+        return ENABLED_NOTE
     except Exception as e:
         print(e)
         logger.info("Enabling log file validation has failed! Please remediate manually!")
-        raise
\ No newline at end of file
+        raise
@@ -18,78 +18,83 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
 import os
 import logging
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import automation_manager
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
-   
-    #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    productArn=event["detail"]["findings"][0]["ProductArn"]  
 
-    # Parse ARN of non-compliant resource from Security Hub CWE
-    rawBucketInfo = str(event['detail']['findings'][0]['Resources'][0]['Id'])
-    findingId = str(event['detail']['findings'][0]['Id'])
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck, remediateBatch=remediate_batch)
+
+DOCUMENT_NAME = 'AWS-DisableS3BucketPublicReadWrite'
+
+def _bucket(finding):
+    return finding.resource.name
+
+REMEDIATED_NOTE = 'Systems Manager Automation document to remove public access completed successfully for this bucket.'
+COMPLIANT_NOTE = 'Public access is already blocked for this bucket, no change was needed.'
 
-    # import lambda function name from env vars
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
+def precheck(finding, session):
 
-    # Remove ARN string, create new variable
-    noncompliantCTBucket = rawBucketInfo.replace("arn:aws:s3:::", "")
+    #Compliant when every public access block setting is already on for the bucket
+    noncompliantCTBucket = finding.resource.name
+    s3 = client_registry.get_client('s3', session)
 
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
+    try:
+        configuration = s3.get_public_access_block(Bucket=noncompliantCTBucket)['PublicAccessBlockConfiguration']
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchPublicAccessBlockConfiguration':
+            return None
+        raise
+    if all(configuration.get(setting) for setting in ('BlockPublicAcls', 'IgnorePublicAcls', 'BlockPublicPolicy', 'RestrictPublicBuckets')):
+        return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
+   
+    # Bucket name of the non-compliant resource, without its ARN prefix
+    noncompliantCTBucket = finding.resource.name
 
-    # import SSM and SecHub clients    
-    ssm = session.client('ssm')
-    securityhub = boto3.client('securityhub')
+    # import SSM client    
+    ssm = client_registry.get_client('ssm', session)
     
     try:
-        removeS3PublicReadWrite = ssm.start_automation_execution(
-            DocumentName='AWS-DisableS3BucketPublicReadWrite',
-            DocumentVersion='1', # default
-            Parameters={
-                'S3BucketName': [ noncompliantCTBucket ]
-            }
-        )
-        logger.info(removeS3PublicReadWrite)
-        try:
-            response = securityhub.batch_update_findings(
-                FindingIdentifiers=[
-                    {
-                        'Id': findingId,
-                        'ProductArn': productArn
-                    },
-                ],
-                Note={
-                    'Text': f'Systems Manager Automation document to remove public access was successfully invoked. Refer to Automation results to determine efficacy. Bucket: {noncompliantCTBucket}.',
-                    'UpdatedBy': lambdaFunctionName
-                },
-                Workflow={
-                    'Status': 'RESOLVED'
-                },
-            )
-            logger.info(response)
-
-            #Send Notification
-            findingTitle=event["detail"]["findings"][0]["Title"]
-            message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-            sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-        except Exception as e:
-            print(e)
-            raise
+        #Waits for the automation, a still running one leaves the finding NOTIFIED for the next sweep
+        outcomes = automation_manager.run(ssm, DOCUMENT_NAME, 'S3BucketName', [ noncompliantCTBucket ], previous={noncompliantCTBucket: automation_manager.previous_execution(finding)})
+        return automation_manager.resolve(outcomes[noncompliantCTBucket], DOCUMENT_NAME, noncompliantCTBucket, REMEDIATED_NOTE)
+    except finding_runner.RemediationPending:
+        raise
     except Exception as e:
         print(e)
         logger.info("SSM automation execution failed")
-        raise
\ No newline at end of file
+        raise
+
+def remediate_batch(findings, session):
+
+    #All buckets of the account run as one rate controlled automation instead of one execution per bucket
+    #Resources that are already compliant are resolved without starting an automation for them
+    results, findings = finding_runner.precheck_findings(findings, session, precheck)
+    if not findings:
+        return results
+
+    ssm = client_registry.get_client('ssm', session)
+    buckets = {finding.id: _bucket(finding) for finding in findings}
+    previous = {_bucket(finding): automation_manager.previous_execution(finding) for finding in findings}
+    outcomes = automation_manager.run(ssm, DOCUMENT_NAME, 'S3BucketName', list(buckets.values()), previous=previous)
+
+    for findingId, bucket in buckets.items():
+        try:
+            results[findingId] = automation_manager.resolve(outcomes[bucket], DOCUMENT_NAME, bucket, REMEDIATED_NOTE)
+        except Exception as e:
+            results[findingId] = e
+    return results
@@ -18,104 +18,90 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
-import time
 import os
 import logging
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import log_group_provisioner
+from common import readiness
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+ENABLED_NOTE = 'CloudWatch logging is now enabled for this CloudTrail trail.'
+COMPLIANT_NOTE = 'CloudWatch logging was already enabled for this CloudTrail trail, no change was needed.'
+
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
+
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck)
+
+def precheck(finding, session):
+
+    #Compliant when the trail already delivers to a CloudWatch Logs log group
+    noncomplaintCloudTrail = finding.resource.id
+    cloudtrail = client_registry.get_client('cloudtrail', session)
+
+    trails = cloudtrail.describe_trails(trailNameList=[noncomplaintCloudTrail])['trailList']
+    if trails and trails[0].get('CloudWatchLogsLogGroupArn'):
+        return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
    
     #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    productArn=event["detail"]["findings"][0]["ProductArn"]  
+    targetAccount=finding.accountId
 
     # parse non-compliant trail from Security Hub finding
-    noncomplaintCloudTrail = str(event['detail']['findings'][0]['Resources'][0]['Id'])
+    noncomplaintCloudTrail = finding.resource.id
     #Parse to '<TrailName>' because the AliasName for a KMS CMK key has the pattern 'alias/^[a-zA-Z0-9/_-]+$'
-    noncompliantTrail = noncomplaintCloudTrail.split('/')[-1]
-
-    findingId = str(event['detail']['findings'][0]['Id'])
-
-    # import lambda runtime vars - imported session token to add to log group name to enforce uniqueness
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
-    lambdaFunctionSeshToken = os.environ['AWS_SESSION_TOKEN']   
+    noncompliantTrail = finding.resource.name
 
-    # Set name for Cloudwatch logs group
-    cloudwatchLogGroup = 'CloudTrail/CIS2-4-' + noncompliantTrail + "/" + str(int(time.time()))  
+    # Set name for Cloudwatch logs group, the same on every run for this trail
+    cloudwatchLogGroup = 'CloudTrail/CIS2-4-' + noncompliantTrail
 
     # Import CloudTrail to CloudWatch logging IAM Role
     cloudtrailLoggingRoleName = os.environ['CLOUDTRAIL_CW_LOGGING_ROLE_NAME']              
-    
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
 
     # set boto3 clients
-    securityhub = boto3.client('securityhub')
-    cwl = session.client('logs')
-    cloudtrail = session.client('cloudtrail')
+    cloudtrail = client_registry.get_client('cloudtrail', session)
 
-    # create cloudwatch log group
+    # create cloudwatch log group unless it exists, its ARN is built locally
     try:
-        createGroup = cwl.create_log_group(
-            logGroupName=cloudwatchLogGroup,
-        )
-        logger.info(createGroup)
+        cloudwatchArn = log_group_provisioner.ensure_log_group(session, targetAccount, cloudwatchLogGroup)
     except Exception as e:
         print(e)
         raise
-    # wait for CWL group to propagate    
-    time.sleep(2)              
-    # get CWL ARN
-    try:
-        describeGroup = cwl.describe_log_groups(logGroupNamePrefix=cloudwatchLogGroup)
-        cloudwatchArn = str(describeGroup['logGroups'][0]['arn'])
-    except Exception as e:
-        print(e)
-        raise          
 
-    # update non-compliant Trail
-    try:
-        updateCloudtrail = cloudtrail.update_trail(
-            Name=noncomplaintCloudTrail,
-            CloudWatchLogsLogGroupArn=cloudwatchArn,
-            CloudWatchLogsRoleArn="arn:aws:iam::" + targetAccount + ":role/" + cloudtrailLoggingRoleName
-        )
-        logger.info(updateCloudtrail)
+    # the log group may have been deleted since it was cached, then it is created again once
+    recreated = []
+    def updateTrail():
         try:
-            response = securityhub.batch_update_findings(
-                FindingIdentifiers=[
-                    {
-                        'Id': findingId,
-                        'ProductArn': productArn
-                    },
-                ],
-                Note={
-                    'Text': 'CloudWatch logging is now enabled for CloudTrail trail ' + noncomplaintCloudTrail,
-                    'UpdatedBy': lambdaFunctionName
-                },
-                Workflow={
-                    'Status': 'RESOLVED'
-                },
+            return cloudtrail.update_trail(
+                Name=noncomplaintCloudTrail,
+                CloudWatchLogsLogGroupArn=cloudwatchArn,
+                CloudWatchLogsRoleArn="arn:aws:iam::" + targetAccount + ":role/" + cloudtrailLoggingRoleName
             )
-            logger.info(response)
-
-            #Send Notification
-            findingTitle=event["detail"]["findings"][0]["Title"]
-            message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-            sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-        except Exception as e:
-            print(e)
+        except cloudtrail.exceptions.InvalidCloudWatchLogsLogGroupArnException:
+            if not recreated:
+                recreated.append(cloudwatchLogGroup)
+                log_group_provisioner.forget(targetAccount, cloudtrail.meta.region_name, cloudwatchLogGroup)
+                log_group_provisioner.ensure_log_group(session, targetAccount, cloudwatchLogGroup)
             raise
+
+    # update non-compliant Trail, a new log group can take a moment before CloudTrail accepts it
+    try:
+        updateCloudtrail = readiness.wait_until(
+            updateTrail,
+            f'CloudTrail accepts log group {cloudwatchLogGroup}',
+            retryErrorCodes=('InvalidCloudWatchLogsLogGroupArnException',)
+        )
+        logger.info(updateCloudtrail)
+        return ENABLED_NOTE
     except Exception as e:
         print(e)
-        raise
\ No newline at end of file
+        raise
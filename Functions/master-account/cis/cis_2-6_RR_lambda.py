@@ -18,86 +18,94 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
 import os
 import logging
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import automation_manager
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
+
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck, remediateBatch=remediate_batch)
+
+DOCUMENT_NAME = 'AWS-ConfigureS3BucketLogging'
+
+def _bucket(finding):
+    return finding.resource.name
+
+def _parameters(accessLoggingBucket: str):
+    #Every parameter except BucketName, which is the automation target
+    return {
+        'GrantedPermission': [ 'WRITE' ],
+        'GranteeType': [ 'Group' ],
+        'GranteeUri': [ 'http://acs.amazonaws.com/groups/s3/LogDelivery' ], ## Must Use URI, fails with Canonical Group Id
+        'TargetPrefix' : [ '/ServerAccessLogging/' + accessLoggingBucket + '/' ],
+        'TargetBucket': [ accessLoggingBucket ]
+    }
+
+def _note(accessLoggingBucket: str):
+    #The same for every finding, the access logging bucket is set per function
+    return 'Systems Manager Automation document to configure server access logging completed successfully. Configured this bucket to send logs to bucket ' + accessLoggingBucket
+
+COMPLIANT_NOTE = 'Server access logging is already enabled for this bucket, no change was needed.'
+
+def precheck(finding, session):
+
+    #Compliant when server access logging is already enabled on the bucket
+    formattedCTBucket = finding.resource.name
+    s3 = client_registry.get_client('s3', session)
+
+    if s3.get_bucket_logging(Bucket=formattedCTBucket).get('LoggingEnabled'):
+        return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
    
-    #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    productArn=event["detail"]["findings"][0]["ProductArn"]     
-    
-    # Parse ARN of non-compliant resource from Security Hub CWE
-    ctBucket = str(event['detail']['findings'][0]['Resources'][0]['Id'])
-    findingId = str(event['detail']['findings'][0]['Id'])
-    
-    # import lambda function name from runtime env
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
-    
-    # Remove ARN string, create new variable
-    formattedCTBucket = ctBucket.replace("arn:aws:s3:::", "")
+    # Bucket name of the non-compliant resource, without its ARN prefix
+    formattedCTBucket = finding.resource.name
     
     # import Lambda env var for Access Logging Bucket
     accessLoggingBucket = os.environ['ACCESS_LOGGING_BUCKET']              
-    
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
 
     # import SSM boto3 client
-    securityhub = boto3.client('securityhub')
-    ssm = session.client('ssm')              
+    ssm = client_registry.get_client('ssm', session)              
     
     #excute automation with ConfigureS3BucketLogging Document
     try:
-        response = ssm.start_automation_execution(
-            DocumentName='AWS-ConfigureS3BucketLogging',
-            DocumentVersion='1',
-            Parameters={
-                'BucketName': [ formattedCTBucket ],
-                'GrantedPermission': [ 'WRITE' ],
-                'GranteeType': [ 'Group' ],
-                'GranteeUri': [ 'http://acs.amazonaws.com/groups/s3/LogDelivery' ], ## Must Use URI, fails with Canonical Group Id
-                'TargetPrefix' : [ '/ServerAccessLogging/' + accessLoggingBucket + '/' ],
-                'TargetBucket': [ accessLoggingBucket ]
-            }
-        )
-        logger.info(response)
-        try:
-            response = securityhub.batch_update_findings(
-                FindingIdentifiers=[
-                    {
-                        'Id': findingId,
-                        'ProductArn': productArn
-                    },
-                ],
-                Note={
-                    'Text': 'Systems Manager Automation document to remove public access was successfully invoked. Refer to Automation results to determine efficacy. Configuring' + formattedCTBucket + ' to send logs to bucket ' + accessLoggingBucket,
-                    'UpdatedBy': lambdaFunctionName
-                },
-                Workflow={
-                    'Status': 'RESOLVED'
-                },
-            )
-            logger.info(response)
-
-            #Send Notification
-            findingTitle=event["detail"]["findings"][0]["Title"]
-            message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-            sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-        except Exception as e:
-            print(e)
-            raise
+        #Waits for the automation, a still running one leaves the finding NOTIFIED for the next sweep
+        outcomes = automation_manager.run(ssm, DOCUMENT_NAME, 'BucketName', [ formattedCTBucket ], _parameters(accessLoggingBucket), previous={formattedCTBucket: automation_manager.previous_execution(finding)})
+        return automation_manager.resolve(outcomes[formattedCTBucket], DOCUMENT_NAME, formattedCTBucket, _note(accessLoggingBucket))
+    except finding_runner.RemediationPending:
+        raise
     except Exception as e:
         print(e)
-        raise
\ No newline at end of file
+        raise
+
+def remediate_batch(findings, session):
+
+    #All buckets of the account run as one rate controlled automation instead of one execution per bucket
+    #Resources that are already compliant are resolved without starting an automation for them
+    results, findings = finding_runner.precheck_findings(findings, session, precheck)
+    if not findings:
+        return results
+
+    accessLoggingBucket = os.environ['ACCESS_LOGGING_BUCKET']
+    ssm = client_registry.get_client('ssm', session)
+    buckets = {finding.id: _bucket(finding) for finding in findings}
+    previous = {_bucket(finding): automation_manager.previous_execution(finding) for finding in findings}
+    outcomes = automation_manager.run(ssm, DOCUMENT_NAME, 'BucketName', list(buckets.values()), _parameters(accessLoggingBucket), previous=previous)
+
+    for findingId, bucket in buckets.items():
+        try:
+            results[findingId] = automation_manager.resolve(outcomes[bucket], DOCUMENT_NAME, bucket, _note(accessLoggingBucket))
+        except Exception as e:
+            results[findingId] = e
+    return results
@@ -18,83 +18,61 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
-import time
 import os
 import logging
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import readiness
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+ENABLED_NOTE = 'Key Rotation successfully enabled for this KMS key.'
+COMPLIANT_NOTE = 'Key Rotation was already enabled for this KMS key, no change was needed.'
+
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
-   
-    #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    productArn=event["detail"]["findings"][0]["ProductArn"]  
 
-    # Parse ARN of non-compliant resource from Security Hub CWE
-    noncompliantCMK = str(event['detail']['findings'][0]['Resources'][0]['Id'])
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck)
+
+def precheck(finding, session):
 
-    # Remove ARN string, create new variable
-    findingId = str(event['detail']['findings'][0]['Id'])
+    #Compliant when rotation is already enabled for the key
+    formattedCMK = finding.resource.id
+    kms = client_registry.get_client('kms', session)
 
-    # import lambda function name from env vars
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
-    formattedCMK = noncompliantCMK.replace("AWS::KMS::Key:", "") 
+    if kms.get_key_rotation_status(KeyId=formattedCMK)['KeyRotationEnabled']:
+        return COMPLIANT_NOTE
 
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
+def remediate_finding(finding, session):
+   
+    # Key id of the non-compliant resource, without its AWS::KMS::Key: prefix
+    formattedCMK = finding.resource.id
 
-    # Import KMS & SecHub Clients
-    kms = session.client('kms')
-    securityhub = boto3.client('securityhub')        
+    # Import KMS Client
+    kms = client_registry.get_client('kms', session)
 
     # Rotate KMS Key
     try:
-        rotate = kms.enable_key_rotation(KeyId=formattedCMK)
-        time.sleep(3)
+        kms.enable_key_rotation(KeyId=formattedCMK)
     except Exception as e:
         print(e)
         raise
     try:    
-        confirmRotate = kms.get_key_rotation_status(KeyId=formattedCMK)
-        rotationStatus = str(confirmRotate['KeyRotationEnabled'])
-        if rotationStatus == 'True':
-            logger.info("KMS CMK Rotation Successfully Enabled!")
-            try:
-                response = securityhub.batch_update_findings(
-                    FindingIdentifiers=[
-                        {
-                            'Id': findingId,
-                            'ProductArn': productArn
-                        },
-                    ],
-                    Note={
-                        'Text': 'Key Rotation successfully enabled for KMS key ' + formattedCMK,
-                        'UpdatedBy': lambdaFunctionName
-                    },
-                    Workflow={
-                        'Status': 'RESOLVED'
-                    },
-                )
-                logger.info(response)
-
-                #Send Notification
-                findingTitle=event["detail"]["findings"][0]["Title"]
-                message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-                sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-            except Exception as e:
-                print(e)
-                raise
-        else:
-            logger.info("KMS CMK Rotation Failed! Please troubleshoot manually!")
+        readiness.wait_until(
+            lambda: kms.get_key_rotation_status(KeyId=formattedCMK)['KeyRotationEnabled'],
+            f'rotation is enabled for KMS key {formattedCMK}'
+        )
+        logger.info("KMS CMK Rotation Successfully Enabled!")
+        return ENABLED_NOTE
+    except readiness.NotReadyError:
+        logger.info("KMS CMK Rotation Failed! Please troubleshoot manually!")
+        raise Exception("KMS CMK Rotation Failed for " + formattedCMK)
     except Exception as e:
         print(e)
-        raise
\ No newline at end of file
+        raise
@@ -18,123 +18,168 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
-import time
 import os
 import logging
-import argparse
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import log_group_provisioner
+from common import readiness
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+#One log group per account and region receives the flow logs of every remediated VPC
+FLOW_LOG_GROUP = os.environ.get('FLOW_LOG_GROUP_NAME', 'VPCFlowLogs/CIS2-9')
+#CreateFlowLogs accepts up to 1000 VPCs per request
+MAX_FLOW_LOG_RESOURCES = 1000
+ALREADY_EXISTS_CODES = ('FlowLogAlreadyExists',)
+ENABLED_NOTE = 'Flow logging is now enabled for this VPC. Log Group: ' + FLOW_LOG_GROUP
+COMPLIANT_NOTE = 'Flow logging was already enabled for this VPC, no change was needed.'
+
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
+
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck, remediateBatch=remediate_batch)
+
+def precheck(finding, session):
+
+    #Compliant when the VPC already has an active flow log
+    noncompliantVPC = finding.resource.name
+    ec2 = client_registry.get_client('ec2', session, finding.resourceRegion)
+
+    flowLogs = ec2.describe_flow_logs(Filters=[{'Name': 'resource-id', 'Values': [ noncompliantVPC ]}])['FlowLogs']
+    if any(flowLog['FlowLogStatus'] == 'ACTIVE' for flowLog in flowLogs):
+        return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
    
     #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    productArn=event["detail"]["findings"][0]["ProductArn"] 
+    targetAccount=finding.accountId
 
     # Grab non-logged VPC ID from Security Hub finding
-    noncompliantVPCFull = str(event['detail']['findings'][0]['Resources'][0]['Id'])
-    noncompliantVPC = noncompliantVPCFull.split('/')[-1]
-    findingId = str(event['detail']['findings'][0]['Id'])
-
-    # import lambda runtime vars
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME'] 
+    noncompliantVPC = finding.resource.name
 
     # Get Flow Logs Role ARN from env vars
     DeliverLogsPermissionRoleName = os.environ['FLOW_LOG_ROLE_NAME']    
 
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, TargetAccountSecurityRoleName) 
-
     # Import boto3 clients
-    cwl = session.client('logs')
-    ec2 = session.client('ec2')
-    securityhub = boto3.client('securityhub')              
-
-    # set dynamic variable for CW Log Group for VPC Flow Logs
-    vpcFlowLogGroup = "VPCFlowLogs/" + noncompliantVPC + "/" + str(int(time.time()))  
+    ec2 = client_registry.get_client('ec2', session, finding.resourceRegion)
 
-    logger.info(f'VPC Flow Log Group Name: {vpcFlowLogGroup} generated based name and current time') 
-
-    # create cloudwatch log group
+    # shared CW Log Group for VPC Flow Logs, created on first use
     try:
-        create_log_grp = cwl.create_log_group(logGroupName=vpcFlowLogGroup)
-        logger.info(create_log_grp)
+        log_group_provisioner.ensure_log_group(session, targetAccount, FLOW_LOG_GROUP, finding.resourceRegion)
     except Exception as e:
         print(e)
-        raise              
-
-    # wait for CWL creation to propagate
-    time.sleep(3)              
+        raise
 
     # create VPC Flow Logging
     try:
         enableFlowlogs = ec2.create_flow_logs(
             DryRun=False,
             DeliverLogsPermissionArn= "arn:aws:iam::" + targetAccount + ":role/" + DeliverLogsPermissionRoleName,
-            LogGroupName=vpcFlowLogGroup,
+            LogGroupName=FLOW_LOG_GROUP,
             ResourceIds=[ noncompliantVPC ],
             ResourceType='VPC',
             TrafficType='REJECT',
             LogDestinationType='cloud-watch-logs'
         )
         logger.info(enableFlowlogs)
+        for unsuccessful in enableFlowlogs.get('Unsuccessful', []):
+            if unsuccessful['Error']['Code'] not in ALREADY_EXISTS_CODES:
+                raise Exception(unsuccessful['Error']['Message'])
     except Exception as e:
         print(e)
         raise
 
-    # wait for Flow Log creation to propogate
-    time.sleep(2)
-
-    # searches for flow log status, filtered on unique CW Log Group created earlier
+    # searches for flow log status, filtered on the shared CW Log Group and this VPC, until the Flow Log creation has propogated
     try:
-        confirmFlowlogs = ec2.describe_flow_logs(
-        DryRun=False,
-        Filters=[
-            {
-                'Name': 'log-group-name',
-                'Values': [ vpcFlowLogGroup ]
-            },
-        ]
-        )
-        flowStatus = str(confirmFlowlogs['FlowLogs'][0]['FlowLogStatus'])
-        if flowStatus == 'ACTIVE':
-            try:
-                response = securityhub.batch_update_findings(
-                    FindingIdentifiers=[
-                        {
-                            'Id': findingId,
-                            'ProductArn': productArn
-                        },
-                    ],
-                    Note={
-                        'Text': 'Flow logging is now enabled for VPC ' + noncompliantVPC + 'Log Group: ' + vpcFlowLogGroup,
-                        'UpdatedBy': lambdaFunctionName
-                    },
-                    Workflow={
-                        'Status': 'RESOLVED'
-                    },
-                )
-                logger.info(response)
-
-                #Send Notification
-                findingTitle=event["detail"]["findings"][0]["Title"]
-                message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-                sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-            except Exception as e:
-                print(e)
-                raise
-        else:
-            logger.info('Enabling VPC flow logging failed! Remediate manually')
-            return 1
+        readiness.wait_until(lambda: not _inactive_vpcs(ec2, [ noncompliantVPC ], FLOW_LOG_GROUP), f'flow log for {noncompliantVPC} is ACTIVE')
+        return ENABLED_NOTE
+    except readiness.NotReadyError:
+        logger.info('Enabling VPC flow logging failed! Remediate manually')
+        raise Exception('VPC flow log is not ACTIVE for ' + noncompliantVPC)
     except Exception as e:
         print(e)
-        raise
\ No newline at end of file
+        raise
+
+def _inactive_vpcs(ec2, vpcIds, logGroupName: str = None):
+    #VPCs without an ACTIVE flow log, into logGroupName when given, one filtered describe for all of them
+    filters = [{'Name': 'resource-id', 'Values': list(vpcIds)}]
+    if logGroupName:
+        filters.append({'Name': 'log-group-name', 'Values': [ logGroupName ]})
+    activeVPCs = set()
+    for response in ec2.get_paginator('describe_flow_logs').paginate(Filters=filters):
+        for flowLog in response['FlowLogs']:
+            if flowLog['FlowLogStatus'] == 'ACTIVE':
+                activeVPCs.add(flowLog['ResourceId'])
+    return [vpcId for vpcId in vpcIds if vpcId not in activeVPCs]
+
+def _enable_region(session, region: str, vpcFindings):
+
+    #Returns {finding Id: outcome} for the VPCs of one account and region
+    targetAccount = next(iter(vpcFindings.values()))[0].accountId
+    DeliverLogsPermissionRoleName = os.environ['FLOW_LOG_ROLE_NAME']
+    ec2 = client_registry.get_client('ec2', session, region)
+    outcomes = {}
+
+    def settle(vpcIds, outcome):
+        for vpcId in vpcIds:
+            for finding in vpcFindings[vpcId]:
+                outcomes[finding.id] = outcome
+
+    log_group_provisioner.ensure_log_group(session, targetAccount, FLOW_LOG_GROUP, region)
+
+    pending = _inactive_vpcs(ec2, list(vpcFindings))
+    settle(set(vpcFindings) - set(pending), COMPLIANT_NOTE)
+    logger.info(f'{len(pending)} of {len(vpcFindings)} VPCs in {region} need flow logs')
+
+    for start in range(0, len(pending), MAX_FLOW_LOG_RESOURCES):
+        vpcIds = pending[start:start + MAX_FLOW_LOG_RESOURCES]
+        enableFlowlogs = ec2.create_flow_logs(
+            DryRun=False,
+            DeliverLogsPermissionArn= "arn:aws:iam::" + targetAccount + ":role/" + DeliverLogsPermissionRoleName,
+            LogGroupName=FLOW_LOG_GROUP,
+            ResourceIds=vpcIds,
+            ResourceType='VPC',
+            TrafficType='REJECT',
+            LogDestinationType='cloud-watch-logs'
+        )
+        for unsuccessful in enableFlowlogs.get('Unsuccessful', []):
+            if unsuccessful['Error']['Code'] not in ALREADY_EXISTS_CODES:
+                settle([unsuccessful['ResourceId']], Exception(unsuccessful['Error']['Message']))
+                pending.remove(unsuccessful['ResourceId'])
+
+    if pending:
+        try:
+            readiness.wait_until(lambda: not _inactive_vpcs(ec2, pending, FLOW_LOG_GROUP), f'flow logs for {len(pending)} VPCs in {region} are ACTIVE')
+            settle(pending, ENABLED_NOTE)
+        except readiness.NotReadyError:
+            inactive = _inactive_vpcs(ec2, pending, FLOW_LOG_GROUP)
+            settle(set(pending) - set(inactive), ENABLED_NOTE)
+            settle(inactive, Exception('VPC flow log is not ACTIVE'))
+    return outcomes
+
+def remediate_batch(findings, session):
+
+    #All 2.9 findings of an account: per region one log group check, one create_flow_logs and one filtered verify
+    regions = {}
+    for finding in findings:
+        region = finding.resourceRegion or session.region_name
+        noncompliantVPC = finding.resource.name
+        regions.setdefault(region, {}).setdefault(noncompliantVPC, []).append(finding)
+
+    outcomes = {}
+    for region, vpcFindings in regions.items():
+        try:
+            outcomes.update(_enable_region(session, region, vpcFindings))
+        except Exception as e:
+            print(e)
+            for regionFindings in vpcFindings.values():
+                for finding in regionFindings:
+                    outcomes.setdefault(finding.id, e)
+    return outcomes
@@ -18,74 +18,87 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
 import os
 import logging
 
-from common import account_session
-from common import sns_notification
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import automation_manager
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
-   
-    #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    productArn=event["detail"]["findings"][0]["ProductArn"] 
 
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck, remediateBatch=remediate_batch)
+
+DOCUMENT_NAME = 'AWS-DisablePublicAccessForSecurityGroup'
+
+def _group_id(finding):
+    return finding.resource.name
+
+REMEDIATED_NOTE = 'Systems Manager Automation document to remove public access completed successfully on this Security Group.'
+COMPLIANT_NOTE = 'This Security Group no longer allows SSH or RDP from the internet, no change was needed.'
+
+#Ports AWS-DisablePublicAccessForSecurityGroup closes to the internet
+ADMIN_PORTS = (22, 3389)
+
+def _open_to_internet(permission):
+    if not any(ipRange.get('CidrIp') == '0.0.0.0/0' for ipRange in permission.get('IpRanges', [])) and \
+       not any(ipRange.get('CidrIpv6') == '::/0' for ipRange in permission.get('Ipv6Ranges', [])):
+        return False
+    if permission.get('IpProtocol') == '-1':
+        return True
+    return any(permission.get('FromPort', 0) <= port <= permission.get('ToPort', 65535) for port in ADMIN_PORTS)
+
+def precheck(finding, session):
+
+    #Compliant when no ingress rule opens SSH or RDP to the internet any more
+    non_compliant_sg = finding.resource.name
+    ec2 = client_registry.get_client('ec2', session)
+
+    securityGroup = ec2.describe_security_groups(GroupIds=[ non_compliant_sg ])['SecurityGroups'][0]
+    if not any(_open_to_internet(permission) for permission in securityGroup['IpPermissions']):
+        return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
+   
     # parse Security Group ID from Security Hub CWE
-    non_compliant_sg = str(event['detail']['findings'][0]['Resources'][0]['Details']['AwsEc2SecurityGroup']['GroupId'])
-    findingId = str(event['detail']['findings'][0]['Id'])
-    
-    # import lambda function name from runtime vars
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
-    
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
+    non_compliant_sg = finding.resource.name
 
     #import boto3 clients
-    ssm = session.client('ssm')
-    securityhub = boto3.client('securityhub')
+    ssm = client_registry.get_client('ssm', session)
     try:
-        response = ssm.start_automation_execution(
-            # Launch SSM Doc via Automation
-            DocumentName='AWS-DisablePublicAccessForSecurityGroup',
-            DocumentVersion='1',
-            Parameters={
-                'GroupId': [ non_compliant_sg ]
-            }
-        )
-        logger.info(response)
-        try:
-            response = securityhub.batch_update_findings(
-                FindingIdentifiers=[
-                    {
-                        'Id': findingId,
-                        'ProductArn': productArn
-                    },
-                ],
-                Note={
-                    'Text': 'Systems Manager Automation document to remove public access was successfully invoked on Security Group Id: ' + non_compliant_sg + '. Refer to Automation results to determine efficacy.',
-                    'UpdatedBy': lambdaFunctionName
-                },
-                Workflow={
-                    'Status': 'RESOLVED'
-                },
-            )
-            logger.info(response)
-
-            #Send Notification
-            findingTitle=event["detail"]["findings"][0]["Title"]
-            message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-            sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
-        except Exception as e:
-            print(e)
-            raise
+        # Launch SSM Doc via Automation and wait for it, a still running one leaves the finding NOTIFIED for the next sweep
+        outcomes = automation_manager.run(ssm, DOCUMENT_NAME, 'GroupId', [ non_compliant_sg ], previous={non_compliant_sg: automation_manager.previous_execution(finding)})
+        return automation_manager.resolve(outcomes[non_compliant_sg], DOCUMENT_NAME, non_compliant_sg, REMEDIATED_NOTE)
+    except finding_runner.RemediationPending:
+        raise
     except Exception as e:
         print(e)
-        raise
\ No newline at end of file
+        raise
+
+def remediate_batch(findings, session):
+
+    #All security groups of the account run as one rate controlled automation instead of one execution per group
+    #Resources that are already compliant are resolved without starting an automation for them
+    results, findings = finding_runner.precheck_findings(findings, session, precheck)
+    if not findings:
+        return results
+
+    ssm = client_registry.get_client('ssm', session)
+    groupIds = {finding.id: _group_id(finding) for finding in findings}
+    previous = {_group_id(finding): automation_manager.previous_execution(finding) for finding in findings}
+    outcomes = automation_manager.run(ssm, DOCUMENT_NAME, 'GroupId', list(groupIds.values()), previous=previous)
+
+    for findingId, groupId in groupIds.items():
+        try:
+            results[findingId] = automation_manager.resolve(outcomes[groupId], DOCUMENT_NAME, groupId, REMEDIATED_NOTE)
+        except Exception as e:
+            results[findingId] = e
+    return results
@@ -18,77 +18,119 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import boto3
-import json
 import os
 import logging
 
-from common import account_session
-from common import sns_notification
+from concurrent.futures import ThreadPoolExecutor
+
+from common import deadline
+from common import client_registry
+from common import finding_runner
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+#Bulk mode: default security groups locked down at the same time
+BULK_WORKERS = int(os.environ.get('EC2_BULK_WORKERS', '8'))
+REVOKED_NOTE = 'All rules removed from this Default Security Group.'
+COMPLIANT_NOTE = 'This Default Security Group has no rules, no change was needed.'
+
 def lambda_handler(event, context):
+    deadline.start(context)
     #VARIABLES
     #Lambda Environment Variables
     TargetAccountSecurityRoleName=os.environ['TargetAccountSecurityRoleName'] 
-   
-    #Common Variables
-    targetAccount=event["detail"]["findings"][0]["AwsAccountId"]
-    productArn=event["detail"]["findings"][0]["ProductArn"] 
 
-    #Assume role in target account for response 
-    session=account_session.get_session(targetAccount, os.environ['TargetAccountSecurityRoleName']) 
+    return finding_runner.run_findings(event, remediate_finding, TargetAccountSecurityRoleName, precheck=precheck, remediateBatch=remediate_batch)
+
+def precheck(finding, session):
 
-    # boto3 clients/rescs
-    ec2 = session.resource('ec2')
-    securityhub = boto3.client('securityhub')
+    #Compliant when the default security group has no rules left
+    myDefaultSecGroupId = finding.resource.name
+    ec2 = client_registry.get_client('ec2', session)
 
-    # import lambda env var
-    lambdaFunctionName = os.environ['AWS_LAMBDA_FUNCTION_NAME']
+    securityGroup = ec2.describe_security_groups(GroupIds=[ myDefaultSecGroupId ])['SecurityGroups'][0]
+    if not securityGroup['IpPermissions'] and not securityGroup['IpPermissionsEgress']:
+        return COMPLIANT_NOTE
+
+def remediate_finding(finding, session):
+   
+    # boto3 clients
+    ec2 = client_registry.get_client('ec2', session)
 
     # parse details from sechub finding
-    myDefaultSecGroupId = str(event['detail']['findings'][0]['Resources'][0]['Details']['AwsEc2SecurityGroup']['GroupId'])
-    findingId = str(event['detail']['findings'][0]['Id'])
+    myDefaultSecGroupId = finding.resource.name
 
     try:
-        # sg ec2 resource object
-        defaultSG = ec2.SecurityGroup(myDefaultSecGroupId)
+        # find ingress + egress rules with one describe, then revoke the lists that are not empty
+        defaultSG = ec2.describe_security_groups(GroupIds=[ myDefaultSecGroupId ])['SecurityGroups'][0]
+        _lock_down(ec2, defaultSG)
+
+        return REVOKED_NOTE
+    except Exception as e:
+        print(e)
+        raise
+
+def _default_groups(ec2):
+    #Every default security group of the region, one VPC each, in a single paginated call
+    groups = {}
+    for response in ec2.get_paginator('describe_security_groups').paginate(Filters=[{'Name': 'group-name', 'Values': ['default']}]):
+        for securityGroup in response['SecurityGroups']:
+            groups[securityGroup['GroupId']] = securityGroup
+    return groups
 
-        # find ingress + egress rules
-        defaultIngress = defaultSG.ip_permissions
-        defaultEgress = defaultSG.ip_permissions_egress
-        revokeIngress = defaultSG.revoke_ingress(IpPermissions=defaultIngress)
-        revokeEgress = defaultSG.revoke_egress(IpPermissions=defaultEgress)
+def _lock_down(ec2, securityGroup):
+    if securityGroup['IpPermissions']:
+        ec2.revoke_security_group_ingress(GroupId=securityGroup['GroupId'], IpPermissions=securityGroup['IpPermissions'])
+    if securityGroup['IpPermissionsEgress']:
+        ec2.revoke_security_group_egress(GroupId=securityGroup['GroupId'], IpPermissions=securityGroup['IpPermissionsEgress'])
+    logger.info(f"All rules removed from Default Security Group {securityGroup['GroupId']}")
 
-        logger.info(revokeIngress)
-        logger.info(revokeEgress)
+def remediate_batch(findings, session):
 
+    #All 4.3 findings of an account: one describe per region, then the groups that still have rules in parallel
+    regions = {}
+    for finding in findings:
+        region = finding.resourceRegion or session.region_name
+        groupId = finding.resource.name
+        regions.setdefault(region, {}).setdefault(groupId, []).append(finding)
+
+    outcomes = {}
+    for region, groupFindings in regions.items():
+        ec2 = client_registry.get_client('ec2', session, region)
         try:
-            response = securityhub.batch_update_findings(
-                FindingIdentifiers=[
-                    {
-                        'Id': findingId,
-                        'ProductArn': productArn
-                    },
-                ],
-                Note={
-                    'Text': 'All rules removed from Default Security Group on Security Group Id: ' + myDefaultSecGroupId + '.',
-                    'UpdatedBy': lambdaFunctionName
-                },
-                Workflow={
-                    'Status': 'RESOLVED'
-                },
-            )
-            logger.info(response)
-
-            #Send Notification
-            findingTitle=event["detail"]["findings"][0]["Title"]
-            message = f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {findingId}"
-            sns_notification.sendSNSNotification(os.environ['AlertSnsArn'], message)
+            groups = _default_groups(ec2)
         except Exception as e:
             print(e)
-            raise
-    except Exception as e:
-        print(e)
\ No newline at end of file
+            for regionFindings in groupFindings.values():
+                for finding in regionFindings:
+                    outcomes[finding.id] = e
+            continue
+
+        toLockDown = []
+        for groupId, regionFindings in groupFindings.items():
+            securityGroup = groups.get(groupId)
+            if securityGroup is None:
+                outcome = Exception(f'Default Security Group {groupId} not found in {region}')
+            elif not securityGroup['IpPermissions'] and not securityGroup['IpPermissionsEgress']:
+                outcome = COMPLIANT_NOTE
+            else:
+                toLockDown.append(securityGroup)
+                continue
+            for finding in regionFindings:
+                outcomes[finding.id] = outcome
+        logger.info(f'{len(toLockDown)} of {len(groupFindings)} Default Security Groups in {region} still have rules')
+
+        def lockDown(securityGroup):
+            try:
+                _lock_down(ec2, securityGroup)
+                return securityGroup['GroupId'], REVOKED_NOTE
+            except Exception as e:
+                print(e)
+                return securityGroup['GroupId'], e
+
+        with ThreadPoolExecutor(max_workers=max(1, min(BULK_WORKERS, len(toLockDown)))) as executor:
+            for groupId, outcome in executor.map(lockDown, toLockDown):
+                for finding in groupFindings[groupId]:
+                    outcomes[finding.id] = outcome
+    return outcomes
@@ -0,0 +1,77 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import logging
+import collections
+
+from common import deadline
+from common import finding_runner
+from cis import cis_playbook_registry
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CUSTOM_ACTION_DETAIL_TYPE = finding_runner.CUSTOM_ACTION_DETAIL_TYPE
+
+def route_findings(event):
+
+    #Returns {playbook name: [findings]} and the findings no playbook responds to
+    routes = collections.OrderedDict()
+    unrouted = []
+
+    if event.get('detail-type') == CUSTOM_ACTION_DETAIL_TYPE:
+        #Every finding selected for a custom action goes to the playbook behind that action
+        playbook = None
+        for resource in event.get('resources', []):
+            playbook = cis_playbook_registry.playbook_for_action(resource)
+            if playbook:
+                break
+        if playbook:
+            routes[playbook] = list(event['detail']['findings'])
+        else:
+            unrouted = list(event['detail']['findings'])
+        return routes, unrouted
+
+    #Automated events are routed with the patterns of the per playbook rules, so the dispatcher
+    #responds to exactly the findings those rules would have sent
+    return cis_playbook_registry.pattern_index().route(event)
+
+def lambda_handler(event, context):
+    deadline.start(context)
+
+    routes, unrouted = route_findings(event)
+    for finding in unrouted:
+        logger.info(f"No playbook responds to finding {finding.get('Id')}: {finding.get('Title')}")
+
+    results = []
+    failed = False
+    for playbook, findings in routes.items():
+        logger.info(f'Dispatching {len(findings)} findings to {playbook}')
+        module = cis_playbook_registry.load_playbook(playbook)
+        try:
+            response = finding_runner.run_findings({'detail-type': event.get('detail-type'), 'detail': {'findings': findings}}, module.remediate_finding, cis_playbook_registry.role_name(playbook), precheck=module.precheck, remediateBatch=getattr(module, 'remediate_batch', None))
+        except finding_runner.RemediationError as e:
+            response = {'results': e.results}
+            failed = True
+        results.extend(dict(result, playbook=playbook) for result in response['results'])
+
+    if failed:
+        raise finding_runner.RemediationError(results)
+    return {'results': results, 'unrouted': [finding.get('Id') for finding in unrouted]}
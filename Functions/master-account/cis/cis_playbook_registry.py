@@ -0,0 +1,177 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import logging
+import importlib
+
+from common import event_pattern
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#CIS AWS Foundations Benchmark v1.2.0 playbooks, keyed by module name in this package.
+#roleSuffix and actionId match the target account roles and Security Hub custom actions
+#created by response_cis-aws-benchmark.yaml and member-account-main.yaml.
+PLAYBOOKS = {
+    'cis_1-3_1-4_RR_lambda': {
+        'roleSuffix': 'CIS13-14RR',
+        'actionId': 'cis134RR',
+        'titles': [
+            '1.3 Ensure credentials unused for 90 days or greater are disabled',
+            '1.4 Ensure access keys are rotated every 90 days or less'
+        ]
+    },
+    'cis_1-5_1-11_RR_lambda': {
+        'roleSuffix': 'CIS1-5-11RR',
+        'actionId': 'cis1511RR',
+        'titles': [
+            '1.5 Ensure IAM password policy requires at least one uppercase letter',
+            '1.6 Ensure IAM password policy requires at least one lowercase letter',
+            '1.7 Ensure IAM password policy requires at least one symbol',
+            '1.8 Ensure IAM password policy requires at least one number',
+            '1.9 Ensure IAM password policy requires minimum password length of 14 or greater',
+            '1.10 Ensure IAM password policy prevents password reuse',
+            '1.11 Ensure IAM password policy expires passwords within 90 days or less'
+        ]
+    },
+    'cis_2-2_RR_lambda': {
+        'roleSuffix': 'CIS2-2RR',
+        'actionId': 'cis22RR',
+        'titles': ['2.2 Ensure CloudTrail log file validation is enabled']
+    },
+    'cis_2-3_RR_lambda': {
+        'roleSuffix': 'CIS2-3RR',
+        'actionId': 'cis23RR',
+        'titles': ['2.3 Ensure the S3 bucket used to store CloudTrail logs is not publicly accessible']
+    },
+    'cis_2-4_RR_lambda': {
+        'roleSuffix': 'CIS2-4RR',
+        'actionId': 'cis24RR',
+        'titles': ['2.4 Ensure CloudTrail trails are integrated with CloudWatch Logs']
+    },
+    'cis_2-6_RR_lambda': {
+        'roleSuffix': 'CIS2-6RR',
+        'actionId': 'cis26RR',
+        'titles': ['2.6 Ensure S3 bucket access logging is enabled on the CloudTrail S3 bucket']
+    },
+    'cis_2-7_RR_lambda': {
+        'roleSuffix': 'CIS2-7RR',
+        'actionId': 'cis27RR',
+        'titles': ['2.7 Ensure CloudTrail logs are encrypted at rest using KMS CMKs']
+    },
+    'cis_2-8_RR_lambda': {
+        'roleSuffix': 'CIS2-8RR',
+        'actionId': 'cis28RR',
+        'titles': ['2.8 Ensure rotation for customer created CMKs is enabled']
+    },
+    'cis_2-9_RR_lambda': {
+        'roleSuffix': 'CIS2-9RR',
+        'actionId': 'cis29RR',
+        'titles': ['2.9 Ensure VPC flow logging is enabled in all VPCs']
+    },
+    'cis_4-1_4-2_RR_lambda': {
+        'roleSuffix': 'CIS4-1-2RR',
+        'actionId': 'cis412RR',
+        'titles': [
+            '4.1 Ensure no security groups allow ingress from 0.0.0.0/0 to port 22',
+            '4.2 Ensure no security groups allow ingress from 0.0.0.0/0 to port 3389'
+        ]
+    },
+    'cis_4-3_RR_lambda': {
+        'roleSuffix': 'CIS4-3RR',
+        'actionId': 'cis43RR',
+        'titles': ['4.3 Ensure the default security group of every VPC restricts all traffic']
+    }
+}
+
+#Lookup tables so routing a finding is a single dictionary access
+_byTitle = {title: name for name, playbook in PLAYBOOKS.items() for title in playbook['titles']}
+_byActionId = {playbook['actionId']: name for name, playbook in PLAYBOOKS.items()}
+_modules = {}
+
+#The EventBridge rules of response_cis-aws-benchmark.yaml decide which findings a playbook responds to.
+#The template is not part of the Lambda bundle, so without it (or without PyYAML) the same patterns
+#are built from PLAYBOOKS.
+EVENT_PATTERN_TEMPLATE = os.environ.get('EVENT_PATTERN_TEMPLATE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'CloudFormation', 'master-account', 'response_cis-aws-benchmark.yaml'))
+SECURITY_HUB_SOURCE = 'aws.securityhub'
+IMPORTED_DETAIL_TYPE = 'Security Hub Findings - Imported'
+_patternIndex = None
+
+def playbook_for_title(title: str):
+    return _byTitle.get(title)
+
+def default_pattern(name: str):
+    return {
+        'source': [SECURITY_HUB_SOURCE],
+        'detail-type': [IMPORTED_DETAIL_TYPE],
+        'detail': {
+            'findings': {
+                'Title': list(PLAYBOOKS[name]['titles']),
+                'Compliance': {'Status': ['FAILED']},
+                'Workflow': {'Status': ['NEW']}
+            }
+        }
+    }
+
+def _template_index(path: str):
+    index = event_pattern.PatternIndex()
+    for ruleId, function, pattern in event_pattern.load_template_rules(path):
+        #Handler is cis/<module>.lambda_handler, custom action and dispatcher rules are skipped
+        handler = function.get('Properties', {}).get('Handler', '')
+        name = handler.rsplit('.', 1)[0].split('/')[-1]
+        if name in PLAYBOOKS and event_pattern.split_pattern(pattern or {})[1] is not None:
+            index.add(ruleId, name, pattern)
+    return index
+
+def pattern_index():
+    global _patternIndex
+    if _patternIndex is None:
+        index = None
+        if EVENT_PATTERN_TEMPLATE and os.path.isfile(EVENT_PATTERN_TEMPLATE):
+            try:
+                index = _template_index(EVENT_PATTERN_TEMPLATE)
+                logger.info(f'Loaded {len(index.rules)} event patterns from {EVENT_PATTERN_TEMPLATE}')
+            except ImportError:
+                logger.info('PyYAML is not installed, event patterns are built from the playbook registry')
+        if not index or not index.rules:
+            index = event_pattern.PatternIndex()
+            for name in PLAYBOOKS:
+                index.add(name, name, default_pattern(name))
+        _patternIndex = index
+    return _patternIndex
+
+def playbook_for_finding(finding, event=None):
+    #The playbook whose event pattern matches the finding (and the envelope of event, when given)
+    rule = pattern_index().match(finding, event)
+    return rule.target if rule else None
+
+def playbook_for_action(actionTargetArn: str):
+    #arn:aws:securityhub:<region>:<account>:action/custom/<actionId>
+    return _byActionId.get(actionTargetArn.split('/')[-1])
+
+def role_name(name: str):
+    return os.environ['LambdaResponseRoleNamePrefix'] + '_' + PLAYBOOKS[name]['roleSuffix']
+
+def load_playbook(name: str):
+    module = _modules.get(name)
+    if module is None:
+        module = _modules[name] = importlib.import_module('cis.' + name)
+    return module
@@ -0,0 +1,134 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import json
+import logging
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from common import deadline
+from common import finding_runner
+from cis import cis_playbook_registry
+from cis import cis_dispatcher_lambda
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Buffered deployment: the EventBridge rules send Security Hub events to an SQS queue and this function
+#receives them in batches. The findings of a batch are grouped by playbook, so each playbook runs once per
+#batch and assumes each target account once. Messages of failed findings are reported in batchItemFailures,
+#only those are received again and they end up in the dead letter queue once maxReceiveCount is reached.
+
+#Playbook runs of one batch executed at the same time, each with its own FINDING_MAX_WORKERS pool
+SQS_CONSUMER_MAX_WORKERS = int(os.environ.get('SQS_CONSUMER_MAX_WORKERS', '4'))
+
+class MessageGroup:
+
+    #The findings of one playbook and detail-type across the messages of a batch. A finding sent in
+    #several messages is remediated once and its result applies to all of them.
+    def __init__(self):
+        self.findings = collections.OrderedDict()
+        self.messageIds = {}
+        self.allMessageIds = set()
+
+    def add(self, messageId: str, finding):
+        findingId = finding.get('Id') if isinstance(finding, dict) else None
+        self.allMessageIds.add(messageId)
+        if findingId is None:
+            #Malformed findings fail in the runner, their message is failed with the whole group
+            findingId = f'{messageId}#{len(self.findings)}'
+        self.findings.setdefault(findingId, finding)
+        self.messageIds.setdefault(findingId, set()).add(messageId)
+
+def parse_messages(records):
+
+    #Returns [(messageId, event)] and the ids of messages that do not hold a Security Hub event
+    events = []
+    failed = []
+    for record in records:
+        try:
+            event = json.loads(record['body'])
+            if not isinstance(event['detail']['findings'], list):
+                raise ValueError('detail.findings is not a list')
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Message {record['messageId']} is not a Security Hub event: {e}")
+            failed.append(record['messageId'])
+            continue
+        events.append((record['messageId'], event))
+    return events, failed
+
+def group_messages(events):
+
+    #Returns {(playbook name, detail-type): MessageGroup}, routed like the dispatcher routes a single event
+    groups = collections.OrderedDict()
+    for messageId, event in events:
+        routes, unrouted = cis_dispatcher_lambda.route_findings(event)
+        for finding in unrouted:
+            logger.info(f"No playbook responds to finding {finding.get('Id')} of message {messageId}")
+        for playbook, findings in routes.items():
+            group = groups.setdefault((playbook, event.get('detail-type')), MessageGroup())
+            for finding in findings:
+                group.add(messageId, finding)
+    return groups
+
+def _run_group(playbook: str, detailType: str, group: MessageGroup):
+    module = cis_playbook_registry.load_playbook(playbook)
+    findings = list(group.findings.values())
+    try:
+        response = finding_runner.run_findings({'detail-type': detailType, 'detail': {'findings': findings}}, module.remediate_finding, cis_playbook_registry.role_name(playbook), precheck=module.precheck, remediateBatch=getattr(module, 'remediate_batch', None))
+    except finding_runner.RemediationError as e:
+        response = {'results': e.results}
+    except Exception as e:
+        logger.error(f'Buffered run of {playbook} failed: {e}')
+        response = {'results': [finding_runner.raw_result(finding, 'FAILED', e) for finding in findings]}
+    return [dict(result, playbook=playbook) for result in response['results']]
+
+def failed_messages(group: MessageGroup, results):
+    #Messages holding a failed finding. Results that map to no finding of the group fail every message of it.
+    failed = set()
+    for result in results:
+        if result['status'] != 'FAILED':
+            continue
+        messageIds = group.messageIds.get(result['findingId'])
+        if messageIds is None:
+            return set(group.allMessageIds)
+        failed.update(messageIds)
+    return failed
+
+def lambda_handler(event, context):
+    deadline.start(context)
+
+    records = event.get('Records', [])
+    events, failed = parse_messages(records)
+    groups = group_messages(events)
+    logger.info(f'Received {len(records)} messages, {sum(len(group.findings) for group in groups.values())} findings in {len(groups)} playbook groups')
+
+    failedIds = set(failed)
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(SQS_CONSUMER_MAX_WORKERS, len(groups)))) as executor:
+        for key, groupResults in zip(groups, executor.map(lambda key: _run_group(key[0], key[1], groups[key]), groups)):
+            failedIds.update(failed_messages(groups[key], groupResults))
+            results.extend(groupResults)
+
+    logger.info(f"Results: {dict(collections.Counter(result['status'] for result in results))}, {len(failedIds)} of {len(records)} messages failed")
+    #Reported in the order of the batch, SQS deletes every other message
+    return {'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in records if record['messageId'] in failedIds]}
@@ -0,0 +1,141 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import time
+import logging
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from common import deadline
+from common import client_registry
+from common import finding_runner
+from common import finding_record
+from cis import cis_playbook_registry
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Playbook runs (one per playbook and region) executed at the same time, each with its own FINDING_MAX_WORKERS pool
+SWEEP_MAX_WORKERS = int(os.environ.get('SWEEP_MAX_WORKERS', '4'))
+#Findings collected by one invocation, the rest are left NEW for the next sweep
+SWEEP_MAX_FINDINGS = int(os.environ.get('SWEEP_MAX_FINDINGS', '1000'))
+#GetFindings accepts at most 100 results per page and 20 values per filter
+PAGE_SIZE = 100
+MAX_FILTER_VALUES = 20
+
+def _filters(titles, pending: bool = False):
+    filters = {
+        'Title': [{'Value': title, 'Comparison': 'EQUALS'} for title in titles],
+        'ComplianceStatus': [{'Value': 'FAILED', 'Comparison': 'EQUALS'}],
+        'WorkflowStatus': [{'Value': 'NEW', 'Comparison': 'EQUALS'}],
+        'RecordState': [{'Value': 'ACTIVE', 'Comparison': 'EQUALS'}]
+    }
+    #Findings a playbook left NOTIFIED while its remediation was still running
+    if pending:
+        filters['WorkflowStatus'] = [{'Value': finding_runner.PENDING_WORKFLOW_STATUS, 'Comparison': 'EQUALS'}]
+        filters['NoteText'] = [{'Value': finding_runner.PENDING_NOTE_PREFIX, 'Comparison': 'PREFIX'}]
+    return filters
+
+def open_findings(maxFindings: int = None, pendingOnly: bool = False):
+
+    #Yields the active, failed and not yet handled findings of every control a playbook responds to,
+    #then those whose remediation was still running when they were last handled. pendingOnly yields the latter only.
+    maxFindings = maxFindings or SWEEP_MAX_FINDINGS
+    securityhub = client_registry.get_client('securityhub')
+    titles = sorted(title for playbook in cis_playbook_registry.PLAYBOOKS.values() for title in playbook['titles'])
+    paginator = securityhub.get_paginator('get_findings')
+    found = 0
+    for pending in ((True,) if pendingOnly else (False, True)):
+        for start in range(0, len(titles), MAX_FILTER_VALUES):
+            pages = paginator.paginate(Filters=_filters(titles[start:start + MAX_FILTER_VALUES], pending), PaginationConfig={'PageSize': PAGE_SIZE})
+            for page in pages:
+                for finding in page['Findings']:
+                    yield finding
+                    found += 1
+                    if found >= maxFindings:
+                        logger.info(f'Reached {maxFindings} findings, the remaining findings are left for the next sweep')
+                        return
+
+def finding_region(finding):
+    #Region is part of newer findings, the product ARN carries it for all of them
+    return finding.get('Region') or finding_record.parse_arn(finding['ProductArn']).region
+
+def group_findings(findings):
+
+    #Returns {(playbook name, region): [findings]}, findings of the same account stay together
+    groups = collections.OrderedDict()
+    for finding in findings:
+        routed = finding
+        if finding.get('Workflow', {}).get('Status') == finding_runner.PENDING_WORKFLOW_STATUS:
+            #Findings whose remediation was still running are routed like the NEW finding they were
+            routed = dict(finding, Workflow=dict(finding['Workflow'], Status='NEW'))
+        playbook = cis_playbook_registry.playbook_for_finding(routed)
+        if playbook:
+            groups.setdefault((playbook, finding_region(finding)), []).append(finding)
+    return groups
+
+def _run_group(playbook: str, region: str, findings):
+    module = cis_playbook_registry.load_playbook(playbook)
+    try:
+        response = finding_runner.run_findings({'detail': {'findings': findings}}, module.remediate_finding, cis_playbook_registry.role_name(playbook), region, precheck=module.precheck, remediateBatch=getattr(module, 'remediate_batch', None))
+    except finding_runner.RemediationError as e:
+        response = {'results': e.results}
+    except Exception as e:
+        logger.error(f'Sweep of {playbook} in {region} failed: {e}')
+        response = {'results': [finding_runner.raw_result(finding, 'FAILED', e) for finding in findings]}
+    return [dict(result, playbook=playbook, region=region) for result in response['results']]
+
+def sweep(maxFindings: int = None, pendingOnly: bool = False):
+    start = time.time()
+    groups = group_findings(open_findings(maxFindings, pendingOnly))
+    findings = sum(len(group) for group in groups.values())
+    logger.info(f'Sweeping {findings} findings in {len(groups)} playbook and region groups')
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(SWEEP_MAX_WORKERS, len(groups)))) as executor:
+        for groupResults in executor.map(lambda group: _run_group(group[0], group[1], groups[group]), groups):
+            results.extend(groupResults)
+
+    elapsed = time.time() - start
+    statuses = collections.Counter(result['status'] for result in results)
+    byPlaybook = collections.OrderedDict()
+    for result in results:
+        byPlaybook.setdefault(result['playbook'], collections.Counter())[result['status']] += 1
+
+    report = {
+        'findings': findings,
+        'elapsedSeconds': round(elapsed, 2),
+        'findingsPerSecond': round(findings / elapsed, 2) if elapsed else 0,
+        'statuses': dict(statuses),
+        'playbooks': {playbook: dict(counts) for playbook, counts in byPlaybook.items()},
+        'failed': [result for result in results if result['status'] == 'FAILED']
+    }
+    logger.info(report)
+    return report
+
+def lambda_handler(event, context):
+    deadline.start(context)
+    #Failed findings stay NEW and are picked up again by the next sweep, so the report is returned instead of raised
+    #The pending schedule of the stack passes pendingOnly, so findings left NOTIFIED are checked again
+    #even when a NEW backlog would use up maxFindings
+    event = event or {}
+    return sweep(event.get('maxFindings'), bool(event.get('pendingOnly')))
@@ -18,25 +18,125 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
  
-import json
-import boto3
 import os
+import time
 import logging
+import threading
+
+from common import metrics
+from common import client_registry
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def get_session(targetAccount: str, roleName: str):
+#Cached sessions are refreshed this many seconds before their credentials expire
+REFRESH_WINDOW_SECONDS = int(os.environ.get('SESSION_REFRESH_WINDOW_SECONDS', '300'))
+#With background refresh enabled, a session inside the refresh window is still handed out
+#while new credentials are fetched on a separate thread, as long as it has this many seconds left
+MIN_REMAINING_SECONDS = int(os.environ.get('SESSION_MIN_REMAINING_SECONDS', '60'))
+BACKGROUND_REFRESH = os.environ.get('SESSION_BACKGROUND_REFRESH', 'false').lower() == 'true'
+
+class _CachedSession:
+    __slots__ = ('session', 'expiration')
+
+    def __init__(self, session, expiration: float):
+        self.session = session
+        self.expiration = expiration
+
+#Cache lives at module level so it survives warm invocations of the same container
+_sessionCache = {}
+_keyLocks = {}
+_backgroundRefreshes = set()
+_cacheLock = threading.Lock()
+_cacheStats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'backgroundRefreshes': 0}
+
+def _count(stat: str):
+    with _cacheLock:
+        _cacheStats[stat] += 1
+    metrics.count('SessionCache' + stat[0].upper() + stat[1:])
+
+def _key_lock(cacheKey):
+    with _cacheLock:
+        lock = _keyLocks.get(cacheKey)
+        if lock is None:
+            lock = _keyLocks[cacheKey] = threading.Lock()
+        return lock
+
+def _assume_role(targetAccount: str, roleName: str, region):
+
+    import boto3
 
     roleArn="arn:aws:iam::" + targetAccount + ":role/" + roleName
-    sts = boto3.client('sts')
-    response = sts.assume_role(RoleArn=roleArn, RoleSessionName="IR_lambda")
-     
+    sts = client_registry.get_client('sts')
+    with metrics.timer('AssumeRole', Account=targetAccount):
+        response = sts.assume_role(RoleArn=roleArn, RoleSessionName="IR_lambda")
+
     session = boto3.Session(
                  aws_access_key_id=response['Credentials']['AccessKeyId'],
                  aws_secret_access_key=response['Credentials']['SecretAccessKey'],
-     	         aws_session_token=response['Credentials']['SessionToken'])
-    
-    logger.info(f'Assumed role arn {roleArn}') 
+                 aws_session_token=response['Credentials']['SessionToken'],
+                 region_name=region)
+    #Lets the client registry key per account state, such as rate limits, on the member account
+    session.accountId = targetAccount
+
+    logger.info(f'Assumed role arn {roleArn}')
+
+    return _CachedSession(session, response['Credentials']['Expiration'].timestamp())
+
+def _refresh(cacheKey, background: bool = False):
+    try:
+        entry = _assume_role(*cacheKey)
+        with _cacheLock:
+            _sessionCache[cacheKey] = entry
+        return entry
+    except Exception as e:
+        if not background:
+            raise
+        #The cached session is still valid, the next call will retry synchronously if needed
+        logger.warning(f'Background credential refresh failed for {cacheKey}: {e}')
+    finally:
+        if background:
+            with _cacheLock:
+                _backgroundRefreshes.discard(cacheKey)
+
+def _start_background_refresh(cacheKey):
+    with _cacheLock:
+        if cacheKey in _backgroundRefreshes:
+            return
+        _backgroundRefreshes.add(cacheKey)
+        _cacheStats['backgroundRefreshes'] += 1
+    threading.Thread(target=_refresh, args=(cacheKey, True), daemon=True).start()
+
+def get_session(targetAccount: str, roleName: str, region: str = None):
+
+    cacheKey = (targetAccount, roleName, region)
+    entry = _sessionCache.get(cacheKey)
+    now = time.time()
+
+    if entry is not None:
+        if now < entry.expiration - REFRESH_WINDOW_SECONDS:
+            _count('hits')
+            return entry.session
+        if BACKGROUND_REFRESH and now < entry.expiration - MIN_REMAINING_SECONDS:
+            _count('hits')
+            _start_background_refresh(cacheKey)
+            return entry.session
+
+    #Only one thread per key pays for the AssumeRole call, the rest wait and reuse its result
+    with _key_lock(cacheKey):
+        entry = _sessionCache.get(cacheKey)
+        if entry is not None and time.time() < entry.expiration - REFRESH_WINDOW_SECONDS:
+            _count('hits')
+            return entry.session
+        _count('misses' if entry is None else 'refreshes')
+        return _refresh(cacheKey).session
+
+def get_cache_stats():
+    with _cacheLock:
+        return dict(_cacheStats, cachedSessions=len(_sessionCache))
 
-    return session 
\ No newline at end of file
+def clear_cache():
+    with _cacheLock:
+        _sessionCache.clear()
+        for stat in _cacheStats:
+            _cacheStats[stat] = 0
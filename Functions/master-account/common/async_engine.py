@@ -0,0 +1,124 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import asyncio
+import logging
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics
+from common import finding_runner
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#boto3 is blocking, so every call still runs on a thread. The event loop only schedules them:
+#sessions, remediations, Security Hub updates and notifications of different findings overlap,
+#and each service gets its own concurrency limit instead of one pool size for everything.
+SERVICE_LIMITS = {
+    'sts': int(os.environ.get('ASYNC_STS_CONCURRENCY', '4')),
+    'remediation': int(os.environ.get('ASYNC_REMEDIATION_CONCURRENCY', '16')),
+    'securityhub': int(os.environ.get('ASYNC_SECURITYHUB_CONCURRENCY', '2')),
+    'sns': int(os.environ.get('ASYNC_SNS_CONCURRENCY', '4'))
+}
+#Resolved findings are sent to Security Hub in chunks of this size while the rest are still being remediated
+RESOLVE_CHUNK_SIZE = int(os.environ.get('ASYNC_RESOLVE_CHUNK_SIZE', '25'))
+
+class AsyncEngine:
+
+    def __init__(self, roleName: str, remediateFinding, serviceLimits=None, region: str = None, precheck=None, remediateBatch=None):
+        self.roleName = roleName
+        self.region = region
+        self.precheck = precheck
+        self.remediateBatch = remediateBatch
+        self.remediateFinding = remediateFinding
+        self.serviceLimits = dict(SERVICE_LIMITS, **(serviceLimits or {}))
+        self.results = collections.OrderedDict()
+        self._resolved = []
+        self._resolveTasks = []
+
+    async def _call(self, service: str, function, *args):
+        async with self._semaphores[service]:
+            return await self._loop.run_in_executor(self._executor, metrics.bind(function), *args)
+
+    async def _session(self, accountId: str):
+        return await self._call('sts', finding_runner._get_session, accountId, self.roleName, self.region)
+
+    async def _resolve(self, resolved):
+        updated = await self._call('securityhub', finding_runner.update_findings, resolved, self.results)
+        if updated:
+            await self._call('sns', finding_runner.notify_findings, updated, self.results)
+
+    def _queue_resolve(self, force=False):
+        if self._resolved and (force or len(self._resolved) >= RESOLVE_CHUNK_SIZE):
+            resolved, self._resolved = self._resolved, []
+            self._resolveTasks.append(self._loop.create_task(self._resolve(resolved)))
+
+    def _record(self, outcomes):
+        for finding, noteText, error in outcomes:
+            finding_runner.record_outcome(finding, noteText, error, self.results, self._resolved)
+        self._queue_resolve()
+
+    async def _remediate(self, finding, session):
+        self._record(await self._call('remediation', finding_runner.remediate_one, finding, session, self.remediateFinding, self.precheck))
+
+    async def _remediate_account(self, accountFindings, sessionTask):
+        session, error = await sessionTask
+        if session is None:
+            for finding in accountFindings:
+                self.results[finding.id] = finding_runner._result(finding, 'FAILED', error)
+        elif finding_runner.use_batch(accountFindings, self.remediateBatch):
+            self._record(await self._call('remediation', finding_runner.remediate_account, accountFindings, session, self.remediateBatch))
+        else:
+            await asyncio.gather(*[self._remediate(finding, session) for finding in accountFindings])
+
+    async def run(self, findings):
+        self._loop = asyncio.get_event_loop()
+        #Semaphores belong to the loop they are created on
+        self._semaphores = {service: asyncio.Semaphore(max(1, limit)) for service, limit in self.serviceLimits.items()}
+        if not findings:
+            return self.results
+        workers = max(1, min(sum(self.serviceLimits.values()), len(findings)))
+        with ThreadPoolExecutor(max_workers=workers) as self._executor:
+            accounts = finding_runner.group_by_account(findings)
+            logger.info(f'Received {len(findings)} findings across {len(accounts)} accounts')
+
+            #Each account is assumed once, its findings start as soon as their own session is ready
+            sessions = {accountId: self._loop.create_task(self._session(accountId)) for accountId in accounts}
+            #Reserve each finding's place so results keep the order of the event
+            for finding in findings:
+                self.results.setdefault(finding.id, None)
+            await asyncio.gather(*[self._remediate_account(accountFindings, sessions[accountId]) for accountId, accountFindings in accounts.items()])
+
+            self._queue_resolve(force=True)
+            await asyncio.gather(*self._resolveTasks)
+        return self.results
+
+def run_findings(event, remediateFinding, roleName: str, serviceLimits=None, region: str = None, precheck=None, remediateBatch=None):
+    engine = AsyncEngine(roleName, remediateFinding, serviceLimits, region, precheck, remediateBatch)
+    findings, claims = finding_runner.claim_findings(event, remediateFinding, engine.results)
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(engine.run(findings))
+    finally:
+        loop.close()
+    return finding_runner.finish(results, claims)
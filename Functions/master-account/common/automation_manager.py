@@ -0,0 +1,173 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+
+import os
+import re
+import logging
+import collections
+
+from common import metrics
+from common import deadline
+from common import readiness
+from common import finding_runner
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#How long an invocation waits for its automations before leaving the findings NOTIFIED for the next sweep.
+#The wait never runs past the deadline of the invocation, see common/deadline.py.
+WAIT_SECONDS = float(os.environ.get('AUTOMATION_WAIT_SECONDS', '30'))
+#Rate control of executions started for several resources at once
+MAX_CONCURRENCY = os.environ.get('AUTOMATION_MAX_CONCURRENCY', '10')
+MAX_ERRORS = os.environ.get('AUTOMATION_MAX_ERRORS', '100%')
+#Targets accept at most 50 values per execution
+MAX_TARGET_VALUES = 50
+
+#Statuses of an execution that has not completed yet, everything else is final
+RUNNING_STATUSES = {'Pending', 'InProgress', 'Waiting', 'Cancelling', 'PendingApproval', 'Approved', 'Scheduled', 'RunbookInProgress', 'PendingChangeCalendarOverride', 'ChangeCalendarOverrideApproved'}
+SUCCESS_STATUSES = {'Success', 'CompletedWithSuccess'}
+
+#Pending notes carry the execution id so the next invocation resumes it instead of starting another one
+EXECUTION_ID_PATTERN = re.compile(r'SSM automation ([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+
+Outcome = collections.namedtuple('Outcome', ['executionId', 'status', 'failureMessage'])
+
+class AutomationFailed(Exception):
+    pass
+
+def previous_execution(finding):
+    #Id of the execution an earlier invocation left running for this finding, if any
+    match = EXECUTION_ID_PATTERN.search(finding.noteText or '')
+    return match.group(1) if match else None
+
+def _start(ssm, documentName: str, targetParameterName: str, values, parameters):
+    #One value runs as a plain execution, several as one rate controlled execution per 50 values
+    if len(values) == 1:
+        response = ssm.start_automation_execution(
+            DocumentName=documentName,
+            DocumentVersion='1',
+            Parameters=dict(parameters, **{targetParameterName: [ values[0] ]})
+        )
+        logger.info(response)
+        return {values[0]: response['AutomationExecutionId']}, set()
+
+    executions = {}
+    parents = set()
+    for start in range(0, len(values), MAX_TARGET_VALUES):
+        chunk = values[start:start + MAX_TARGET_VALUES]
+        response = ssm.start_automation_execution(
+            DocumentName=documentName,
+            DocumentVersion='1',
+            Parameters=parameters,
+            TargetParameterName=targetParameterName,
+            Targets=[{'Key': 'ParameterValues', 'Values': chunk}],
+            MaxConcurrency=MAX_CONCURRENCY,
+            MaxErrors=MAX_ERRORS
+        )
+        logger.info(response)
+        parents.add(response['AutomationExecutionId'])
+        executions.update((value, response['AutomationExecutionId']) for value in chunk)
+    return executions, parents
+
+def _child_outcomes(ssm, parentId: str):
+    #{target value: Outcome} of the executions a rate controlled execution started so far
+    outcomes = {}
+    kwargs = {'Filters': [{'Key': 'ParentExecutionId', 'Values': [ parentId ]}]}
+    while True:
+        response = ssm.describe_automation_executions(**kwargs)
+        for child in response['AutomationExecutionMetadataList']:
+            outcomes[child.get('Target')] = Outcome(child['AutomationExecutionId'], child['AutomationExecutionStatus'], child.get('FailureMessage'))
+        if not response.get('NextToken'):
+            return outcomes
+        kwargs['NextToken'] = response['NextToken']
+
+def run(ssm, documentName: str, targetParameterName: str, values, parameters=None, previous=None, timeout: float = None):
+
+    #Runs the automation for each value of targetParameterName and returns {value: Outcome} once every
+    #execution completed or timeout passed. previous maps values to executions of an earlier invocation,
+    #those still running or successful are tracked again instead of started twice.
+    values = list(collections.OrderedDict.fromkeys(values))
+    parameters = parameters or {}
+    executions = {}
+    executionStatus = {}
+
+    for value, executionId in (previous or {}).items():
+        if value not in values or not executionId:
+            continue
+        try:
+            execution = ssm.get_automation_execution(AutomationExecutionId=executionId)['AutomationExecution']
+        except ssm.exceptions.AutomationExecutionNotFoundException:
+            continue
+        if execution['AutomationExecutionStatus'] in RUNNING_STATUSES | SUCCESS_STATUSES:
+            logger.info(f'Resuming {documentName} automation {executionId} for {value}')
+            executions[value] = executionId
+            executionStatus[executionId] = execution
+
+    parents = set()
+    remaining = [value for value in values if value not in executions]
+    if remaining:
+        started, parents = _start(ssm, documentName, targetParameterName, remaining, parameters)
+        executions.update(started)
+
+    def settled():
+        for executionId in set(executions.values()):
+            known = executionStatus.get(executionId)
+            if known is None or known['AutomationExecutionStatus'] in RUNNING_STATUSES:
+                executionStatus[executionId] = ssm.get_automation_execution(AutomationExecutionId=executionId)['AutomationExecution']
+        return all(execution['AutomationExecutionStatus'] not in RUNNING_STATUSES for execution in executionStatus.values())
+
+    #Findings of an invocation run in waves of FINDING_MAX_WORKERS, their waits share the invocation's deadline
+    #so the last wave leaves its findings pending instead of being stopped by the timeout
+    waitSeconds = min(timeout or WAIT_SECONDS, deadline.remaining())
+    try:
+        with metrics.timer('AutomationWait'):
+            if waitSeconds > 0:
+                readiness.wait_until(settled, f'{len(set(executions.values()))} {documentName} automations completed', timeout=waitSeconds)
+            elif not settled():
+                logger.info(f'No time left to wait for {len(set(executions.values()))} {documentName} automations')
+    except readiness.NotReadyError as e:
+        logger.info(e)
+
+    outcomes = {}
+    children = {}
+    for value, executionId in executions.items():
+        execution = executionStatus[executionId]
+        status = execution['AutomationExecutionStatus']
+        if executionId in parents or execution.get('TargetParameterName'):
+            if executionId not in children:
+                children[executionId] = _child_outcomes(ssm, executionId)
+            #Without an execution for the value yet the parent status is all there is to go on
+            if value in children[executionId]:
+                outcomes[value] = children[executionId][value]
+                continue
+        outcomes[value] = Outcome(executionId, status, execution.get('FailureMessage'))
+    return outcomes
+
+def resolve(outcome, documentName: str, target: str, noteText: str):
+
+    #Returns noteText once the automation succeeded. A running automation leaves the finding NOTIFIED,
+    #a failed one fails the finding.
+    if outcome.status in SUCCESS_STATUSES:
+        return noteText
+    if outcome.status in RUNNING_STATUSES:
+        raise finding_runner.RemediationPending(f'SSM automation {outcome.executionId} of {documentName} is still running for {target}. The finding is resolved once it succeeded.')
+    message = f'SSM automation {outcome.executionId} of {documentName} for {target} ended with status {outcome.status}'
+    raise AutomationFailed(f'{message}: {outcome.failureMessage}' if outcome.failureMessage else message)
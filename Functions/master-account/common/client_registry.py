@@ -0,0 +1,136 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import logging
+import threading
+import collections
+
+from common import metrics
+from common import rate_limiter
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Resolve STS to the regional endpoint of the Lambda instead of the global sts.amazonaws.com
+os.environ.setdefault('AWS_STS_REGIONAL_ENDPOINTS', 'regional')
+
+MAX_CACHED_CLIENTS = int(os.environ.get('CLIENT_REGISTRY_MAX_ENTRIES', '256'))
+
+_clientConfig = None
+_defaultSession = None
+_clients = collections.OrderedDict()
+_resources = threading.local()
+_registryLock = threading.Lock()
+
+def client_config():
+
+    #boto3 and botocore are imported on first use so importing a playbook stays cheap
+    global _clientConfig
+    if _clientConfig is None:
+        from botocore.config import Config
+        configOptions = {
+            'max_pool_connections': int(os.environ.get('CLIENT_MAX_POOL_CONNECTIONS', '25')),
+            'connect_timeout': int(os.environ.get('CLIENT_CONNECT_TIMEOUT', '5')),
+            'read_timeout': int(os.environ.get('CLIENT_READ_TIMEOUT', '30')),
+            'retries': {'mode': os.environ.get('CLIENT_RETRY_MODE', 'standard'), 'max_attempts': int(os.environ.get('CLIENT_MAX_ATTEMPTS', '5'))},
+            'tcp_keepalive': True
+        }
+        try:
+            _clientConfig = Config(**configOptions)
+        except TypeError:
+            #tcp_keepalive is not available on older botocore releases bundled with some runtimes
+            configOptions.pop('tcp_keepalive')
+            _clientConfig = Config(**configOptions)
+    return _clientConfig
+
+def _get_default_session():
+    global _defaultSession
+    if _defaultSession is None:
+        import boto3
+        _defaultSession = boto3.Session()
+    return _defaultSession
+
+def _registry_key(serviceName: str, session, region):
+    if session is None:
+        #Lambda execution role credentials
+        identity = 'default'
+    else:
+        identity = session.get_credentials().access_key
+    return (identity, serviceName, region or (session or _get_default_session()).region_name)
+
+def _account_label(session):
+    #Member account sessions carry the account they were assumed in, see account_session
+    return 'default' if session is None else getattr(session, 'accountId', 'unknown')
+
+def get_client(serviceName: str, session=None, region: str = None):
+
+    key = _registry_key(serviceName, session, region)
+    client = _clients.get(key)
+    if client is not None:
+        try:
+            _clients.move_to_end(key)
+        except KeyError:
+            #Evicted by another thread in the meantime, the client can still be used
+            pass
+        metrics.count('ClientCacheHits')
+        return client
+
+    #boto3 sessions are not thread safe, so clients are only ever built under the lock
+    with _registryLock:
+        client = _clients.get(key)
+        if client is None:
+            client = (session or _get_default_session()).client(serviceName, region_name=key[2], config=client_config())
+            rate_limiter.attach(client, _account_label(session))
+            metrics.attach(client, _account_label(session))
+            _clients[key] = client
+            if len(_clients) > MAX_CACHED_CLIENTS:
+                _clients.popitem(last=False)
+            metrics.count('ClientCacheMisses')
+            logger.info(f'Created {serviceName} client for region {key[2]}')
+        else:
+            _clients.move_to_end(key)
+            metrics.count('ClientCacheHits')
+    return client
+
+def get_resource(serviceName: str, session=None, region: str = None):
+
+    #Resources are not thread safe, so each thread keeps its own copy
+    cache = getattr(_resources, 'cache', None)
+    if cache is None:
+        cache = _resources.cache = collections.OrderedDict()
+
+    key = _registry_key(serviceName, session, region)
+    resource = cache.get(key)
+    if resource is not None:
+        cache.move_to_end(key)
+    else:
+        with _registryLock:
+            resource = (session or _get_default_session()).resource(serviceName, region_name=key[2], config=client_config())
+            rate_limiter.attach(resource.meta.client, _account_label(session))
+            metrics.attach(resource.meta.client, _account_label(session))
+        cache[key] = resource
+        if len(cache) > MAX_CACHED_CLIENTS:
+            cache.popitem(last=False)
+    return resource
+
+def clear():
+    with _registryLock:
+        _clients.clear()
+    _resources.cache = collections.OrderedDict()
@@ -0,0 +1,50 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import time
+
+#Lambda stops an invocation at its timeout without running any cleanup, so work that could outlast the
+#invocation is bounded by its deadline. The deadline is shared by every thread of the invocation.
+#Outside of Lambda there is no context and the invocation is assumed to run for DEFAULT_TIMEOUT_SECONDS.
+DEFAULT_TIMEOUT_SECONDS = float(os.environ.get('INVOCATION_TIMEOUT_SECONDS', '60'))
+#Time kept back for updating Security Hub and notifying once the remediations returned
+SAFETY_MARGIN_SECONDS = float(os.environ.get('INVOCATION_SAFETY_MARGIN_SECONDS', '10'))
+
+_timeoutAt = None
+
+def start(context=None):
+    #Called at the start of every lambda_handler
+    global _timeoutAt
+    if context is not None:
+        timeoutSeconds = context.get_remaining_time_in_millis() / 1000
+    else:
+        timeoutSeconds = DEFAULT_TIMEOUT_SECONDS
+    _timeoutAt = time.monotonic() + timeoutSeconds
+
+def until_timeout():
+    #Seconds until Lambda stops the invocation
+    if _timeoutAt is None:
+        return DEFAULT_TIMEOUT_SECONDS
+    return max(0.0, _timeoutAt - time.monotonic())
+
+def remaining():
+    #Seconds a remediation may still spend, e.g. waiting for an SSM automation
+    return max(0.0, until_timeout() - SAFETY_MARGIN_SECONDS)
@@ -0,0 +1,155 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import math
+import time
+import logging
+import threading
+import collections
+
+from common import deadline
+from common import client_registry
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Security Hub sends the same finding again on every evaluation. A finding is only remediated once per
+#playbook and UpdatedAt: it is claimed before any work starts, and the claim is released again if it failed.
+#A claim only outlives the invocation that made it once the finding was resolved, so a retry of an invocation
+#that timed out or crashed can claim its findings again.
+#memory: per container LRU, dynamodb: table shared by every container and function, none: disabled
+BACKEND = os.environ.get('DEDUP_BACKEND', 'memory').lower()
+TABLE_NAME = os.environ.get('DEDUP_TABLE_NAME', '')
+TTL_SECONDS = int(os.environ.get('DEDUP_TTL_SECONDS', '3600'))
+MAX_ENTRIES = int(os.environ.get('DEDUP_MAX_ENTRIES', '10000'))
+
+BATCH_WRITE_SIZE = 25
+BATCH_WRITE_ATTEMPTS = 3
+
+def dedup_key(finding, playbook: str):
+    return f"{playbook}#{finding.id}#{finding.updatedAt or ''}"
+
+def in_progress_seconds():
+    #A claim made while the invocation is still running expires when Lambda would stop it
+    return int(math.ceil(deadline.until_timeout())) + 1
+
+class MemoryDedupStore:
+
+    def __init__(self, maxEntries: int = None, ttlSeconds: int = None):
+        self.maxEntries = maxEntries or MAX_ENTRIES
+        self.ttlSeconds = ttlSeconds or TTL_SECONDS
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key: str):
+        #Returns False when the key is already claimed and has not expired
+        now = time.time()
+        with self._lock:
+            expiresAt = self._entries.get(key)
+            if expiresAt is not None and expiresAt > now:
+                self._entries.move_to_end(key)
+                return False
+            self._entries[key] = now + in_progress_seconds()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+            return True
+
+    def complete(self, keys):
+        #Keeps the claims of resolved findings for the full TTL
+        expiresAt = time.time() + self.ttlSeconds
+        with self._lock:
+            for key in keys:
+                self._entries[key] = expiresAt
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+    def release(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class DynamoDBDedupStore:
+
+    #Table with a string partition key 'DedupKey' and TTL enabled on 'ExpiresAt'
+    def __init__(self, tableName: str = None, ttlSeconds: int = None, dynamodb=None):
+        self.tableName = tableName or TABLE_NAME
+        self.ttlSeconds = ttlSeconds or TTL_SECONDS
+        self.dynamodb = dynamodb or client_registry.get_client('dynamodb')
+
+    def claim(self, key: str):
+        now = int(time.time())
+        try:
+            #DynamoDB deletes expired items lazily, so an expired claim can still be present
+            self.dynamodb.put_item(
+                TableName=self.tableName,
+                Item={'DedupKey': {'S': key}, 'ExpiresAt': {'N': str(now + in_progress_seconds())}},
+                ConditionExpression='attribute_not_exists(DedupKey) OR ExpiresAt < :now',
+                ExpressionAttributeValues={':now': {'N': str(now)}}
+            )
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            #Remediating twice is safer than not remediating at all
+            logger.warning(f'Dedup table unavailable, processing {key} anyway: {e}')
+            return True
+
+    def complete(self, keys):
+        #Keeps the claims of resolved findings for the full TTL, 25 items per BatchWriteItem call
+        expiresAt = str(int(time.time()) + self.ttlSeconds)
+        requests = [{'PutRequest': {'Item': {'DedupKey': {'S': key}, 'ExpiresAt': {'N': expiresAt}}}} for key in keys]
+        for offset in range(0, len(requests), BATCH_WRITE_SIZE):
+            pending = requests[offset:offset + BATCH_WRITE_SIZE]
+            try:
+                for attempt in range(BATCH_WRITE_ATTEMPTS):
+                    if attempt:
+                        time.sleep(0.05 * 2 ** attempt)
+                    pending = self.dynamodb.batch_write_item(RequestItems={self.tableName: pending}).get('UnprocessedItems', {}).get(self.tableName, [])
+                    if not pending:
+                        break
+                if pending:
+                    logger.warning(f'Extending {len(pending)} dedup claims failed, they expire with the invocation')
+            except Exception as e:
+                #The findings are resolved, so a repeated event only finds them compliant in the precheck
+                logger.warning(f'Extending {len(pending)} dedup claims failed, they expire with the invocation: {e}')
+
+    def release(self, key: str):
+        try:
+            self.dynamodb.delete_item(TableName=self.tableName, Key={'DedupKey': {'S': key}})
+        except Exception as e:
+            logger.warning(f'Releasing dedup claim {key} failed, it expires with the invocation: {e}')
+
+_store = None
+_storeLock = threading.Lock()
+
+def get_store():
+    #Returns None when deduplication is disabled
+    global _store
+    if _store is None and BACKEND != 'none':
+        with _storeLock:
+            if _store is None:
+                _store = DynamoDBDedupStore() if BACKEND == 'dynamodb' else MemoryDedupStore()
+    return _store
+
+def set_store(store):
+    global _store
+    _store = store
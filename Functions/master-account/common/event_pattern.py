@@ -0,0 +1,210 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import logging
+import numbers
+import collections
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#In-process evaluation of EventBridge event patterns, so findings can be filtered and routed
+#without a round trip to EventBridge. Supports the matching rules EventBridge documents for
+#value lists, arrays, prefix, suffix, anything-but, exists, equals-ignore-case and numeric.
+FINDINGS_PATH = ('detail', 'findings')
+_MISSING = object()
+
+class PatternError(Exception):
+    pass
+
+def _numeric(value, conditions):
+    if not isinstance(value, numbers.Number) or isinstance(value, bool):
+        return False
+    for start in range(0, len(conditions), 2):
+        operator, bound = conditions[start], conditions[start + 1]
+        if operator == '=' and not value == bound: return False
+        if operator == '>' and not value > bound: return False
+        if operator == '>=' and not value >= bound: return False
+        if operator == '<' and not value < bound: return False
+        if operator == '<=' and not value <= bound: return False
+    return True
+
+def _anything_but(value, excluded):
+    if isinstance(excluded, dict):
+        if 'prefix' in excluded:
+            return isinstance(value, str) and not value.startswith(excluded['prefix'])
+        if 'suffix' in excluded:
+            return isinstance(value, str) and not value.endswith(excluded['suffix'])
+        raise PatternError(f'Unsupported anything-but condition {excluded}')
+    if not isinstance(excluded, list):
+        excluded = [excluded]
+    return value not in excluded
+
+def _matches_value(allowed, value):
+    #A single event value against one entry of a pattern value list
+    if not isinstance(allowed, dict):
+        return value == allowed
+    operator, operand = next(iter(allowed.items()))
+    if operator == 'exists':
+        return operand
+    if operator == 'prefix':
+        return isinstance(value, str) and value.startswith(operand)
+    if operator == 'suffix':
+        return isinstance(value, str) and value.endswith(operand)
+    if operator == 'equals-ignore-case':
+        return isinstance(value, str) and value.lower() == operand.lower()
+    if operator == 'anything-but':
+        return _anything_but(value, operand)
+    if operator == 'numeric':
+        return _numeric(value, operand)
+    raise PatternError(f'Unsupported pattern operator {operator}')
+
+def _matches_list(allowed, value):
+    if value is _MISSING:
+        #Only {"exists": false} matches a field the event does not have
+        return any(isinstance(entry, dict) and entry.get('exists') is False for entry in allowed)
+    values = value if isinstance(value, list) else [value]
+    for entry in allowed:
+        if isinstance(entry, dict) and 'exists' in entry:
+            if entry['exists']:
+                return True
+            continue
+        if any(_matches_value(entry, item) for item in values):
+            return True
+    return False
+
+def matches(pattern, event):
+
+    #True when event (a dict) matches the EventBridge pattern. Arrays in the event match
+    #when any of their elements does, the same way EventBridge flattens them.
+    for field, allowed in pattern.items():
+        if isinstance(event, list):
+            value = [item.get(field, _MISSING) for item in event if isinstance(item, dict)]
+            value = [item for item in value if item is not _MISSING] or _MISSING
+        elif isinstance(event, dict):
+            value = event.get(field, _MISSING)
+        else:
+            value = _MISSING
+        if isinstance(allowed, dict):
+            if value is _MISSING or not matches(allowed, value):
+                return False
+        elif isinstance(allowed, list):
+            if not _matches_list(allowed, value):
+                return False
+        else:
+            raise PatternError(f'Pattern value of {field} must be an object or an array')
+    return True
+
+Rule = collections.namedtuple('Rule', ['name', 'target', 'eventPattern', 'findingPattern'])
+
+def split_pattern(pattern):
+    #Splits a rule pattern into the part that applies to the event envelope and the part
+    #that applies to each finding in detail.findings
+    eventPattern = dict(pattern)
+    detail = dict(eventPattern.pop('detail', {}))
+    findingPattern = detail.pop('findings', None)
+    if detail:
+        eventPattern['detail'] = detail
+    return eventPattern, findingPattern
+
+class PatternIndex:
+
+    #Rules are indexed by the exact values of one finding field (Title by default) so matching a
+    #finding only evaluates the rules that can respond to it; rules without exact values on that
+    #field are evaluated for every finding.
+    def __init__(self, indexField: str = 'Title'):
+        self.indexField = indexField
+        self._indexed = {}
+        self._unindexed = []
+        self.rules = []
+
+    def add(self, name: str, target, pattern):
+        eventPattern, findingPattern = split_pattern(pattern)
+        if findingPattern is None:
+            raise PatternError(f'Rule {name} does not match on {".".join(FINDINGS_PATH)}')
+        rule = Rule(name, target, eventPattern, findingPattern)
+        self.rules.append(rule)
+        keys = findingPattern.get(self.indexField)
+        if isinstance(keys, list) and keys and all(isinstance(key, str) for key in keys):
+            for key in keys:
+                self._indexed.setdefault(key, []).append(rule)
+        else:
+            self._unindexed.append(rule)
+        return rule
+
+    def candidates(self, finding):
+        key = finding.get(self.indexField)
+        indexed = self._indexed.get(key, ()) if isinstance(key, str) else ()
+        return list(indexed) + self._unindexed if self._unindexed else indexed
+
+    def match(self, finding, event=None):
+        #Returns the first rule matching the finding (and the envelope of event, when given), or None
+        for rule in self.candidates(finding):
+            if matches(rule.findingPattern, finding) and (event is None or matches(rule.eventPattern, event)):
+                return rule
+        return None
+
+    def route(self, event):
+        #Returns {target: [findings]} and the findings no rule matches
+        routes = collections.OrderedDict()
+        unrouted = []
+        for finding in event.get('detail', {}).get('findings', []):
+            rule = self.match(finding, event)
+            if rule:
+                routes.setdefault(rule.target, []).append(finding)
+            else:
+                unrouted.append(finding)
+        return routes, unrouted
+
+def _intrinsic(loader, tagSuffix, node):
+    import yaml
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    if tagSuffix == 'Ref':
+        return {'Ref': value}
+    if tagSuffix == 'GetAtt' and isinstance(value, str):
+        value = value.split('.', 1)
+    return {'Fn::' + tagSuffix: value}
+
+def load_template_rules(path: str):
+
+    #Yields (rule logical id, target resource, event pattern) for every AWS::Events::Rule target
+    #of a CloudFormation template that is a resource of the same template. Needs PyYAML.
+    import yaml
+
+    class TemplateLoader(yaml.SafeLoader):
+        pass
+    TemplateLoader.add_multi_constructor('!', _intrinsic)
+
+    with open(path) as template:
+        resources = yaml.load(template, Loader=TemplateLoader).get('Resources', {})
+    for logicalId, resource in resources.items():
+        if resource.get('Type') != 'AWS::Events::Rule':
+            continue
+        properties = resource.get('Properties', {})
+        pattern = properties.get('EventPattern')
+        for target in properties.get('Targets', []):
+            arn = target.get('Arn')
+            if isinstance(arn, dict) and 'Fn::GetAtt' in arn and arn['Fn::GetAtt'][0] in resources:
+                yield logicalId, resources[arn['Fn::GetAtt'][0]], pattern
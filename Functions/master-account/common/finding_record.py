@@ -0,0 +1,128 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import re
+
+#Security Hub findings are parsed once per invocation into FindingRecords that hold only the fields the
+#runner and the playbooks read. Malformed findings are rejected here, before any role is assumed.
+ACCOUNT_ID_PATTERN = re.compile(r'^\d{12}$')
+#Resource ids of some controls carry their CloudFormation type, e.g. AWS::KMS::Key:<key id> or AWS::::Account:<account id>
+RESOURCE_TYPE_PREFIX = re.compile(r'^AWS::\w*::\w+:')
+
+class MalformedFindingError(ValueError):
+    pass
+
+class ResourceId:
+
+    #id: the resource id without a CloudFormation type prefix, an ARN or a plain id
+    #name: the last part of the id, e.g. the trail, user or bucket name, key id, VPC or security group id
+    __slots__ = ('id', 'partition', 'service', 'region', 'account', 'resourceType', 'name')
+
+    def __init__(self, id: str, partition=None, service=None, region=None, account=None, resourceType=None, name=None):
+        self.id = id
+        self.partition = partition
+        self.service = service
+        self.region = region
+        self.account = account
+        self.resourceType = resourceType
+        self.name = name
+
+    def __repr__(self):
+        return f'ResourceId({self.id!r})'
+
+def parse_arn(value: str):
+    #arn:partition:service:region:account:resource, the resource being name, type/name or type:name
+    parts = value.split(':', 5) if isinstance(value, str) else []
+    if len(parts) != 6 or parts[0] != 'arn' or not parts[1] or not parts[2]:
+        raise MalformedFindingError(f'Not an ARN: {value!r}')
+    resource = parts[5]
+    if '/' in resource:
+        resourceType, name = resource.split('/', 1)[0], resource.rsplit('/', 1)[-1]
+    elif ':' in resource:
+        resourceType, name = resource.split(':', 1)
+    else:
+        resourceType, name = None, resource
+    if not name:
+        raise MalformedFindingError(f'ARN without a resource: {value!r}')
+    return ResourceId(value, parts[1], parts[2], parts[3] or None, parts[4] or None, resourceType, name)
+
+def parse_resource_id(value: str):
+    if not isinstance(value, str) or not value:
+        raise MalformedFindingError(f'Invalid resource id: {value!r}')
+    value = RESOURCE_TYPE_PREFIX.sub('', value, count=1)
+    if value.startswith('arn:'):
+        return parse_arn(value)
+    if not value:
+        raise MalformedFindingError('Empty resource id')
+    return ResourceId(value, name=value)
+
+class FindingRecord:
+
+    __slots__ = ('id', 'productArn', 'accountId', 'title', 'region', 'updatedAt', 'noteText', 'resourceType', 'resourceRegion', 'resource')
+
+    def __init__(self, finding):
+        if not isinstance(finding, dict):
+            raise MalformedFindingError('Finding is not an object')
+        self.id = _required(finding, 'Id')
+        self.productArn = _required(finding, 'ProductArn')
+        self.accountId = _required(finding, 'AwsAccountId')
+        if not ACCOUNT_ID_PATTERN.match(self.accountId):
+            raise MalformedFindingError(f'Invalid AwsAccountId {self.accountId!r} in finding {self.id}')
+        self.title = _required(finding, 'Title')
+        self.region = finding.get('Region') or parse_arn(self.productArn).region
+        self.updatedAt = finding.get('UpdatedAt')
+        self.noteText = (finding.get('Note') or {}).get('Text')
+
+        #CIS findings have a single resource, the one the control failed for
+        resources = finding.get('Resources')
+        if not isinstance(resources, list) or not resources or not isinstance(resources[0], dict):
+            raise MalformedFindingError(f'Finding {self.id} has no resources')
+        self.resourceType = resources[0].get('Type')
+        self.resourceRegion = resources[0].get('Region')
+        self.resource = parse_resource_id(resources[0].get('Id'))
+
+    def __repr__(self):
+        return f'FindingRecord({self.id!r})'
+
+def _required(finding, field: str):
+    value = finding.get(field)
+    if not isinstance(value, str) or not value:
+        raise MalformedFindingError(f'Finding {finding.get("Id")!r} has no {field}')
+    return value
+
+def parse_event(event):
+
+    #Returns the FindingRecords of the event and (finding, error) for every malformed finding.
+    #An event without detail.findings is rejected as a whole.
+    try:
+        findings = event['detail']['findings']
+    except (KeyError, TypeError):
+        raise MalformedFindingError('Event has no detail.findings')
+    if not isinstance(findings, list):
+        raise MalformedFindingError('detail.findings of the event is not a list')
+
+    records = []
+    malformed = []
+    for finding in findings:
+        try:
+            records.append(FindingRecord(finding))
+        except MalformedFindingError as e:
+            malformed.append((finding, e))
+    return records, malformed
@@ -0,0 +1,325 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import logging
+import threading
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics
+from common import dedup_store
+from common import finding_record
+from common import account_session
+from common import finding_updater
+from common import sns_notification
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Upper bound on findings remediated at the same time within one invocation
+MAX_WORKERS = int(os.environ.get('FINDING_MAX_WORKERS', '8'))
+#threads: findings run on a thread pool and are resolved together at the end (default)
+#asyncio: see common/async_engine.py, Security Hub updates and notifications overlap with remediation
+EXECUTION_MODE = os.environ.get('FINDING_EXECUTION_MODE', 'threads').lower()
+
+#Playbooks with a remediate_batch hook handle all findings of an account in one pass once the event holds
+#at least this many findings for that account, below it every finding is remediated on its own
+BULK_MIN_FINDINGS = int(os.environ.get('BULK_MIN_FINDINGS', '5'))
+
+CUSTOM_ACTION_DETAIL_TYPE = 'Security Hub Findings - Custom Action'
+
+#Findings whose remediation is still running are set to NOTIFIED with a note starting with this prefix,
+#the sweep picks them up again until the remediation completed
+PENDING_WORKFLOW_STATUS = 'NOTIFIED'
+PENDING_NOTE_PREFIX = 'Remediation in progress: '
+
+class RemediationError(Exception):
+    def __init__(self, results):
+        self.results = results
+        failed = [result['findingId'] for result in results if result['status'] == 'FAILED']
+        super().__init__(f"{len(failed)} of {len(results)} findings failed remediation: {', '.join(failed)}")
+
+class RemediationPending(Exception):
+    #Raised by a playbook whose remediation was started but has not completed yet, e.g. an SSM automation.
+    #The message becomes the note of the finding.
+    pass
+
+def group_by_account(findings):
+    accounts = collections.OrderedDict()
+    for finding in findings:
+        accounts.setdefault(finding.accountId, []).append(finding)
+    return accounts
+
+def _result(finding, status: str, error=None):
+    result = {'findingId': finding.id, 'accountId': finding.accountId, 'status': status}
+    if error is not None:
+        result['error'] = str(error)
+    return result
+
+def raw_result(finding, status: str, error=None, defaultId: str = None):
+    #Result of a finding that was not parsed into a FindingRecord, it may lack any field
+    finding = finding if isinstance(finding, dict) else {}
+    findingId = finding.get('Id') if isinstance(finding.get('Id'), str) else defaultId
+    result = {'findingId': findingId, 'accountId': finding.get('AwsAccountId'), 'status': status}
+    if error is not None:
+        result['error'] = str(error)
+    return result
+
+def _get_session(accountId: str, roleName: str, region: str = None):
+    try:
+        return account_session.get_session(accountId, roleName, region), None
+    except Exception as e:
+        logger.error(f'Unable to assume role {roleName} in account {accountId}: {e}')
+        return None, e
+
+def _notification(finding):
+    findingTitle=finding.title
+    return f"Security Hub Finding: {findingTitle} has been successfully responded to and resolved. Finding Id: {finding.id}"
+
+#How often a playbook precheck found the resource already compliant and skipped the remediation
+_precheckStats = {'fastPath': 0, 'remediated': 0, 'errors': 0}
+_precheckLock = threading.Lock()
+
+def _count_precheck(stat: str):
+    with _precheckLock:
+        _precheckStats[stat] += 1
+    metrics.count('Precheck' + stat[0].upper() + stat[1:])
+
+def get_precheck_stats():
+    with _precheckLock:
+        return dict(_precheckStats)
+
+def _precheck(finding, session, precheck):
+
+    #precheck(finding, session) makes one read call and returns the note to resolve the finding with
+    #when the resource is already compliant, or None when the remediation has to run
+    try:
+        with metrics.timer('Precheck'):
+            noteText = precheck(finding, session)
+    except Exception as e:
+        logger.warning(f"Precheck of finding {finding.id} failed, remediating: {e}")
+        _count_precheck('errors')
+        return None
+    if noteText is not None:
+        logger.info(f"Finding {finding.id} is already compliant, skipping remediation")
+        _count_precheck('fastPath')
+        return noteText
+    _count_precheck('remediated')
+    return None
+
+def remediate(finding, session, remediateFinding, precheck=None):
+    if precheck is not None:
+        noteText = _precheck(finding, session, precheck)
+        if noteText is not None:
+            return noteText
+    with metrics.timer('Remediation'):
+        return remediateFinding(finding, session)
+
+def precheck_findings(findings, session, precheck):
+
+    #For remediate_batch hooks: returns ({finding Id: note} of the findings already compliant, the findings
+    #still to remediate). The prechecks of an account run on up to FINDING_MAX_WORKERS threads.
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(findings)))) as executor:
+        notes = list(executor.map(metrics.bind(lambda finding: _precheck(finding, session, precheck)), findings))
+    compliant = {finding.id: noteText for finding, noteText in zip(findings, notes) if noteText is not None}
+    return compliant, [finding for finding in findings if finding.id not in compliant]
+
+def remediate_one(finding, session, remediateFinding, precheck=None):
+    #Returns [(finding, noteText, error)] like remediate_account
+    with metrics.scope(Account=finding.accountId):
+        try:
+            return [(finding, remediate(finding, session, remediateFinding, precheck), None)]
+        except Exception as e:
+            return [(finding, None, e)]
+
+def use_batch(accountFindings, remediateBatch):
+    return remediateBatch is not None and len(accountFindings) >= BULK_MIN_FINDINGS
+
+def remediate_account(findings, session, remediateBatch):
+
+    #remediateBatch(findings, session) returns {finding Id: note, None when there was nothing to resolve,
+    #or the exception that finding failed with}. Returns (finding, noteText, error) for each finding.
+    try:
+        with metrics.scope(Account=findings[0].accountId), metrics.timer('BatchRemediation'):
+            outcomes = remediateBatch(findings, session)
+    except Exception as e:
+        return [(finding, None, e) for finding in findings]
+
+    remediated = []
+    for finding in findings:
+        outcome = outcomes.get(finding.id)
+        if isinstance(outcome, Exception):
+            remediated.append((finding, None, outcome))
+        else:
+            remediated.append((finding, outcome, None))
+    return remediated
+
+def record_outcome(finding, noteText, error, results, resolved):
+
+    #resolved collects (finding, noteText, workflowStatus) for update_findings
+    if isinstance(error, RemediationPending):
+        logger.info(f"Remediation of finding {finding.id} has not completed yet: {error}")
+        resolved.append((finding, PENDING_NOTE_PREFIX + str(error), PENDING_WORKFLOW_STATUS))
+    elif error is not None:
+        logger.error(f"Remediation of finding {finding.id} failed: {error}")
+        results[finding.id] = _result(finding, 'FAILED', error)
+    elif noteText is None:
+        results[finding.id] = _result(finding, 'NO_ACTION')
+    else:
+        resolved.append((finding, noteText, 'RESOLVED'))
+
+def playbook_name(remediateFinding):
+    return remediateFinding.__module__.rsplit('.', 1)[-1]
+
+def parse_findings(event, results):
+
+    #Every finding is parsed into a FindingRecord once, malformed findings fail before any role is assumed
+    findings, malformed = finding_record.parse_event(event)
+    for index, (finding, error) in enumerate(malformed):
+        result = raw_result(finding, 'FAILED', error, f'malformed-{index}')
+        logger.error(f"Rejected malformed finding {result['findingId']}: {error}")
+        results[result['findingId']] = result
+    return findings
+
+def claim_findings(event, remediateFinding, results):
+
+    #Returns the findings to remediate and the dedup keys claimed for them. Findings this playbook already
+    #handled at the same UpdatedAt are marked DUPLICATE. Custom actions are explicit requests and always run.
+    findings = parse_findings(event, results)
+    store = dedup_store.get_store()
+    if store is None or event.get('detail-type') == CUSTOM_ACTION_DETAIL_TYPE:
+        return findings, {}
+
+    playbook = playbook_name(remediateFinding)
+    claimed = []
+    claims = {}
+    for finding in findings:
+        key = dedup_store.dedup_key(finding, playbook)
+        if store.claim(key):
+            claimed.append(finding)
+            claims[finding.id] = key
+        else:
+            results[finding.id] = _result(finding, 'DUPLICATE')
+    if len(claimed) < len(findings):
+        logger.info(f'Skipping {len(findings) - len(claimed)} findings already handled by {playbook}')
+    return claimed, claims
+
+def update_findings(resolved, results):
+
+    #Security Hub is updated once for all findings in resolved.
+    #Returns the findings that were resolved and can be notified, pending findings are not notified.
+    updater = finding_updater.FindingUpdater(os.environ['AWS_LAMBDA_FUNCTION_NAME'])
+    for finding, noteText, workflowStatus in resolved:
+        updater.add(finding.id, finding.productArn, noteText, workflowStatus)
+
+    with metrics.timer('SecurityHubUpdate'):
+        failedUpdates = {entry['FindingIdentifier']['Id']: entry for entry in updater.flush()}
+    updated = []
+    for finding, noteText, workflowStatus in resolved:
+        if finding.id in failedUpdates:
+            entry = failedUpdates[finding.id]
+            results[finding.id] = _result(finding, 'FAILED', f"Security Hub update failed: {entry['ErrorCode']} {entry.get('ErrorMessage', '')}")
+        elif workflowStatus == PENDING_WORKFLOW_STATUS:
+            results[finding.id] = _result(finding, 'PENDING')
+        else:
+            metrics.finding_latency(finding, Account=finding.accountId)
+            updated.append(finding)
+    return updated
+
+def notify_findings(updated, results):
+    notifier = sns_notification.SNSNotifier(os.environ['AlertSnsArn'])
+    for finding in updated:
+        notifier.add(finding.id, _notification(finding), finding.title, finding.accountId)
+        results[finding.id] = _result(finding, 'SUCCESS')
+
+    with metrics.timer('SnsPublish'):
+        failedNotifications = notifier.flush()
+    for findingId in failedNotifications:
+        results[findingId] = dict(results[findingId], status='FAILED', error='Notification failed')
+
+def finish(results, claims=None):
+
+    #Failed and pending findings are released so the next event or sweep handles them again,
+    #the claims of all other findings are kept for the full TTL
+    completed = []
+    for findingId, key in (claims or {}).items():
+        if results[findingId]['status'] in ('FAILED', 'PENDING'):
+            dedup_store.get_store().release(key)
+        else:
+            completed.append(key)
+    if completed:
+        dedup_store.get_store().complete(completed)
+
+    results = list(results.values())
+    logger.info(results)
+
+    if any(result['status'] == 'FAILED' for result in results):
+        raise RemediationError(results)
+    return {'results': results}
+
+def run_findings(event, remediateFinding, roleName: str, region: str = None, precheck=None, remediateBatch=None):
+
+    #remediateFinding(finding, session) gets a finding_record.FindingRecord and returns the note to resolve
+    #the finding with, or None when there was nothing to resolve. Sessions are created in region, the function's own by default.
+    #Metrics of the invocation carry the playbook and region and are written once it completed.
+    with metrics.scope(Playbook=playbook_name(remediateFinding), Region=region or os.environ.get('AWS_REGION')):
+        try:
+            with metrics.timer('Invocation'):
+                if EXECUTION_MODE == 'asyncio':
+                    from common import async_engine
+                    return async_engine.run_findings(event, remediateFinding, roleName, region=region, precheck=precheck, remediateBatch=remediateBatch)
+                return _run_threads(event, remediateFinding, roleName, region, precheck, remediateBatch)
+        finally:
+            metrics.flush()
+
+def _run_threads(event, remediateFinding, roleName: str, region: str, precheck, remediateBatch):
+    results = collections.OrderedDict()
+    findings, claims = claim_findings(event, remediateFinding, results)
+    accounts = group_by_account(findings)
+    logger.info(f'Received {len(findings)} findings across {len(accounts)} accounts')
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(findings)))) as executor:
+        #Each account is assumed once, then all of its findings share that session
+        sessions = dict(zip(accounts, executor.map(metrics.bind(lambda accountId: _get_session(accountId, roleName, region)), accounts)))
+
+        futures = []
+        for accountId, accountFindings in accounts.items():
+            session, error = sessions[accountId]
+            if session is None:
+                for finding in accountFindings:
+                    results[finding.id] = _result(finding, 'FAILED', error)
+            elif use_batch(accountFindings, remediateBatch):
+                logger.info(f'Remediating {len(accountFindings)} findings in account {accountId} as one batch')
+                futures.append(executor.submit(metrics.bind(remediate_account), accountFindings, session, remediateBatch))
+            else:
+                for finding in accountFindings:
+                    futures.append(executor.submit(metrics.bind(remediate_one), finding, session, remediateFinding, precheck))
+
+        resolved = []
+        for future in futures:
+            for finding, noteText, error in future.result():
+                record_outcome(finding, noteText, error, results, resolved)
+
+    #Security Hub is updated once for the whole event, then the resolved findings are notified
+    notify_findings(update_findings(resolved, results), results)
+    logger.info(f'Precheck totals for this container: {get_precheck_stats()}')
+    return finish(results, claims)
@@ -0,0 +1,99 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import time
+import random
+import logging
+import threading
+import collections
+
+from common import client_registry
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#BatchUpdateFindings accepts at most 100 finding identifiers per request
+MAX_IDENTIFIERS_PER_CALL = 100
+MAX_RETRIES = int(os.environ.get('FINDING_UPDATE_MAX_RETRIES', '3'))
+RETRY_BASE_SECONDS = float(os.environ.get('FINDING_UPDATE_RETRY_BASE_SECONDS', '0.5'))
+
+class FindingUpdater:
+
+    #Collects finding resolutions and writes them to Security Hub in as few calls as possible.
+    #Findings sharing the same note and workflow status are sent in one request.
+    def __init__(self, updatedBy: str, securityhub=None):
+        self.updatedBy = updatedBy
+        self.securityhub = securityhub or client_registry.get_client('securityhub')
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.apiCalls = 0
+
+    def add(self, findingId: str, productArn: str, noteText: str, workflowStatus: str = 'RESOLVED'):
+        with self._lock:
+            self._pending.setdefault((noteText, workflowStatus), []).append({'Id': findingId, 'ProductArn': productArn})
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(identifiers) for identifiers in self._pending.values())
+
+    def _update(self, identifiers, noteText: str, workflowStatus: str):
+        self.apiCalls += 1
+        response = self.securityhub.batch_update_findings(
+            FindingIdentifiers=identifiers,
+            Note={
+                'Text': noteText,
+                'UpdatedBy': self.updatedBy
+            },
+            Workflow={
+                'Status': workflowStatus
+            },
+        )
+        logger.info(f"Updated {len(response['ProcessedFindings'])} findings to {workflowStatus}, {len(response['UnprocessedFindings'])} unprocessed")
+        return response['UnprocessedFindings']
+
+    def _update_with_retries(self, identifiers, noteText: str, workflowStatus: str):
+        unprocessed = []
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(RETRY_BASE_SECONDS * (2 ** (attempt - 1)) * (1 + random.random()))
+            unprocessed = self._update(identifiers, noteText, workflowStatus)
+            if not unprocessed:
+                return []
+            identifiers = [entry['FindingIdentifier'] for entry in unprocessed]
+            logger.info(f'Retrying {len(identifiers)} unprocessed findings, attempt {attempt + 1} of {MAX_RETRIES}')
+        return unprocessed
+
+    def flush(self):
+
+        #Returns the UnprocessedFindings entries that could not be updated after retries
+        with self._lock:
+            pending, self._pending = self._pending, collections.OrderedDict()
+
+        failed = []
+        for (noteText, workflowStatus), identifiers in pending.items():
+            for start in range(0, len(identifiers), MAX_IDENTIFIERS_PER_CALL):
+                chunk = identifiers[start:start + MAX_IDENTIFIERS_PER_CALL]
+                try:
+                    failed.extend(self._update_with_retries(chunk, noteText, workflowStatus))
+                except Exception as e:
+                    logger.error(f'Security Hub update failed for {len(chunk)} findings: {e}')
+                    failed.extend({'FindingIdentifier': identifier, 'ErrorCode': 'UpdateFailed', 'ErrorMessage': str(e)} for identifier in chunk)
+        return failed
@@ -0,0 +1,230 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import json
+import logging
+import threading
+
+from common import client_registry
+from common import readiness
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Every trail of an account and region is encrypted with the same customer managed key, found by this alias
+TRAIL_KEY_ALIAS = os.environ.get('CLOUDTRAIL_KEY_ALIAS', 'alias/cis/cloudtrail')
+#A key created by a container that lost the race for the alias is deleted after this many days (7 to 30)
+ORPHAN_KEY_DELETION_DAYS = 7
+
+ENCRYPTION_CONTEXT_KEY = 'kms:EncryptionContext:aws:cloudtrail:arn'
+
+#(account, region) -> key ARN and the key ARNs whose policy already allows every trail of the account,
+#kept across warm invocations
+_trailKeys = {}
+_allowedKeys = set()
+_keyLocks = {}
+_cacheLock = threading.Lock()
+
+def _key_lock(cacheKey):
+    with _cacheLock:
+        lock = _keyLocks.get(cacheKey)
+        if lock is None:
+            lock = _keyLocks[cacheKey] = threading.Lock()
+        return lock
+
+def trail_pattern(accountId: str):
+    #Every trail of the account, like the default key policy CloudTrail creates. The policy never has to
+    #change when another trail uses the key, so containers do not race to rewrite it.
+    return "arn:aws:cloudtrail:*:" + accountId + ":trail/*"
+
+def key_policy(accountId: str):
+    return {
+        "Version": "2012-10-17",
+        "Id": "Key policy created by CloudTrail",
+        "Statement": [
+            {
+                "Sid": "Enable IAM User Permissions",
+                "Effect": "Allow",
+                "Principal": {
+                    "AWS": [ "arn:aws:iam::" + accountId + ":root" ]
+                },
+                "Action": "kms:*",
+                "Resource": "*"
+            },
+            {
+                "Sid": "Allow CloudTrail to encrypt logs",
+                "Effect": "Allow",
+                "Principal": {
+                    "Service": "cloudtrail.amazonaws.com"
+                },
+                "Action": "kms:GenerateDataKey*",
+                "Resource": "*",
+                "Condition": {
+                    "StringLike": {
+                        ENCRYPTION_CONTEXT_KEY: [ trail_pattern(accountId) ]
+                    }
+                }
+            },
+            {
+                "Sid": "Allow CloudTrail to describe key",
+                "Effect": "Allow",
+                "Principal": {
+                    "Service": "cloudtrail.amazonaws.com"
+                },
+                "Action": "kms:DescribeKey",
+                "Resource": "*"
+            },
+            {
+                "Sid": "Allow principals in the account to decrypt log files",
+                "Effect": "Allow",
+                "Principal": {
+                    "AWS": "*"
+                },
+                "Action": [
+                    "kms:Decrypt",
+                    "kms:ReEncryptFrom"
+                ],
+                "Resource": "*",
+                "Condition": {
+                    "StringEquals": {
+                        "kms:CallerAccount": accountId
+                    },
+                    "StringLike": {
+                        ENCRYPTION_CONTEXT_KEY: [ trail_pattern(accountId) ]
+                    }
+                }
+            },
+            {
+                "Sid": "Allow alias creation during setup",
+                "Effect": "Allow",
+                "Principal": {
+                    "AWS": "*"
+                },
+                "Action": "kms:CreateAlias",
+                "Resource": "*",
+                "Condition": {
+                    "StringEquals": {
+                        "kms:CallerAccount": accountId
+                    }
+                }
+            }
+        ]
+    }
+
+def _policy_trails(policy):
+    #Trail patterns in the encryption context conditions of a key policy
+    trails = set()
+    for statement in policy.get('Statement', []):
+        values = statement.get('Condition', {}).get('StringLike', {}).get(ENCRYPTION_CONTEXT_KEY, [])
+        trails.update([values] if isinstance(values, str) else values)
+    return trails
+
+def merge_trail_pattern(policy, accountId: str):
+
+    #Adds the account trail pattern to the encryption context conditions of an existing key policy.
+    #Statements the policy lacks are added from key_policy, everything else in it is kept.
+    pattern = trail_pattern(accountId)
+    statements = policy.setdefault('Statement', [])
+    merged = False
+    for statement in statements:
+        stringLike = statement.get('Condition', {}).get('StringLike', {})
+        if ENCRYPTION_CONTEXT_KEY in stringLike:
+            values = stringLike[ENCRYPTION_CONTEXT_KEY]
+            values = [values] if isinstance(values, str) else list(values)
+            if pattern not in values:
+                values.append(pattern)
+            stringLike[ENCRYPTION_CONTEXT_KEY] = values
+            merged = True
+    if not merged:
+        sids = {statement.get('Sid') for statement in statements}
+        for statement in key_policy(accountId)['Statement']:
+            forCloudTrail = statement['Principal'].get('Service') == 'cloudtrail.amazonaws.com' or ENCRYPTION_CONTEXT_KEY in statement.get('Condition', {}).get('StringLike', {})
+            if forCloudTrail and statement['Sid'] not in sids:
+                statements.append(statement)
+    return policy
+
+def _find_key(kms):
+    try:
+        return kms.describe_key(KeyId=TRAIL_KEY_ALIAS)['KeyMetadata']['Arn']
+    except kms.exceptions.NotFoundException:
+        return None
+
+def _create_key(kms, accountId: str):
+
+    #The policy is part of create_key, so the key is never usable without it
+    keyArn = kms.create_key(
+        Policy=json.dumps(key_policy(accountId)),
+        Description='Generated by Security Hub to remediate CIS 2.7 Ensure CloudTrail logs are encrypted at rest using KMS CMKs',
+        KeyUsage='ENCRYPT_DECRYPT',
+        Origin='AWS_KMS'
+    )['KeyMetadata']['Arn']
+    logger.info(f'Created key {keyArn}')
+
+    try:
+        kms.create_alias(AliasName=TRAIL_KEY_ALIAS, TargetKeyId=keyArn)
+    except kms.exceptions.AlreadyExistsException:
+        #Another invocation created the account key first, use that one and drop ours
+        kms.schedule_key_deletion(KeyId=keyArn, PendingWindowInDays=ORPHAN_KEY_DELETION_DAYS)
+        logger.info(f'{TRAIL_KEY_ALIAS} was created concurrently, scheduled deletion of {keyArn}')
+        return _find_key(kms)
+
+    readiness.wait_until(
+        lambda: kms.describe_key(KeyId=keyArn)['KeyMetadata']['KeyState'] == 'Enabled',
+        f'KMS key {keyArn} is enabled',
+        retryErrorCodes=('NotFoundException',)
+    )
+    _allowedKeys.add(keyArn)
+    return keyArn
+
+def _allow_trails(kms, keyArn: str, accountId: str):
+
+    #A reused key, e.g. one an admin created under the alias, is checked once per container
+    if keyArn in _allowedKeys:
+        return
+    policy = json.loads(kms.get_key_policy(KeyId=keyArn, PolicyName='default')['Policy'])
+    if trail_pattern(accountId) not in _policy_trails(policy):
+        kms.put_key_policy(KeyId=keyArn, PolicyName='default', Policy=json.dumps(merge_trail_pattern(policy, accountId)))
+        logger.info(f'Allowed every trail of account {accountId} to use key {keyArn}')
+    _allowedKeys.add(keyArn)
+
+def get_trail_key(session, accountId: str, trailName: str, region: str = None):
+
+    #Returns the ARN of the account's CloudTrail key in region, creating it on first use,
+    #with a policy that allows every trail of the account, trailName included, to encrypt with it
+    kms = client_registry.get_client('kms', session, region)
+    cacheKey = (accountId, kms.meta.region_name)
+
+    with _key_lock(cacheKey):
+        keyArn = _trailKeys.get(cacheKey)
+        if keyArn is None:
+            keyArn = _find_key(kms)
+            if keyArn is None:
+                keyArn = _create_key(kms, accountId)
+            else:
+                logger.info(f'Reusing key {keyArn} from {TRAIL_KEY_ALIAS} for trail {trailName}')
+            _trailKeys[cacheKey] = keyArn
+        _allow_trails(kms, keyArn, accountId)
+    return keyArn
+
+def clear_cache():
+    with _cacheLock:
+        _trailKeys.clear()
+        _allowedKeys.clear()
@@ -0,0 +1,62 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import logging
+import threading
+
+from common import client_registry
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Log groups known to exist, per account and region, kept across warm invocations
+_knownGroups = set()
+_knownLock = threading.Lock()
+
+def log_group_arn(accountId: str, region: str, logGroupName: str):
+    #Same form describe_log_groups returns and CloudTrail expects, built without an API call
+    return f'arn:aws:logs:{region}:{accountId}:log-group:{logGroupName}:*'
+
+def ensure_log_group(session, accountId: str, logGroupName: str, region: str = None):
+
+    #Creates the log group unless it already exists and returns its ARN.
+    #Names are expected to be deterministic, so re-runs reuse the group instead of adding another one.
+    cwl = client_registry.get_client('logs', session, region)
+    region = cwl.meta.region_name
+    cacheKey = (accountId, region, logGroupName)
+
+    if cacheKey not in _knownGroups:
+        try:
+            cwl.create_log_group(logGroupName=logGroupName)
+            logger.info(f'Created log group {logGroupName} in account {accountId} {region}')
+        except cwl.exceptions.ResourceAlreadyExistsException:
+            pass
+        with _knownLock:
+            _knownGroups.add(cacheKey)
+    return log_group_arn(accountId, region, logGroupName)
+
+def forget(accountId: str, region: str, logGroupName: str):
+    #For callers that find a cached log group was deleted, the next ensure_log_group creates it again
+    with _knownLock:
+        _knownGroups.discard((accountId, region, logGroupName))
+
+def clear_cache():
+    with _knownLock:
+        _knownGroups.clear()
@@ -0,0 +1,200 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+
+import os
+import json
+import time
+import logging
+import datetime
+import functools
+import threading
+import contextlib
+import collections
+
+from common import rate_limiter
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Metrics are written to stdout in CloudWatch Embedded Metric Format, CloudWatch Logs extracts them from the
+#Lambda log stream without any API call. Values are buffered and written once per invocation by flush().
+ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ProjectSweetDreams')
+#EMF accepts at most 100 metrics per record and 100 values per metric
+MAX_METRICS_PER_RECORD = 100
+MAX_VALUES_PER_METRIC = 100
+
+_scope = threading.local()
+#{sorted dimension items: {metric name: (unit, [values])}}
+_pending = collections.OrderedDict()
+_pendingLock = threading.Lock()
+
+def _dimensions(dimensions):
+    merged = dict(getattr(_scope, 'dimensions', {}))
+    merged.update((name, str(value)) for name, value in dimensions.items() if value is not None)
+    return tuple(sorted(merged.items()))
+
+@contextlib.contextmanager
+def scope(**dimensions):
+    #Dimensions added to every metric this thread records inside the block, e.g. Playbook and Account
+    previous = getattr(_scope, 'dimensions', {})
+    _scope.dimensions = dict(previous, **{name: str(value) for name, value in dimensions.items() if value is not None})
+    try:
+        yield
+    finally:
+        _scope.dimensions = previous
+
+def bind(function, **dimensions):
+    #Runs function with the dimensions of the calling thread plus dimensions, for work handed to a thread pool
+    dimensions = dict(getattr(_scope, 'dimensions', {}), **dimensions)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with scope(**dimensions):
+            return function(*args, **kwargs)
+    return wrapper
+
+def put(name: str, value: float, unit: str = 'Count', **dimensions):
+    if not ENABLED:
+        return
+    key = _dimensions(dimensions)
+    with _pendingLock:
+        metrics = _pending.get(key)
+        if metrics is None:
+            metrics = _pending[key] = collections.OrderedDict()
+        if name not in metrics:
+            metrics[name] = (unit, [])
+        values = metrics[name][1]
+        #Counts are summed, durations keep every value so CloudWatch can compute percentiles
+        if unit == 'Count' and values:
+            values[0] += value
+        else:
+            values.append(value)
+
+def count(name: str, value: int = 1, **dimensions):
+    put(name, value, 'Count', **dimensions)
+
+@contextlib.contextmanager
+def timer(step: str, **dimensions):
+    #Records <step>Duration in milliseconds, also when the block raises
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        put(step + 'Duration', round((time.perf_counter() - start) * 1000, 3), 'Milliseconds', **dimensions)
+
+def timed(step: str):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(step):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def finding_latency(finding, **dimensions):
+    #End to end latency, from the last update of the finding in Security Hub until now
+    try:
+        updatedAt = datetime.datetime.fromisoformat(finding.updatedAt.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return
+    latency = datetime.datetime.now(datetime.timezone.utc) - updatedAt
+    put('RemediationLatency', round(latency.total_seconds() * 1000, 3), 'Milliseconds', **dimensions)
+
+def _records(dimensions, metrics):
+    names = list(metrics)
+    for start in range(0, len(names), MAX_METRICS_PER_RECORD):
+        chunk = names[start:start + MAX_METRICS_PER_RECORD]
+        longest = max(len(metrics[name][1]) for name in chunk)
+        for offset in range(0, longest, MAX_VALUES_PER_METRIC):
+            record = {
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': NAMESPACE,
+                        'Dimensions': [[name for name, value in dimensions]],
+                        'Metrics': []
+                    }]
+                }
+            }
+            record.update(dimensions)
+            for name in chunk:
+                unit, values = metrics[name]
+                values = values[offset:offset + MAX_VALUES_PER_METRIC]
+                if values:
+                    record['_aws']['CloudWatchMetrics'][0]['Metrics'].append({'Name': name, 'Unit': unit})
+                    record[name] = values if len(values) > 1 else values[0]
+            yield record
+
+def flush():
+
+    #Writes the buffered metrics as EMF records and returns how many were written
+    with _pendingLock:
+        pending = list(_pending.items())
+        _pending.clear()
+
+    written = 0
+    for dimensions, metrics in pending:
+        for record in _records(dimensions, metrics):
+            #EMF records must be the whole log line, so they bypass the logging formatter
+            print(json.dumps(record), flush=True)
+            written += 1
+    return written
+
+def _operation(eventName: str):
+    #Event names look like after-call.iam.UpdateAccessKey
+    return eventName.rsplit('.', 1)[-1]
+
+def attach(client, accountId: str):
+
+    #Records calls, duration, retries, errors and throttles of every API call the client makes
+    if not ENABLED:
+        return client
+    region = client.meta.region_name
+    service = client.meta.service_model.service_name
+
+    def before_call(context=None, **kwargs):
+        if context is not None:
+            context['metricsStart'] = time.perf_counter()
+
+    def after_call(event_name=None, parsed=None, context=None, **kwargs):
+        dimensions = {'Account': accountId, 'Region': region, 'Operation': f'{service}.{_operation(event_name)}'}
+        count('ApiCalls', **dimensions)
+        if context is not None and 'metricsStart' in context:
+            put('ApiCallDuration', round((time.perf_counter() - context['metricsStart']) * 1000, 3), 'Milliseconds', **dimensions)
+        parsed = parsed or {}
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries:
+            count('ApiRetries', retries, **dimensions)
+        if 'Error' in parsed:
+            count('ApiErrors', **dimensions)
+
+    def needs_retry(event_name=None, response=None, **kwargs):
+        #Runs for every attempt, so throttles that were retried successfully are counted too
+        if response is not None and response[1].get('Error', {}).get('Code') in rate_limiter.THROTTLING_ERRORS:
+            count('Throttles', Account=accountId, Region=region, Operation=f'{service}.{_operation(event_name)}')
+        return None
+
+    eventService = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(f'before-call.{eventService}', before_call)
+    client.meta.events.register(f'after-call.{eventService}', after_call)
+    client.meta.events.register(f'needs-retry.{eventService}', needs_retry)
+    return client
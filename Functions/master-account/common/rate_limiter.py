@@ -0,0 +1,144 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Client side token buckets per (account, region, service, API). Each bucket starts at the configured rate,
+#halves it whenever the API answers with a throttling error and adds it back slowly on every success (AIMD),
+#so concurrent findings share what the member account allows instead of all retrying at once.
+ENABLED = os.environ.get('RATE_LIMITER_ENABLED', 'true').lower() == 'true'
+DEFAULT_RATE = float(os.environ.get('RATE_LIMIT_DEFAULT_RPS', '20'))
+#Per service starting rates, e.g. 'iam=10,kms=20', the defaults stay below the documented account quotas
+SERVICE_RATES = dict({'iam': 10.0, 'sts': 20.0, 'kms': 20.0, 'ec2': 20.0, 'cloudtrail': 5.0, 's3': 50.0}, **{
+    service.strip(): float(rate) for service, rate in
+    (entry.split('=') for entry in os.environ.get('RATE_LIMIT_SERVICE_RPS', '').split(',') if '=' in entry)
+})
+MIN_RATE = float(os.environ.get('RATE_LIMIT_MIN_RPS', '0.5'))
+#Rate added back per successful call and fraction kept after a throttle
+INCREASE_RPS = float(os.environ.get('RATE_LIMIT_INCREASE_RPS', '0.1'))
+DECREASE_FACTOR = float(os.environ.get('RATE_LIMIT_DECREASE_FACTOR', '0.5'))
+#Longest a call waits for a token before it is sent anyway
+MAX_WAIT_SECONDS = float(os.environ.get('RATE_LIMIT_MAX_WAIT_SECONDS', '10'))
+
+THROTTLING_ERRORS = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'TooManyRequestsException',
+    'RequestLimitExceeded', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete', 'LimitExceededException',
+    'ProvisionedThroughputExceededException', 'BandwidthLimitExceeded', 'EC2ThrottledException'
+}
+
+class TokenBucket:
+
+    def __init__(self, rate: float):
+        self.maxRate = rate
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        #Holds at most one second worth of tokens so a quiet bucket does not allow a large burst
+        self.tokens = min(max(1, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        deadline = time.monotonic() + MAX_WAIT_SECONDS
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                logger.warning(f'Waited {MAX_WAIT_SECONDS}s for a rate limit token, sending the call anyway')
+                return
+            #Jitter keeps threads that waited on the same bucket from waking up together
+            time.sleep(wait * random.uniform(1, 1.5))
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.maxRate, self.rate + INCREASE_RPS)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0)
+
+_buckets = {}
+_bucketsLock = threading.Lock()
+
+def get_bucket(accountId: str, region: str, service: str, operation: str):
+    key = (accountId, region, service, operation)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _bucketsLock:
+            bucket = _buckets.get(key)
+            if bucket is None:
+                bucket = _buckets[key] = TokenBucket(SERVICE_RATES.get(service, DEFAULT_RATE))
+    return bucket
+
+def _operation(eventName: str):
+    #Event names look like before-send.iam.UpdateAccessKey
+    return eventName.rsplit('.', 1)[-1]
+
+def attach(client, accountId: str):
+
+    #Every attempt, retries included, takes a token from its bucket, and the outcome of each attempt adjusts the rate
+    if not ENABLED:
+        return client
+    region = client.meta.region_name
+    service = client.meta.service_model.service_name
+
+    def before_send(event_name=None, **kwargs):
+        get_bucket(accountId, region, service, _operation(event_name)).acquire()
+
+    def needs_retry(event_name=None, response=None, **kwargs):
+        if response is None:
+            return None
+        bucket = get_bucket(accountId, region, service, _operation(event_name))
+        if response[1].get('Error', {}).get('Code') in THROTTLING_ERRORS:
+            bucket.on_throttle()
+            logger.info(f'{service}.{_operation(event_name)} throttled in account {accountId} {region}, rate lowered to {round(bucket.rate, 2)}/s')
+        else:
+            bucket.on_success()
+        return None
+
+    eventService = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(f'before-send.{eventService}', before_send)
+    client.meta.events.register(f'needs-retry.{eventService}', needs_retry)
+    return client
+
+def get_stats():
+    with _bucketsLock:
+        return {'.'.join(key): {'rate': round(bucket.rate, 2), 'throttles': bucket.throttles} for key, bucket in _buckets.items()}
+
+def clear():
+    with _bucketsLock:
+        _buckets.clear()
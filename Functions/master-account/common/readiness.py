@@ -0,0 +1,63 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import time
+import random
+import logging
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_TIMEOUT_SECONDS = float(os.environ.get('READINESS_TIMEOUT_SECONDS', '20'))
+INITIAL_DELAY_SECONDS = float(os.environ.get('READINESS_INITIAL_DELAY_SECONDS', '0.25'))
+MAX_DELAY_SECONDS = float(os.environ.get('READINESS_MAX_DELAY_SECONDS', '2'))
+
+class NotReadyError(Exception):
+    pass
+
+def wait_until(check, description: str, timeout: float = None, retryErrorCodes=()):
+
+    #Calls check() until it returns a truthy value and returns that value.
+    #ClientErrors with a code in retryErrorCodes count as not ready yet, e.g. a resource that is not visible yet.
+    from botocore.exceptions import ClientError
+
+    deadline = time.monotonic() + (timeout or DEFAULT_TIMEOUT_SECONDS)
+    delay = INITIAL_DELAY_SECONDS
+    attempts = 0
+
+    while True:
+        attempts += 1
+        try:
+            result = check()
+        except ClientError as e:
+            if e.response['Error']['Code'] not in retryErrorCodes:
+                raise
+            result = None
+        if result:
+            logger.info(f'{description} after {attempts} attempts')
+            return result
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise NotReadyError(f'Timed out waiting until {description} after {attempts} attempts')
+        #Full jitter keeps concurrent findings from polling in lockstep
+        time.sleep(min(remaining, random.uniform(0, delay)))
+        delay = min(delay * 2, MAX_DELAY_SECONDS)
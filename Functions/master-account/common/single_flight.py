@@ -0,0 +1,180 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import time
+import logging
+import threading
+
+from common import deadline
+from common import client_registry
+from common import readiness
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+#Callers asking for the same key while it runs, or within this many seconds after it succeeded, share its result
+WINDOW_SECONDS = float(os.environ.get('SINGLE_FLIGHT_WINDOW_SECONDS', '30'))
+#Table shared by every container, the dedup table by default. Without one, calls are only coalesced in-process.
+TABLE_NAME = os.environ.get('SINGLE_FLIGHT_TABLE_NAME', os.environ.get('DEDUP_TABLE_NAME', ''))
+#A lock whose holder disappeared is taken over after this many seconds
+LOCK_TIMEOUT_SECONDS = int(os.environ.get('SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS', '60'))
+
+class LockWaitTimeout(Exception):
+    #Raised when the invocation has no time left to wait for the container holding the lock
+    pass
+
+class LockTable:
+
+    #Same key schema as the dedup table: string partition key 'DedupKey', TTL on 'ExpiresAt'
+    def __init__(self, tableName: str = None, dynamodb=None):
+        self.tableName = tableName or TABLE_NAME
+        self.dynamodb = dynamodb or client_registry.get_client('dynamodb')
+
+    def acquire(self, key: str):
+        now = int(time.time())
+        try:
+            self.dynamodb.put_item(
+                TableName=self.tableName,
+                Item={'DedupKey': {'S': key}, 'Status': {'S': 'RUNNING'}, 'ExpiresAt': {'N': str(now + LOCK_TIMEOUT_SECONDS)}},
+                ConditionExpression='attribute_not_exists(DedupKey) OR ExpiresAt < :now',
+                ExpressionAttributeValues={':now': {'N': str(now)}}
+            )
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def complete(self, key: str, result: str):
+        self.dynamodb.put_item(
+            TableName=self.tableName,
+            Item={'DedupKey': {'S': key}, 'Status': {'S': 'DONE'}, 'Result': {'S': result}, 'ExpiresAt': {'N': str(int(time.time() + WINDOW_SECONDS))}}
+        )
+
+    def release(self, key: str):
+        self.dynamodb.delete_item(TableName=self.tableName, Key={'DedupKey': {'S': key}})
+
+    def get(self, key: str):
+        #Returns (status, result), or None when there is no live lock
+        item = self.dynamodb.get_item(TableName=self.tableName, Key={'DedupKey': {'S': key}}).get('Item')
+        if item is None or int(item['ExpiresAt']['N']) < time.time():
+            return None
+        return item['Status']['S'], item.get('Result', {}).get('S')
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'finished')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = None
+
+class SingleFlight:
+
+    def __init__(self, lockTable=None):
+        self.lockTable = lockTable
+        self.executions = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _shared(self, key: str, function):
+
+        #Only the container holding the table lock runs function, the others wait for its result
+        while True:
+            try:
+                acquired = self.lockTable.acquire(key)
+            except Exception as e:
+                logger.warning(f'Lock table unavailable, running {key} without it: {e}')
+                return self._execute(function)
+            if acquired:
+                try:
+                    result = self._execute(function)
+                except Exception:
+                    self.lockTable.release(key)
+                    raise
+                self.lockTable.complete(key, result)
+                return result
+
+            def settled():
+                state = self.lockTable.get(key)
+                if state is None:
+                    return ('GONE', None)
+                return state if state[0] == 'DONE' else None
+
+            #The wait ends before the invocation's deadline, so the caller can still record the outcome
+            waitSeconds = min(LOCK_TIMEOUT_SECONDS, deadline.remaining())
+            if waitSeconds <= 0:
+                raise LockWaitTimeout(f'{key} is still running in another container')
+            try:
+                state = readiness.wait_until(settled, f'{key} completes in another container', timeout=waitSeconds)
+            except readiness.NotReadyError:
+                raise LockWaitTimeout(f'{key} is still running in another container')
+            if state[0] == 'DONE':
+                logger.info(f'Reusing the result of {key} from another container')
+                return state[1]
+            #The holder failed or its lock expired, try to take over
+
+    def _execute(self, function):
+        self.executions += 1
+        return function()
+
+    def do(self, key: str, function, shared: bool = True):
+
+        #Runs function once per key for concurrent and closely spaced callers and returns its result.
+        #With shared and a lock table the result must be a string, it is handed to other containers.
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and (call.error is not None or time.monotonic() - call.finished > WINDOW_SECONDS):
+                call = None
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if shared and self.lockTable is not None:
+                call.result = self._shared(key, function)
+            else:
+                call.result = self._execute(function)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.finished = time.monotonic()
+            call.done.set()
+
+_singleFlight = None
+_singleFlightLock = threading.Lock()
+
+def get_single_flight():
+    global _singleFlight
+    if _singleFlight is None:
+        with _singleFlightLock:
+            if _singleFlight is None:
+                _singleFlight = SingleFlight(LockTable() if TABLE_NAME else None)
+    return _singleFlight
@@ -18,22 +18,108 @@
  # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
  
-import json
-import boto3
 import os
 import logging
+import threading
+import collections
+
+from common import client_registry
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+#single: one Publish per message (default)
+#batch: PublishBatch with up to 10 messages per call
+#digest: one message per control and account, sent with PublishBatch
+NOTIFICATION_MODE = os.environ.get('SNS_NOTIFICATION_MODE', 'single').lower()
+#PublishBatch accepts at most 10 entries per request
+MAX_BATCH_ENTRIES = 10
+MAX_DIGEST_LINES = 50
+
 def sendSNSNotification(AlertSnsArn: str, msg):
    
-   client = boto3.client('sns')
+   client = client_registry.get_client('sns')
 
    response = client.publish(
       TopicArn=AlertSnsArn,
       Message=msg 
    )
 
-   logger.info(response)
-   logger.info(msg) 
+   logger.info(f"Published notification {response['MessageId']}: {msg}")
+
+def sendSNSNotificationBatch(AlertSnsArn: str, msgs):
+
+   #Returns the indexes of the messages that could not be published
+   client = client_registry.get_client('sns')
+   failed = []
+
+   for start in range(0, len(msgs), MAX_BATCH_ENTRIES):
+      entries = [{'Id': str(index), 'Message': msgs[index]} for index in range(start, min(start + MAX_BATCH_ENTRIES, len(msgs)))]
+      try:
+         response = client.publish_batch(TopicArn=AlertSnsArn, PublishBatchRequestEntries=entries)
+      except Exception as e:
+         logger.error(f'Publishing {len(entries)} notifications failed: {e}')
+         failed.extend(int(entry['Id']) for entry in entries)
+         continue
+      for entry in response.get('Failed', []):
+         logger.error(f"Publishing notification {entry['Id']} failed: {entry.get('Code')} {entry.get('Message', '')}")
+         failed.append(int(entry['Id']))
+      logger.info(f"Published {len(response.get('Successful', []))} of {len(entries)} notifications")
+
+   return failed
+
+def _digest_message(control: str, accountId: str, findingIds):
+   lines = [f'Security Hub Finding: {control} has been successfully responded to and resolved for {len(findingIds)} findings in account {accountId}.']
+   lines.extend(f'Finding Id: {findingId}' for findingId in findingIds[:MAX_DIGEST_LINES])
+   if len(findingIds) > MAX_DIGEST_LINES:
+      lines.append(f'... and {len(findingIds) - MAX_DIGEST_LINES} more')
+   return '\n'.join(lines)
+
+class SNSNotifier:
+
+   #Collects the notifications of an invocation and sends them according to SNS_NOTIFICATION_MODE.
+   #Each notification is registered under a key, flush() returns the keys of this notifier that could not be sent.
+   def __init__(self, alertSnsArn: str, mode: str = None):
+      self.alertSnsArn = alertSnsArn
+      self.mode = (mode or NOTIFICATION_MODE).lower()
+      self._messages = []
+      self._digests = collections.OrderedDict()
+      self._lock = threading.Lock()
+
+   def add(self, key, msg: str, control: str = None, accountId: str = None):
+      with self._lock:
+         if self.mode == 'digest':
+            self._digests.setdefault((control, accountId), []).append(key)
+         else:
+            self._messages.append((key, msg))
+
+   def _flush_digests(self):
+      #Digests are sent by the invocation that resolved their findings, nothing is held for later invocations
+      #because a container can be recycled at any time between them
+      with self._lock:
+         digests, self._digests = list(self._digests.items()), collections.OrderedDict()
+
+      msgs = [_digest_message(control, accountId, keys) for (control, accountId), keys in digests]
+      failed = []
+      for index in sendSNSNotificationBatch(self.alertSnsArn, msgs):
+         failed.extend(digests[index][1])
+      return failed
+
+   def flush(self):
+      if self.mode == 'digest':
+         return self._flush_digests()
+
+      with self._lock:
+         messages, self._messages = self._messages, []
+
+      if self.mode == 'batch':
+         return [messages[index][0] for index in sendSNSNotificationBatch(self.alertSnsArn, [msg for key, msg in messages])]
+
+      failed = []
+      for key, msg in messages:
+         try:
+            sendSNSNotification(self.alertSnsArn, msg)
+         except Exception as e:
+            logger.error(f'Publishing notification failed: {e}')
+            failed.append(key)
+      return failed
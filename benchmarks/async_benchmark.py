@@ -0,0 +1,133 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+#Compares the execution modes of common/finding_runner.py on a synthetic event. AWS calls are replaced
+#with stand-ins that sleep for the given latency, so only scheduling and overlap are measured.
+#
+#  python benchmarks/async_benchmark.py --findings 200 --accounts 10 --latency-ms 50 --calls 3
+
+import os
+import sys
+import json
+import time
+import argparse
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Functions', 'master-account')
+sys.path.insert(0, FUNCTIONS_DIR)
+os.environ.setdefault('AWS_LAMBDA_FUNCTION_NAME', 'async-benchmark')
+os.environ.setdefault('AlertSnsArn', 'arn:aws:sns:us-east-1:111111111111:async-benchmark')
+
+from common import account_session
+from common import client_registry
+from common import finding_runner
+from common import async_engine
+from common import metrics
+from common import dedup_store
+from common import sns_notification
+
+class LatencyClient:
+
+    #Answers the calls the runner makes after sleeping like a round trip to AWS would
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def batch_update_findings(self, FindingIdentifiers, **kwargs):
+        self._call()
+        return {'ProcessedFindings': FindingIdentifiers, 'UnprocessedFindings': []}
+
+    def publish(self, **kwargs):
+        self._call()
+        return {'MessageId': str(self.calls)}
+
+    def publish_batch(self, PublishBatchRequestEntries, **kwargs):
+        self._call()
+        return {'Successful': [{'Id': entry['Id']} for entry in PublishBatchRequestEntries], 'Failed': []}
+
+    def remediate(self):
+        self._call()
+
+def make_event(findings: int, accounts: int):
+    return {'detail': {'findings': [{
+        'Id': f'finding-{index}',
+        'AwsAccountId': str(100000000000 + index % accounts),
+        'ProductArn': 'arn:aws:securityhub:us-east-1::product/aws/securityhub',
+        'Title': 'Benchmark control',
+        'UpdatedAt': '2020-01-01T00:00:00.000Z',
+        'Resources': [{'Type': 'AwsAccount', 'Id': f'AWS::::Account:{100000000000 + index % accounts}'}]
+    } for index in range(findings)]}}
+
+def run_mode(mode: str, event, latency: float, calls: int):
+    client = LatencyClient(latency)
+    account_session.get_session = lambda accountId, roleName, region=None: (time.sleep(latency), accountId)[1]
+    client_registry.get_client = lambda serviceName, session=None, region=None: client
+
+    def remediate_finding(finding, session):
+        for _ in range(calls):
+            client.remediate()
+        return 'Benchmark remediation'
+
+    finding_runner.MAX_WORKERS = 1 if mode == 'sequential' else int(os.environ.get('FINDING_MAX_WORKERS', '8'))
+    start = time.perf_counter()
+    if mode == 'asyncio':
+        response = async_engine.run_findings(event, remediate_finding, 'benchmark')
+    else:
+        response = finding_runner.run_findings(event, remediate_finding, 'benchmark')
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for result in response['results']:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    return {'elapsedSeconds': round(elapsed, 3), 'findingsPerSecond': round(len(response['results']) / elapsed, 1), 'apiCalls': client.calls, 'statuses': statuses}
+
+def main():
+    parser = argparse.ArgumentParser(description='Sequential, thread pool and asyncio execution of one synthetic event')
+    parser.add_argument('--findings', type=int, default=200)
+    parser.add_argument('--accounts', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=50, help='simulated latency of every AWS call')
+    parser.add_argument('--calls', type=int, default=3, help='simulated member account calls per remediation')
+    parser.add_argument('--modes', default='sequential,threads,asyncio')
+    parser.add_argument('--output', help='write results as JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    #Notifications are published one by one, like the default configuration, and every mode processes the same event
+    sns_notification.NOTIFICATION_MODE = 'single'
+    dedup_store.BACKEND = 'none'
+    #EMF records would end up in the JSON written to stdout
+    metrics.ENABLED = False
+    event = make_event(args.findings, args.accounts)
+    results = {}
+    for mode in args.modes.split(','):
+        results[mode] = run_mode(mode, event, args.latency_ms / 1000, args.calls)
+        print(f"{mode}: {results[mode]['elapsedSeconds']}s, {results[mode]['findingsPerSecond']} findings/s", file=sys.stderr)
+
+    report = {'findings': args.findings, 'accounts': args.accounts, 'latencyMs': args.latency_ms, 'callsPerFinding': args.calls, 'modes': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+#Replays the same Security Hub event several times, the way repeated "Findings - Imported" events arrive,
+#and counts the AWS calls made with each dedup backend. The dynamodb backend runs against local_dynamodb.py.
+#
+#  python benchmarks/dedup_benchmark.py --findings 50 --replays 5
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from async_benchmark import LatencyClient, make_event
+from local_dynamodb import LocalDynamoDB
+
+from common import account_session
+from common import client_registry
+from common import finding_runner
+from common import metrics
+from common import dedup_store
+from common import sns_notification
+
+def run_backend(backend: str, event, replays: int, latency: float):
+    client = LatencyClient(latency)
+    assumed = []
+    account_session.get_session = lambda accountId, roleName, region=None: (assumed.append(accountId), time.sleep(latency), accountId)[-1]
+    client_registry.get_client = lambda serviceName, session=None, region=None: client
+    remediations = []
+
+    def remediate_finding(finding, session):
+        remediations.append(finding.id)
+        client.remediate()
+        return 'Benchmark remediation'
+
+    table = LocalDynamoDB()
+    if backend == 'none':
+        dedup_store.set_store(None)
+        dedup_store.BACKEND = 'none'
+    elif backend == 'memory':
+        dedup_store.set_store(dedup_store.MemoryDedupStore())
+    else:
+        dedup_store.set_store(dedup_store.DynamoDBDedupStore('dedup-benchmark', dynamodb=table))
+
+    statuses = {}
+    start = time.perf_counter()
+    for _ in range(replays):
+        for result in finding_runner.run_findings(event, remediate_finding, 'benchmark')['results']:
+            statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    elapsed = time.perf_counter() - start
+    return {
+        'elapsedSeconds': round(elapsed, 3),
+        'assumeRoleCalls': len(assumed),
+        'remediations': len(remediations),
+        'awsCalls': client.calls + len(assumed),
+        'dedupTableCalls': table.calls,
+        'statuses': statuses
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='AWS calls made for repeated events with each dedup backend')
+    parser.add_argument('--findings', type=int, default=50)
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--replays', type=int, default=5, help='times the same event is delivered')
+    parser.add_argument('--latency-ms', type=float, default=10, help='simulated latency of every AWS call')
+    parser.add_argument('--output', help='write results as JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    sns_notification.NOTIFICATION_MODE = 'single'
+    #EMF records would end up in the JSON written to stdout
+    metrics.ENABLED = False
+    event = make_event(args.findings, args.accounts)
+    results = {}
+    for backend in ('none', 'memory', 'dynamodb'):
+        results[backend] = run_backend(backend, event, args.replays, args.latency_ms / 1000)
+        print(f"{backend}: {results[backend]['awsCalls']} AWS calls, {results[backend]['elapsedSeconds']}s", file=sys.stderr)
+
+    report = {'findings': args.findings, 'replays': args.replays, 'latencyMs': args.latency_ms, 'backends': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
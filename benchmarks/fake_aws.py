@@ -0,0 +1,356 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+
+#In-memory stand-in for the member account APIs the playbooks call. It is attached to real botocore clients
+#through the same before-call hook Stubber uses, so requests never leave the process, but every call still goes
+#through parameter validation, client side hooks and error handling. Resources are seeded from the findings
+#in their non compliant state and change as the playbooks remediate them.
+
+import io
+import csv
+import json
+import time
+import uuid
+import random
+import datetime
+import threading
+import collections
+
+from botocore.awsrequest import AWSResponse
+
+MASTER_ACCOUNT = '111111111111'
+
+class FakeError(Exception):
+    def __init__(self, code: str, message: str = ''):
+        super().__init__(message or code)
+        self.code = code
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _name(trail: str):
+    #Trails are passed by name or ARN
+    return trail.split('/')[-1].split(':')[-1]
+
+class FakeAWS:
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self.passwordPolicies = {}
+        self.accessKeys = collections.defaultdict(list)
+        self.trails = {}
+        self.buckets = {}
+        self.keys = {}
+        self.aliases = {}
+        self.logGroups = set()
+        self.flowLogs = collections.defaultdict(list)
+        self.securityGroups = {}
+        self.executions = {}
+
+    #Seeding
+
+    def seed(self, finding):
+        account = finding['AwsAccountId']
+        resource = finding['Resources'][0]
+        region = resource.get('Region', finding.get('Region'))
+        with self._lock:
+            if resource['Type'] == 'AwsIamUser':
+                userName = resource['Id'].split('/')[-1]
+                if not self.accessKeys[(account, userName)]:
+                    self.accessKeys[(account, userName)].append({'UserName': userName, 'AccessKeyId': 'AKIA' + uuid.uuid4().hex[:16].upper(), 'Status': 'Active', 'CreateDate': _now() - datetime.timedelta(days=200)})
+            elif resource['Type'] == 'AwsCloudTrailTrail':
+                name = _name(resource['Id'])
+                self.trails.setdefault((account, name), {'Name': name, 'TrailARN': resource['Id'], 'HomeRegion': region, 'S3BucketName': 'cloudtrail-' + account, 'LogFileValidationEnabled': False})
+            elif resource['Type'] == 'AwsS3Bucket':
+                self.buckets.setdefault((account, resource['Id'].replace('arn:aws:s3:::', '')), {})
+            elif resource['Type'] == 'AwsKmsKey':
+                keyId = resource['Id'].replace('AWS::KMS::Key:', '')
+                self.keys.setdefault((account, region, keyId), {'Arn': f'arn:aws:kms:{region}:{account}:key/{keyId}', 'KeyId': keyId, 'KeyState': 'Enabled', 'Rotation': False})
+            elif resource['Type'] == 'AwsEc2SecurityGroup':
+                details = resource['Details']['AwsEc2SecurityGroup']
+                openPorts = [{'IpProtocol': 'tcp', 'FromPort': port, 'ToPort': port, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]} for port in (22, 3389)]
+                egress = [{'IpProtocol': '-1', 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}] if details['GroupName'] == 'default' else []
+                self.securityGroups.setdefault((account, region, details['GroupId']), {'GroupId': details['GroupId'], 'GroupName': details['GroupName'], 'IpPermissions': openPorts, 'IpPermissionsEgress': egress})
+
+    #Hooks
+
+    def attach(self, client, accountId: str = MASTER_ACCOUNT):
+        #Clients are cached by the registry, the hooks are registered once per client
+        if getattr(client, '_fakeAWS', None) is self:
+            return client
+        client._fakeAWS = self
+        region = client.meta.region_name
+        service = client.meta.service_model.service_name
+        eventService = client.meta.service_model.service_id.hyphenize()
+
+        def before_parameter_build(params=None, context=None, **kwargs):
+            context['fakeParams'] = dict(params)
+
+        def before_call(model=None, context=None, **kwargs):
+            return self._respond(service, model.name, context.get('fakeParams', {}), accountId, region)
+
+        client.meta.events.register(f'before-parameter-build.{eventService}', before_parameter_build)
+        client.meta.events.register(f'before-call.{eventService}', before_call)
+        return client
+
+    def _respond(self, service: str, operation: str, params, account: str, region: str):
+        if self.latency:
+            time.sleep(max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter))))
+        with self._lock:
+            self.calls[f'{service}.{operation}'] += 1
+        handler = getattr(self, f'{service}_{operation}', None)
+        try:
+            parsed = handler(account, region, **params) if handler else {}
+            status = 200
+        except FakeError as e:
+            parsed = {'Error': {'Code': e.code, 'Message': str(e)}}
+            status = 400
+        parsed['ResponseMetadata'] = {'RequestId': str(uuid.uuid4()), 'HTTPStatusCode': status, 'HTTPHeaders': {}, 'RetryAttempts': 0}
+        return AWSResponse(None, status, {}, None), parsed
+
+    def api_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    #STS, Security Hub and SNS
+
+    def sts_AssumeRole(self, account, region, RoleArn, **kwargs):
+        memberAccount = RoleArn.split(':')[4]
+        return {'Credentials': {'AccessKeyId': 'ASIA' + memberAccount, 'SecretAccessKey': 'fake', 'SessionToken': 'fake', 'Expiration': _now() + datetime.timedelta(hours=1)}}
+
+    def securityhub_BatchUpdateFindings(self, account, region, FindingIdentifiers, **kwargs):
+        return {'ProcessedFindings': FindingIdentifiers, 'UnprocessedFindings': []}
+
+    def sns_Publish(self, account, region, **kwargs):
+        return {'MessageId': str(uuid.uuid4())}
+
+    def sns_PublishBatch(self, account, region, PublishBatchRequestEntries, **kwargs):
+        return {'Successful': [{'Id': entry['Id'], 'MessageId': str(uuid.uuid4())} for entry in PublishBatchRequestEntries], 'Failed': []}
+
+    #IAM
+
+    def iam_GetAccountPasswordPolicy(self, account, region, **kwargs):
+        with self._lock:
+            policy = self.passwordPolicies.get(account)
+        if policy is None:
+            raise FakeError('NoSuchEntity', f'The Password Policy with domain name {account} cannot be found.')
+        return {'PasswordPolicy': dict(policy)}
+
+    def iam_UpdateAccountPasswordPolicy(self, account, region, **policy):
+        with self._lock:
+            self.passwordPolicies[account] = policy
+        return {}
+
+    def iam_ListAccessKeys(self, account, region, UserName, **kwargs):
+        with self._lock:
+            return {'AccessKeyMetadata': [dict(key) for key in self.accessKeys[(account, UserName)]], 'IsTruncated': False}
+
+    def iam_UpdateAccessKey(self, account, region, UserName, AccessKeyId, Status, **kwargs):
+        with self._lock:
+            for key in self.accessKeys[(account, UserName)]:
+                if key['AccessKeyId'] == AccessKeyId:
+                    key['Status'] = Status
+                    return {}
+        raise FakeError('NoSuchEntity', f'The Access Key with id {AccessKeyId} cannot be found.')
+
+    def iam_GenerateCredentialReport(self, account, region, **kwargs):
+        return {'State': 'COMPLETE'}
+
+    def iam_GetCredentialReport(self, account, region, **kwargs):
+        content = io.StringIO()
+        writer = csv.writer(content)
+        writer.writerow(['user', 'access_key_1_active', 'access_key_1_last_rotated', 'access_key_2_active', 'access_key_2_last_rotated'])
+        with self._lock:
+            for (keyAccount, userName), keys in self.accessKeys.items():
+                if keyAccount != account:
+                    continue
+                slots = [(str(key['Status'] == 'Active').lower(), key['CreateDate'].isoformat()) for key in keys[:2]]
+                slots += [('false', 'N/A')] * (2 - len(slots))
+                writer.writerow([userName, slots[0][0], slots[0][1], slots[1][0], slots[1][1]])
+        return {'Content': content.getvalue().encode('utf-8'), 'ReportFormat': 'text/csv', 'GeneratedTime': _now()}
+
+    #CloudTrail and CloudWatch Logs
+
+    def _trail(self, account, trail):
+        found = self.trails.get((account, _name(trail)))
+        if found is None:
+            raise FakeError('TrailNotFoundException', f'Unknown trail: {trail}')
+        return found
+
+    def cloudtrail_DescribeTrails(self, account, region, trailNameList=(), **kwargs):
+        with self._lock:
+            return {'trailList': [dict(self.trails[(account, _name(trail))]) for trail in trailNameList if (account, _name(trail)) in self.trails]}
+
+    def cloudtrail_UpdateTrail(self, account, region, Name, **settings):
+        with self._lock:
+            trail = self._trail(account, Name)
+            #arn:aws:logs:<region>:<account>:log-group:<name>:*
+            logGroupArn = settings.get('CloudWatchLogsLogGroupArn', '').split(':')
+            if len(logGroupArn) > 6 and (logGroupArn[4], logGroupArn[3], logGroupArn[6]) not in self.logGroups:
+                raise FakeError('InvalidCloudWatchLogsLogGroupArnException', f"Log group {logGroupArn[6]} does not exist")
+            if 'EnableLogFileValidation' in settings:
+                trail['LogFileValidationEnabled'] = settings.pop('EnableLogFileValidation')
+            trail.update(settings)
+            return dict(trail)
+
+    def logs_CreateLogGroup(self, account, region, logGroupName, **kwargs):
+        with self._lock:
+            if (account, region, logGroupName) in self.logGroups:
+                raise FakeError('ResourceAlreadyExistsException', 'The specified log group already exists')
+            self.logGroups.add((account, region, logGroupName))
+        return {}
+
+    #S3 and Systems Manager
+
+    def s3_GetPublicAccessBlock(self, account, region, Bucket, **kwargs):
+        with self._lock:
+            configuration = self.buckets.get((account, Bucket), {}).get('PublicAccessBlock')
+        if configuration is None:
+            raise FakeError('NoSuchPublicAccessBlockConfiguration', 'The public access block configuration was not found')
+        return {'PublicAccessBlockConfiguration': configuration}
+
+    def s3_GetBucketLogging(self, account, region, Bucket, **kwargs):
+        with self._lock:
+            logging = self.buckets.get((account, Bucket), {}).get('LoggingEnabled')
+        return {'LoggingEnabled': logging} if logging else {}
+
+    def ssm_StartAutomationExecution(self, account, region, DocumentName, Parameters=None, TargetParameterName=None, Targets=(), **kwargs):
+        #Automations complete at once, so playbooks see them succeed on the first poll
+        executionId = str(uuid.uuid4())
+        values = [value for target in Targets for value in target['Values']]
+        with self._lock:
+            self.executions[executionId] = {'AutomationExecutionId': executionId, 'DocumentName': DocumentName, 'AutomationExecutionStatus': 'Success'}
+            if TargetParameterName:
+                self.executions[executionId]['TargetParameterName'] = TargetParameterName
+                for value in values:
+                    childId = str(uuid.uuid4())
+                    self.executions[childId] = {'AutomationExecutionId': childId, 'DocumentName': DocumentName, 'AutomationExecutionStatus': 'Success', 'ParentAutomationExecutionId': executionId, 'Target': value}
+        return {'AutomationExecutionId': executionId}
+
+    def ssm_GetAutomationExecution(self, account, region, AutomationExecutionId, **kwargs):
+        with self._lock:
+            execution = self.executions.get(AutomationExecutionId)
+        if execution is None:
+            raise FakeError('AutomationExecutionNotFoundException', f'Execution {AutomationExecutionId} not found')
+        return {'AutomationExecution': dict(execution)}
+
+    def ssm_DescribeAutomationExecutions(self, account, region, Filters=(), **kwargs):
+        parents = {value for filter in Filters if filter['Key'] == 'ParentExecutionId' for value in filter['Values']}
+        with self._lock:
+            return {'AutomationExecutionMetadataList': [dict(execution) for execution in self.executions.values() if execution.get('ParentAutomationExecutionId') in parents]}
+
+    #KMS
+
+    def _key(self, account, region, keyId):
+        if keyId.startswith('alias/'):
+            keyId = self.aliases.get((account, region, keyId))
+        key = self.keys.get((account, region, (keyId or '').split('/')[-1]))
+        if key is None:
+            raise FakeError('NotFoundException', f'Key {keyId} does not exist')
+        return key
+
+    def kms_DescribeKey(self, account, region, KeyId, **kwargs):
+        with self._lock:
+            key = self._key(account, region, KeyId)
+            return {'KeyMetadata': {'Arn': key['Arn'], 'KeyId': key['KeyId'], 'KeyState': key['KeyState']}}
+
+    def kms_CreateKey(self, account, region, Policy=None, **kwargs):
+        keyId = str(uuid.uuid4())
+        with self._lock:
+            key = self.keys[(account, region, keyId)] = {'Arn': f'arn:aws:kms:{region}:{account}:key/{keyId}', 'KeyId': keyId, 'KeyState': 'Enabled', 'Rotation': False, 'Policy': Policy}
+            return {'KeyMetadata': {'Arn': key['Arn'], 'KeyId': keyId, 'KeyState': 'Enabled'}}
+
+    def kms_CreateAlias(self, account, region, AliasName, TargetKeyId, **kwargs):
+        with self._lock:
+            if (account, region, AliasName) in self.aliases:
+                raise FakeError('AlreadyExistsException', f'Alias {AliasName} already exists')
+            self.aliases[(account, region, AliasName)] = TargetKeyId.split('/')[-1]
+        return {}
+
+    def kms_GetKeyPolicy(self, account, region, KeyId, **kwargs):
+        with self._lock:
+            return {'Policy': self._key(account, region, KeyId).get('Policy') or json.dumps({'Statement': []})}
+
+    def kms_PutKeyPolicy(self, account, region, KeyId, Policy, **kwargs):
+        with self._lock:
+            self._key(account, region, KeyId)['Policy'] = Policy
+        return {}
+
+    def kms_GetKeyRotationStatus(self, account, region, KeyId, **kwargs):
+        with self._lock:
+            return {'KeyRotationEnabled': self._key(account, region, KeyId)['Rotation']}
+
+    def kms_EnableKeyRotation(self, account, region, KeyId, **kwargs):
+        with self._lock:
+            self._key(account, region, KeyId)['Rotation'] = True
+        return {}
+
+    def kms_ScheduleKeyDeletion(self, account, region, KeyId, **kwargs):
+        with self._lock:
+            self._key(account, region, KeyId)['KeyState'] = 'PendingDeletion'
+        return {}
+
+    #EC2
+
+    def ec2_DescribeFlowLogs(self, account, region, Filter=(), **kwargs):
+        #botocore renames the Filters argument of DescribeFlowLogs to Filter
+        filters = {filter['Name']: set(filter['Values']) for filter in Filter}
+        with self._lock:
+            flowLogs = [dict(flowLog) for flowLog in self.flowLogs[(account, region)]
+                        if flowLog['ResourceId'] in filters.get('resource-id', {flowLog['ResourceId']})
+                        and flowLog['LogGroupName'] in filters.get('log-group-name', {flowLog['LogGroupName']})]
+        return {'FlowLogs': flowLogs}
+
+    def ec2_CreateFlowLogs(self, account, region, ResourceIds, LogGroupName=None, **kwargs):
+        flowLogIds = []
+        with self._lock:
+            for resourceId in ResourceIds:
+                flowLogId = 'fl-' + uuid.uuid4().hex[:17]
+                self.flowLogs[(account, region)].append({'FlowLogId': flowLogId, 'ResourceId': resourceId, 'LogGroupName': LogGroupName, 'FlowLogStatus': 'ACTIVE'})
+                flowLogIds.append(flowLogId)
+        return {'FlowLogIds': flowLogIds, 'Unsuccessful': []}
+
+    def ec2_DescribeSecurityGroups(self, account, region, GroupIds=(), Filters=(), **kwargs):
+        names = {value for filter in Filters if filter['Name'] == 'group-name' for value in filter['Values']}
+        with self._lock:
+            groups = [group for (groupAccount, groupRegion, groupId), group in self.securityGroups.items()
+                      if groupAccount == account and groupRegion == region
+                      and (not GroupIds or groupId in GroupIds) and (not names or group['GroupName'] in names)]
+            if GroupIds and len(groups) < len(set(GroupIds)):
+                raise FakeError('InvalidGroup.NotFound', f'The security group does not exist in {region}')
+            return {'SecurityGroups': [json.loads(json.dumps(group)) for group in groups]}
+
+    def _revoke(self, account, region, GroupId, permissionsKey):
+        with self._lock:
+            group = self.securityGroups.get((account, region, GroupId))
+            if group is None:
+                raise FakeError('InvalidGroup.NotFound', f'The security group {GroupId} does not exist')
+            group[permissionsKey] = []
+        return {'Return': True}
+
+    def ec2_RevokeSecurityGroupIngress(self, account, region, GroupId, **kwargs):
+        return self._revoke(account, region, GroupId, 'IpPermissions')
+
+    def ec2_RevokeSecurityGroupEgress(self, account, region, GroupId, **kwargs):
+        return self._revoke(account, region, GroupId, 'IpPermissionsEgress')
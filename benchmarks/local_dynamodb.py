@@ -0,0 +1,88 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+#In-memory stand-in for the DynamoDB calls common/dedup_store.py makes, so the shared table backend can be
+#exercised without AWS or DynamoDB Local. Only the condition expressions the store uses are understood.
+
+import re
+import threading
+
+from botocore.exceptions import ClientError
+
+class LocalDynamoDB:
+
+    def __init__(self):
+        self.tables = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _table(self, TableName):
+        return self.tables.setdefault(TableName, {})
+
+    def _condition(self, item, expression, values):
+        #Supports attribute_not_exists(a) and a < :v clauses joined by OR
+        for clause in re.split(r'\s+OR\s+', expression):
+            clause = clause.strip()
+            notExists = re.fullmatch(r'attribute_not_exists\((\w+)\)', clause)
+            if notExists:
+                if item is None or notExists.group(1) not in item:
+                    return True
+                continue
+            lessThan = re.fullmatch(r'(\w+)\s*<\s*(:\w+)', clause)
+            if not lessThan:
+                raise ValueError(f'Unsupported condition {clause}')
+            if item is not None and lessThan.group(1) in item and float(item[lessThan.group(1)]['N']) < float(values[lessThan.group(2)]['N']):
+                return True
+        return False
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeValues=None):
+        with self._lock:
+            self.calls += 1
+            table = self._table(TableName)
+            key = Item['DedupKey']['S']
+            if ConditionExpression and not self._condition(table.get(key), ConditionExpression, ExpressionAttributeValues or {}):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}}, 'PutItem')
+            table[key] = dict(Item)
+            return {}
+
+    def get_item(self, TableName, Key):
+        with self._lock:
+            self.calls += 1
+            item = self._table(TableName).get(Key['DedupKey']['S'])
+            return {'Item': dict(item)} if item else {}
+
+    def delete_item(self, TableName, Key):
+        with self._lock:
+            self.calls += 1
+            self._table(TableName).pop(Key['DedupKey']['S'], None)
+            return {}
+
+    def batch_write_item(self, RequestItems):
+        #Only put requests, every item is processed
+        with self._lock:
+            self.calls += 1
+            for tableName, requests in RequestItems.items():
+                if len(requests) > 25:
+                    raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'Too many items requested for the BatchWriteItem call'}}, 'BatchWriteItem')
+                table = self._table(tableName)
+                for request in requests:
+                    item = request['PutRequest']['Item']
+                    table[item['DedupKey']['S']] = dict(item)
+            return {'UnprocessedItems': {}}
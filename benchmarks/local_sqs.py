@@ -0,0 +1,96 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+#In-memory stand-in for an SQS queue with a dead letter queue, and for the Lambda event source mapping that
+#polls it, so cis/cis_sqs_consumer_lambda.py can be exercised without AWS. Visibility timeouts elapse at once:
+#a message reported in batchItemFailures is received again by the next poll.
+
+import json
+import uuid
+import collections
+
+class LocalQueue:
+
+    def __init__(self, maxReceiveCount: int = 5, arn: str = 'arn:aws:sqs:us-east-1:111111111111:local-queue'):
+        self.maxReceiveCount = maxReceiveCount
+        self.arn = arn
+        self.messages = collections.OrderedDict()
+        self.deadLetters = []
+        self.sent = 0
+        self.received = 0
+
+    def send_message(self, MessageBody: str):
+        messageId = str(uuid.uuid4())
+        self.messages[messageId] = {'messageId': messageId, 'body': MessageBody, 'receiveCount': 0}
+        self.sent += 1
+        return {'MessageId': messageId}
+
+    def send_event(self, event):
+        #What an EventBridge rule with the queue as target sends
+        return self.send_message(json.dumps(event))
+
+    def receive(self, batchSize: int):
+        #One batch in the shape of the Lambda SQS event, messages stay in the queue until completed
+        records = []
+        for message in list(self.messages.values())[:batchSize]:
+            message['receiveCount'] += 1
+            self.received += 1
+            records.append({
+                'messageId': message['messageId'],
+                'receiptHandle': message['messageId'],
+                'body': message['body'],
+                'attributes': {'ApproximateReceiveCount': str(message['receiveCount'])},
+                'messageAttributes': {},
+                'eventSource': 'aws:sqs',
+                'eventSourceARN': self.arn,
+                'awsRegion': self.arn.split(':')[3]
+            })
+        return {'Records': records}
+
+    def complete(self, event, response):
+        #Deletes the messages the consumer did not report as failed. A consumer that raised fails the
+        #whole batch, failed messages move to the dead letter queue after maxReceiveCount receives.
+        if response is None:
+            failed = {record['messageId'] for record in event['Records']}
+        else:
+            failed = {failure['itemIdentifier'] for failure in response.get('batchItemFailures', [])}
+        for record in event['Records']:
+            message = self.messages[record['messageId']]
+            if record['messageId'] not in failed:
+                del self.messages[record['messageId']]
+            elif message['receiveCount'] >= self.maxReceiveCount:
+                del self.messages[record['messageId']]
+                self.deadLetters.append(message)
+        return failed
+
+    def drain(self, handler, batchSize: int = 10, beforeBatch=None):
+        #Polls like the event source mapping until the queue is empty, returns the number of invocations
+        invocations = 0
+        while self.messages:
+            event = self.receive(batchSize)
+            if beforeBatch is not None:
+                beforeBatch()
+            try:
+                response = handler(event, None)
+            except Exception:
+                response = None
+            invocations += 1
+            self.complete(event, response)
+        return invocations
@@ -0,0 +1,279 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+
+#Replays synthetic Security Hub events through the lambda_handler of every playbook, in process, against the
+#in-memory member account APIs in fake_aws.py with the given latency per call. Reports invocation latency
+#percentiles, API calls per finding and findings per second for each playbook as JSON.
+#
+#  python benchmarks/replay_benchmark.py --findings 20 --events 10 --accounts 5 --regions 2 --latency-ms 20
+#  python benchmarks/replay_benchmark.py --output new.json --baseline old.json
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import itertools
+import datetime
+import contextlib
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Functions', 'master-account')
+sys.path.insert(0, FUNCTIONS_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+#Configuration the response stack gives every function, and credentials that are never used
+for name, value in {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'replay',
+    'AWS_SECRET_ACCESS_KEY': 'replay',
+    'AWS_LAMBDA_FUNCTION_NAME': 'replay-benchmark',
+    'AlertSnsArn': 'arn:aws:sns:us-east-1:111111111111:replay-benchmark',
+    'TargetAccountSecurityRoleName': 'replay-benchmark',
+    'LambdaResponseRoleNamePrefix': 'replay-benchmark',
+    'ACCESS_LOGGING_BUCKET': 'access-logging-111111111111',
+    'CLOUDTRAIL_CW_LOGGING_ROLE_NAME': 'replay-cloudtrail-logging',
+    'FLOW_LOG_ROLE_NAME': 'replay-flow-logs'
+}.items():
+    os.environ.setdefault(name, value)
+
+from fake_aws import FakeAWS, MASTER_ACCOUNT
+from common import metrics
+from common import account_session
+from common import client_registry
+from common import finding_runner
+from cis import cis_playbook_registry
+
+CONTROLS = {
+    '1.3': 'AwsIamUser', '1.4': 'AwsIamUser',
+    '1.5': 'AwsAccount', '1.6': 'AwsAccount', '1.7': 'AwsAccount', '1.8': 'AwsAccount', '1.9': 'AwsAccount', '1.10': 'AwsAccount', '1.11': 'AwsAccount',
+    '2.2': 'AwsCloudTrailTrail', '2.4': 'AwsCloudTrailTrail', '2.7': 'AwsCloudTrailTrail',
+    '2.3': 'AwsS3Bucket', '2.6': 'AwsS3Bucket',
+    '2.8': 'AwsKmsKey',
+    '2.9': 'AwsEc2Vpc',
+    '4.1': 'AwsEc2SecurityGroup', '4.2': 'AwsEc2SecurityGroup', '4.3': 'AwsEc2SecurityGroup'
+}
+
+#Resource numbers are never reused, so every finding of the run has its own non compliant resource
+_resourceNumbers = itertools.count()
+
+def _resource(control: str, account: str, region: str, index: int):
+    resourceType = CONTROLS[control]
+    resource = {'Type': resourceType, 'Partition': 'aws', 'Region': region}
+    if resourceType == 'AwsIamUser':
+        resource['Id'] = f'arn:aws:iam::{account}:user/replay-user-{index}'
+    elif resourceType == 'AwsAccount':
+        resource['Id'] = f'AWS::::Account:{account}'
+    elif resourceType == 'AwsCloudTrailTrail':
+        resource['Id'] = f'arn:aws:cloudtrail:{region}:{account}:trail/replay-trail-{index}'
+    elif resourceType == 'AwsS3Bucket':
+        resource['Id'] = f'arn:aws:s3:::replay-bucket-{account}-{index}'
+    elif resourceType == 'AwsKmsKey':
+        resource['Id'] = 'AWS::KMS::Key:' + str(uuid.UUID(int=index))
+    elif resourceType == 'AwsEc2Vpc':
+        resource['Id'] = f'arn:aws:ec2:{region}:{account}:vpc/vpc-{index:017x}'
+    else:
+        groupId = f'sg-{index:017x}'
+        resource['Id'] = f'arn:aws:ec2:{region}:{account}:security-group/{groupId}'
+        resource['Details'] = {'AwsEc2SecurityGroup': {'GroupId': groupId, 'GroupName': 'default' if control == '4.3' else f'replay-{index}'}}
+    return resource
+
+def make_finding(title: str, account: str, region: str, index: int):
+    #Shaped like the findings of the CIS AWS Foundations Benchmark v1.2.0 standard
+    control = title.split(' ')[0]
+    now = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    return {
+        'SchemaVersion': '2018-10-08',
+        'Id': f'arn:aws:securityhub:{region}:{account}:subscription/cis-aws-foundations-benchmark/v/1.2.0/{control}/finding/{uuid.uuid4()}',
+        'ProductArn': f'arn:aws:securityhub:{region}::product/aws/securityhub',
+        'GeneratorId': f'arn:aws:securityhub:::ruleset/cis-aws-foundations-benchmark/v/1.2.0/rule/{control}',
+        'AwsAccountId': account,
+        'Types': ['Software and Configuration Checks/Industry and Regulatory Standards/CIS AWS Foundations Benchmark'],
+        'FirstObservedAt': now,
+        'LastObservedAt': now,
+        'CreatedAt': now,
+        'UpdatedAt': now,
+        'Severity': {'Label': 'MEDIUM', 'Normalized': 40},
+        'Title': title,
+        'Description': title,
+        'Resources': [_resource(control, account, region, index)],
+        'Compliance': {'Status': 'FAILED'},
+        'Workflow': {'Status': 'NEW'},
+        'WorkflowState': 'NEW',
+        'RecordState': 'ACTIVE',
+        'Region': region
+    }
+
+def make_event(titles, findings: int, accounts: int, region: str):
+    #Findings rotate over the titles of the playbook and the accounts
+    eventFindings = [make_finding(titles[index % len(titles)], str(200000000000 + index % accounts), region, next(_resourceNumbers)) for index in range(findings)]
+    return {
+        'version': '0',
+        'id': str(uuid.uuid4()),
+        'detail-type': 'Security Hub Findings - Imported',
+        'source': 'aws.securityhub',
+        'account': MASTER_ACCOUNT,
+        'time': eventFindings[0]['UpdatedAt'][:19] + 'Z',
+        'region': region,
+        'resources': [finding['ProductArn'] for finding in eventFindings],
+        'detail': {'findings': eventFindings}
+    }
+
+def install(backend: FakeAWS):
+    #Every client the playbooks get from the registry answers from backend
+    getClient, getResource = client_registry.get_client, client_registry.get_resource
+
+    def get_client(serviceName, session=None, region=None):
+        return backend.attach(getClient(serviceName, session, region), getattr(session, 'accountId', MASTER_ACCOUNT))
+
+    def get_resource(serviceName, session=None, region=None):
+        resource = getResource(serviceName, session, region)
+        backend.attach(resource.meta.client, getattr(session, 'accountId', MASTER_ACCOUNT))
+        return resource
+
+    client_registry.get_client = get_client
+    client_registry.get_resource = get_resource
+
+def start_container(region: str):
+    #A fresh container in region, nothing cached from earlier playbooks
+    os.environ['AWS_DEFAULT_REGION'] = os.environ['AWS_REGION'] = region
+    client_registry.clear()
+    client_registry._defaultSession = None
+    account_session.clear_cache()
+
+def percentile(values, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def replay(playbook: str, backend: FakeAWS, events: int, findings: int, accounts: int, regions):
+    module = cis_playbook_registry.load_playbook(playbook)
+    titles = cis_playbook_registry.PLAYBOOKS[playbook]['titles']
+    callsBefore = dict(backend.calls)
+    latencies = []
+    statuses = {}
+    total = 0
+    misrouted = 0
+    elapsed = 0.0
+    for region in regions:
+        start_container(region)
+        for _ in range(events):
+            event = make_event(titles, findings, accounts, region)
+            for finding in event['detail']['findings']:
+                backend.seed(finding)
+            #Findings the EventBridge rules of the template would not send to this playbook
+            routes, _ = cis_playbook_registry.pattern_index().route(event)
+            misrouted += len(event['detail']['findings']) - len(routes.get(playbook, []))
+            start = time.perf_counter()
+            try:
+                results = module.lambda_handler(event, None)['results']
+            except finding_runner.RemediationError as e:
+                results = e.results
+            latency = time.perf_counter() - start
+            latencies.append(latency * 1000)
+            elapsed += latency
+            total += len(results)
+            for result in results:
+                statuses[result['status']] = statuses.get(result['status'], 0) + 1
+
+    calls = {operation: count - callsBefore.get(operation, 0) for operation, count in backend.calls.items() if count > callsBefore.get(operation, 0)}
+    apiCalls = sum(calls.values())
+    return {
+        'events': len(latencies),
+        'findings': total,
+        'p50Ms': round(percentile(latencies, 0.50), 2),
+        'p95Ms': round(percentile(latencies, 0.95), 2),
+        'p99Ms': round(percentile(latencies, 0.99), 2),
+        'findingsPerSecond': round(total / elapsed, 1) if elapsed else 0,
+        'apiCalls': apiCalls,
+        'apiCallsPerFinding': round(apiCalls / total, 2) if total else 0,
+        'statuses': statuses,
+        'misrouted': misrouted,
+        'apiCallsByOperation': dict(sorted(calls.items()))
+    }
+
+def regressions(current, baseline, tolerance: float):
+    found = []
+    for playbook, result in current['playbooks'].items():
+        previous = baseline['playbooks'].get(playbook)
+        if not previous:
+            continue
+        if result['findingsPerSecond'] < previous['findingsPerSecond'] * (1 - tolerance):
+            found.append(f"{playbook}: {previous['findingsPerSecond']} -> {result['findingsPerSecond']} findings/s")
+        if result['p95Ms'] > previous['p95Ms'] * (1 + tolerance):
+            found.append(f"{playbook}: p95 {previous['p95Ms']}ms -> {result['p95Ms']}ms")
+        if result['apiCallsPerFinding'] > previous['apiCallsPerFinding'] * (1 + tolerance):
+            found.append(f"{playbook}: {previous['apiCallsPerFinding']} -> {result['apiCallsPerFinding']} API calls per finding")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays synthetic Security Hub events through every playbook handler')
+    parser.add_argument('--findings', type=int, default=20, help='findings per event')
+    parser.add_argument('--events', type=int, default=10, help='events per playbook and region')
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--regions', default='us-east-1', help='comma separated, each region runs as its own container')
+    parser.add_argument('--latency-ms', type=float, default=20, help='simulated latency of every AWS call')
+    parser.add_argument('--jitter', type=float, default=0.2, help='latency varies by up to this fraction')
+    parser.add_argument('--playbooks', help='comma separated playbook modules, all by default')
+    parser.add_argument('--execution-mode', choices=['threads', 'asyncio'], default=finding_runner.EXECUTION_MODE)
+    parser.add_argument('--output', help='write results as JSON to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression against the baseline, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    #EMF records and the playbooks' own prints would end up in the JSON written to stdout
+    metrics.ENABLED = False
+    finding_runner.EXECUTION_MODE = args.execution_mode
+    backend = FakeAWS(args.latency_ms / 1000, args.jitter)
+    install(backend)
+
+    regions = args.regions.split(',')
+    playbooks = args.playbooks.split(',') if args.playbooks else list(cis_playbook_registry.PLAYBOOKS)
+    results = {}
+    for playbook in playbooks:
+        with contextlib.redirect_stdout(sys.stderr):
+            results[playbook] = replay(playbook, backend, args.events, args.findings, args.accounts, regions)
+        print(f"{playbook}: p95 {results[playbook]['p95Ms']}ms, {results[playbook]['findingsPerSecond']} findings/s, {results[playbook]['apiCallsPerFinding']} API calls per finding, {results[playbook]['statuses']}", file=sys.stderr)
+
+    current = {
+        'findingsPerEvent': args.findings,
+        'eventsPerRegion': args.events,
+        'accounts': args.accounts,
+        'regions': regions,
+        'latencyMs': args.latency_ms,
+        'executionMode': args.execution_mode,
+        'playbooks': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    else:
+        print(json.dumps(current, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(current, json.load(f), args.tolerance)
+        for regression in found:
+            print(f'Regression {regression}', file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
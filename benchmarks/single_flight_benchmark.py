@@ -0,0 +1,93 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+#Delivers the seven password policy findings (CIS 1.5 to 1.11) of each account to several simulated containers
+#at once and counts how many policy updates run. Containers share a lock table, local_dynamodb.py stands in for it.
+#
+#  python benchmarks/single_flight_benchmark.py --accounts 10 --containers 4
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Functions', 'master-account')
+sys.path.insert(0, FUNCTIONS_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_dynamodb import LocalDynamoDB
+from common import single_flight
+
+FINDINGS_PER_ACCOUNT = 7
+
+def run(mode: str, accounts: int, containers: int, latency: float):
+    table = LocalDynamoDB()
+    lockTable = single_flight.LockTable('single-flight-benchmark', dynamodb=table)
+    updates = []
+    updatesLock = threading.Lock()
+
+    def update_policy(accountId):
+        time.sleep(latency)
+        with updatesLock:
+            updates.append(accountId)
+        return f'IAM Password Policy Updated in account {accountId} sucessfully!'
+
+    #One SingleFlight per simulated container, they only share the lock table
+    flights = [single_flight.SingleFlight(lockTable if mode == 'shared' else None) for _ in range(containers)]
+
+    def handle(job):
+        container, accountId = job
+        if mode == 'none':
+            return update_policy(accountId)
+        return flights[container].do('cis1-5-11#' + accountId, lambda: update_policy(accountId))
+
+    jobs = [(container, str(100000000000 + account)) for account in range(accounts) for container in range(containers) for _ in range(FINDINGS_PER_ACCOUNT)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(64, len(jobs))) as executor:
+        notes = list(executor.map(handle, jobs))
+    elapsed = time.perf_counter() - start
+    return {'elapsedSeconds': round(elapsed, 3), 'findings': len(jobs), 'policyUpdates': len(updates), 'lockTableCalls': table.calls, 'distinctNotes': len(set(notes))}
+
+def main():
+    parser = argparse.ArgumentParser(description='Policy updates made for password policy findings with and without single-flight')
+    parser.add_argument('--accounts', type=int, default=10)
+    parser.add_argument('--containers', type=int, default=4, help='containers receiving the findings of every account')
+    parser.add_argument('--latency-ms', type=float, default=100, help='simulated latency of update_account_password_policy')
+    parser.add_argument('--output', help='write results as JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ('none', 'in-process', 'shared'):
+        results[mode] = run(mode, args.accounts, args.containers, args.latency_ms / 1000)
+        print(f"{mode}: {results[mode]['policyUpdates']} policy updates for {results[mode]['findings']} findings", file=sys.stderr)
+
+    report = {'accounts': args.accounts, 'containers': args.containers, 'latencyMs': args.latency_ms, 'modes': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
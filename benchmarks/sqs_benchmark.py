@@ -0,0 +1,142 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+
+#Delivers one burst of Security Hub events twice against the in-memory AWS APIs of fake_aws.py: once the
+#way the EventBridge rules invoke the playbook functions, one cold container per event and playbook, and
+#once through a local stand-in for the SQS queue of the Buffered deployment, one container per batch.
+#Reports invocations, AssumeRole and other API calls and the outcome of every finding as JSON.
+#
+#  python benchmarks/sqs_benchmark.py --events 200 --findings 2 --accounts 10 --batch-size 50
+
+import os
+import sys
+import json
+import time
+import argparse
+import collections
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay_benchmark
+from fake_aws import FakeAWS
+from local_sqs import LocalQueue
+from common import metrics
+from common import finding_runner
+from cis import cis_playbook_registry
+from cis import cis_sqs_consumer_lambda
+
+def make_burst(events: int, findings: int, accounts: int, region: str):
+    #Events rotate over every playbook, like Security Hub importing the results of a full CIS evaluation
+    playbooks = list(cis_playbook_registry.PLAYBOOKS.values())
+    return [replay_benchmark.make_event(playbooks[index % len(playbooks)]['titles'], findings, accounts, region) for index in range(events)]
+
+def _measure(backend: FakeAWS, deliver):
+    callsBefore = dict(backend.calls)
+    start = time.perf_counter()
+    invocations, statuses, deadLetters = deliver()
+    elapsed = time.perf_counter() - start
+    calls = {operation: count - callsBefore.get(operation, 0) for operation, count in backend.calls.items() if count > callsBefore.get(operation, 0)}
+    return {
+        'elapsedSeconds': round(elapsed, 3),
+        'invocations': invocations,
+        'assumeRoleCalls': calls.get('sts.AssumeRole', 0),
+        'apiCalls': sum(calls.values()),
+        'statuses': dict(statuses),
+        'deadLetters': deadLetters
+    }
+
+def run_direct(backend: FakeAWS, burst, region: str):
+    def deliver():
+        invocations = 0
+        statuses = collections.Counter()
+        for event in burst:
+            routes, _ = cis_playbook_registry.pattern_index().route(event)
+            for playbook, findings in routes.items():
+                replay_benchmark.start_container(region)
+                module = cis_playbook_registry.load_playbook(playbook)
+                try:
+                    results = module.lambda_handler(dict(event, detail={'findings': findings}), None)['results']
+                except finding_runner.RemediationError as e:
+                    results = e.results
+                invocations += 1
+                statuses.update(result['status'] for result in results)
+        return invocations, statuses, 0
+    return _measure(backend, deliver)
+
+def run_buffered(backend: FakeAWS, burst, region: str, batchSize: int):
+    def deliver():
+        queue = LocalQueue()
+        for event in burst:
+            queue.send_event(event)
+        statuses = collections.Counter()
+        getResults = cis_sqs_consumer_lambda._run_group
+
+        def run_group(playbook, detailType, group):
+            results = getResults(playbook, detailType, group)
+            statuses.update(result['status'] for result in results)
+            return results
+
+        cis_sqs_consumer_lambda._run_group = run_group
+        try:
+            invocations = queue.drain(cis_sqs_consumer_lambda.lambda_handler, batchSize, beforeBatch=lambda: replay_benchmark.start_container(region))
+        finally:
+            cis_sqs_consumer_lambda._run_group = getResults
+        return invocations, statuses, len(queue.deadLetters)
+    return _measure(backend, deliver)
+
+def main():
+    parser = argparse.ArgumentParser(description='Direct EventBridge invocations against the buffered SQS path for one burst of events')
+    parser.add_argument('--events', type=int, default=55)
+    parser.add_argument('--findings', type=int, default=1, help='findings per event')
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=100, help='messages per consumer invocation')
+    parser.add_argument('--latency-ms', type=float, default=5, help='simulated latency of every AWS call')
+    parser.add_argument('--output', help='write results as JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    metrics.ENABLED = False
+    region = 'us-east-1'
+    backend = FakeAWS(args.latency_ms / 1000)
+    replay_benchmark.install(backend)
+    results = {}
+    for mode in ('direct', 'buffered'):
+        #Each mode gets its own burst with its own non compliant resources
+        burst = make_burst(args.events, args.findings, args.accounts, region)
+        for event in burst:
+            for finding in event['detail']['findings']:
+                backend.seed(finding)
+        with contextlib.redirect_stdout(sys.stderr):
+            if mode == 'direct':
+                results[mode] = run_direct(backend, burst, region)
+            else:
+                results[mode] = run_buffered(backend, burst, region, args.batch_size)
+        print(f"{mode}: {results[mode]['invocations']} invocations, {results[mode]['assumeRoleCalls']} AssumeRole calls, {results[mode]['apiCalls']} API calls, {results[mode]['statuses']}", file=sys.stderr)
+
+    output = json.dumps({'events': args.events, 'findingsPerEvent': args.findings, 'accounts': args.accounts, 'batchSize': args.batch_size, 'modes': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+#Measures cold start cost of the playbooks: each module is imported in a fresh interpreter,
+#then the clients it needs on its first invocation are created. No AWS calls are made.
+#
+#  python benchmarks/startup_benchmark.py --runs 5 --output startup.json
+#  python benchmarks/startup_benchmark.py --baseline startup.json --tolerance 0.2
+
+import os
+import re
+import sys
+import json
+import glob
+import argparse
+import statistics
+import subprocess
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Functions', 'master-account')
+
+#Runs inside the fresh interpreter, prints the timings as JSON
+PROBE = '''
+import sys, time, json, importlib
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+import boto3
+from common import client_registry
+botocoreLoaded = time.perf_counter()
+session = boto3.Session(aws_access_key_id='benchmark', aws_secret_access_key='benchmark', aws_session_token='benchmark', region_name='us-east-1')
+client_registry.get_client('sts')
+client_registry.get_client('securityhub')
+client_registry.get_client('sns')
+for service in sys.argv[2].split(',') if sys.argv[2] else []:
+    client_registry.get_client(service, session)
+for service in sys.argv[3].split(',') if sys.argv[3] else []:
+    client_registry.get_resource(service, session)
+clients = time.perf_counter()
+print(json.dumps({'importMs': (imported - start) * 1000, 'boto3ImportMs': (botocoreLoaded - imported) * 1000, 'firstClientsMs': (clients - botocoreLoaded) * 1000, 'modules': len(sys.modules)}))
+'''
+
+def playbook_modules():
+    for path in sorted(glob.glob(os.path.join(FUNCTIONS_DIR, 'cis', '*_RR_lambda.py'))):
+        source = open(path).read()
+        clients = sorted(set(re.findall(r"get_client\('(\w+)', session", source)))
+        resources = sorted(set(re.findall(r"get_resource\('(\w+)', session", source)))
+        yield 'cis.' + os.path.basename(path)[:-3], clients, resources
+
+def run_probe(module: str, clients, resources):
+    env = dict(os.environ, AWS_DEFAULT_REGION='us-east-1', AWS_REGION='us-east-1', PYTHONDONTWRITEBYTECODE='1')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, module, ','.join(clients), ','.join(resources)],
+        cwd=FUNCTIONS_DIR, env=env, check=True, stdout=subprocess.PIPE
+    ).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def benchmark(runs: int):
+    results = {}
+    for module, clients, resources in playbook_modules():
+        samples = [run_probe(module, clients, resources) for _ in range(runs)]
+        results[module] = {
+            'importMs': round(statistics.median(sample['importMs'] for sample in samples), 2),
+            'boto3ImportMs': round(statistics.median(sample['boto3ImportMs'] for sample in samples), 2),
+            'firstClientsMs': round(statistics.median(sample['firstClientsMs'] for sample in samples), 2),
+            'totalMs': round(statistics.median(sample['importMs'] + sample['boto3ImportMs'] + sample['firstClientsMs'] for sample in samples), 2),
+            'modules': samples[-1]['modules'],
+            'clients': clients + resources
+        }
+        print(f"{module}: import {results[module]['importMs']}ms, boto3 {results[module]['boto3ImportMs']}ms, first clients {results[module]['firstClientsMs']}ms", file=sys.stderr)
+    return {'python': sys.version.split()[0], 'runs': runs, 'playbooks': results}
+
+def regressions(current, baseline, tolerance: float):
+    found = []
+    for module, result in current['playbooks'].items():
+        previous = baseline['playbooks'].get(module)
+        if previous and result['totalMs'] > previous['totalMs'] * (1 + tolerance):
+            found.append(f"{module}: {previous['totalMs']}ms -> {result['totalMs']}ms")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start import and client creation benchmark for the playbooks')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per playbook, the median is reported')
+    parser.add_argument('--output', help='write results as JSON to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    current = benchmark(args.runs)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    else:
+        print(json.dumps(current, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(current, json.load(f), args.tolerance)
+        for regression in found:
+            print(f'Regression {regression}', file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'Functions', 'master-account'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+@pytest.fixture
+def backend(monkeypatch):
+    #Every client the playbooks create answers from a fresh FakeAWS, in a fresh container
+    import replay_benchmark
+    from fake_aws import FakeAWS
+    from common import metrics
+    from common import client_registry
+    from common import log_group_provisioner
+
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    monkeypatch.setattr(client_registry, 'get_client', client_registry.get_client)
+    monkeypatch.setattr(client_registry, 'get_resource', client_registry.get_resource)
+    backend = FakeAWS()
+    replay_benchmark.install(backend)
+    replay_benchmark.start_container('us-east-1')
+    log_group_provisioner.clear_cache()
+    yield backend
+    log_group_provisioner.clear_cache()
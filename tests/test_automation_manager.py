@@ -0,0 +1,70 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import time
+
+import pytest
+
+from common import deadline
+from common import finding_runner
+from common import automation_manager
+
+class Context:
+
+    def __init__(self, remainingMillis):
+        self.remainingMillis = remainingMillis
+
+    def get_remaining_time_in_millis(self):
+        return self.remainingMillis
+
+class RunningSSM:
+
+    #Every automation keeps running
+    def __init__(self):
+        self.started = []
+
+    def start_automation_execution(self, **kwargs):
+        self.started.append(kwargs)
+        return {'AutomationExecutionId': f'0000000{len(self.started)}-0000-0000-0000-000000000000'}
+
+    def get_automation_execution(self, AutomationExecutionId):
+        return {'AutomationExecution': {'AutomationExecutionId': AutomationExecutionId, 'AutomationExecutionStatus': 'InProgress'}}
+
+    def describe_automation_executions(self, **kwargs):
+        #No child execution started yet
+        return {'AutomationExecutionMetadataList': []}
+
+def test_wait_stops_at_the_invocation_deadline():
+    deadline.start(Context(deadline.SAFETY_MARGIN_SECONDS * 1000 + 500))
+    start = time.monotonic()
+    outcomes = automation_manager.run(RunningSSM(), 'Document', 'Target', ['a'], timeout=30)
+    assert time.monotonic() - start < 2
+    assert outcomes['a'].status == 'InProgress'
+    with pytest.raises(finding_runner.RemediationPending):
+        automation_manager.resolve(outcomes['a'], 'Document', 'a', 'done')
+
+def test_no_wait_once_the_deadline_passed():
+    deadline.start(Context(0))
+    ssm = RunningSSM()
+    start = time.monotonic()
+    outcomes = automation_manager.run(ssm, 'Document', 'Target', ['a', 'b'], timeout=30)
+    assert time.monotonic() - start < 0.5
+    assert len(ssm.started) == 1
+    assert {outcome.status for outcome in outcomes.values()} == {'InProgress'}
@@ -0,0 +1,77 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import pytest
+
+import replay_benchmark
+
+from common import finding_runner
+from cis import cis_playbook_registry
+from cis import cis_sweep_lambda
+
+BLOCKED = {setting: True for setting in ('BlockPublicAcls', 'IgnorePublicAcls', 'BlockPublicPolicy', 'RestrictPublicBuckets')}
+
+def _event(backend, playbook: str, findings: int):
+    event = replay_benchmark.make_event(cis_playbook_registry.PLAYBOOKS[playbook]['titles'], findings, 1, 'us-east-1')
+    for finding in event['detail']['findings']:
+        backend.seed(finding)
+    return event
+
+def _targets(backend):
+    return {execution['Target'] for execution in backend.executions.values() if 'Target' in execution}
+
+def test_batch_skips_compliant_buckets(backend):
+    event = _event(backend, 'cis_2-3_RR_lambda', finding_runner.BULK_MIN_FINDINGS + 1)
+    buckets = [finding['Resources'][0]['Id'].replace('arn:aws:s3:::', '') for finding in event['detail']['findings']]
+    for bucket in buckets[:3]:
+        backend.buckets[(event['detail']['findings'][0]['AwsAccountId'], bucket)]['PublicAccessBlock'] = dict(BLOCKED)
+
+    results = cis_playbook_registry.load_playbook('cis_2-3_RR_lambda').lambda_handler(event, None)['results']
+    assert {result['status'] for result in results} == {'SUCCESS'}
+    assert _targets(backend) == set(buckets[3:])
+
+def test_batch_without_noncompliant_resources_starts_nothing(backend):
+    event = _event(backend, 'cis_2-6_RR_lambda', finding_runner.BULK_MIN_FINDINGS)
+    for key in backend.buckets:
+        backend.buckets[key]['LoggingEnabled'] = {'TargetBucket': 'access-logging'}
+
+    results = cis_playbook_registry.load_playbook('cis_2-6_RR_lambda').lambda_handler(event, None)['results']
+    assert {result['status'] for result in results} == {'SUCCESS'}
+    assert backend.calls['ssm.StartAutomationExecution'] == 0
+
+class SecurityHub:
+
+    #Records the filters the sweep pages findings with
+    def __init__(self):
+        self.filters = []
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Filters, PaginationConfig):
+        self.filters.append(Filters)
+        return [{'Findings': []}]
+
+@pytest.mark.parametrize('pendingOnly, workflowStatuses', [(False, {'NEW', 'NOTIFIED'}), (True, {'NOTIFIED'})])
+def test_sweep_pending_only(monkeypatch, pendingOnly, workflowStatuses):
+    securityhub = SecurityHub()
+    monkeypatch.setattr(cis_sweep_lambda.client_registry, 'get_client', lambda serviceName, session=None, region=None: securityhub)
+    assert list(cis_sweep_lambda.open_findings(pendingOnly=pendingOnly)) == []
+    assert {filters['WorkflowStatus'][0]['Value'] for filters in securityhub.filters} == workflowStatuses
@@ -0,0 +1,62 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import datetime
+
+import replay_benchmark
+
+from common import finding_runner
+from cis import cis_playbook_registry
+
+PLAYBOOK = 'cis_1-3_1-4_RR_lambda'
+
+def _event(backend):
+    event = replay_benchmark.make_event(cis_playbook_registry.PLAYBOOKS[PLAYBOOK]['titles'][:1], finding_runner.BULK_MIN_FINDINGS, 1, 'us-east-1')
+    for finding in event['detail']['findings']:
+        backend.seed(finding)
+    return event
+
+def _report(generatedTime):
+    #A report that lists no access key at all, so every user looks compliant
+    def get_credential_report(account, region, **kwargs):
+        return {'Content': b'user,access_key_1_active,access_key_1_last_rotated,access_key_2_active,access_key_2_last_rotated\n', 'ReportFormat': 'text/csv', 'GeneratedTime': generatedTime}
+    return get_credential_report
+
+def _active_keys(backend):
+    return [key for keys in backend.accessKeys.values() for key in keys if key['Status'] == 'Active']
+
+def test_cached_report_does_not_resolve_newer_findings(backend):
+    #The report was generated before the keys became stale and the findings were raised
+    backend.iam_GetCredentialReport = _report(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=3))
+    event = _event(backend)
+
+    results = cis_playbook_registry.load_playbook(PLAYBOOK).lambda_handler(event, None)['results']
+    assert {result['status'] for result in results} == {'SUCCESS'}
+    assert _active_keys(backend) == []
+    assert backend.calls['iam.ListAccessKeys'] == finding_runner.BULK_MIN_FINDINGS
+
+def test_fresh_report_resolves_without_listing_keys(backend):
+    event = _event(backend)
+    backend.iam_GetCredentialReport = _report(datetime.datetime.now(datetime.timezone.utc))
+
+    results = cis_playbook_registry.load_playbook(PLAYBOOK).lambda_handler(event, None)['results']
+    assert {result['status'] for result in results} == {'SUCCESS'}
+    assert len(_active_keys(backend)) == finding_runner.BULK_MIN_FINDINGS
+    assert backend.calls['iam.ListAccessKeys'] == 0
@@ -0,0 +1,48 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import copy
+import uuid
+
+import replay_benchmark
+
+from cis import cis_playbook_registry
+
+PLAYBOOK = 'cis_2-4_RR_lambda'
+
+def test_deleted_log_group_is_created_again(backend):
+    module = cis_playbook_registry.load_playbook(PLAYBOOK)
+    event = replay_benchmark.make_event(cis_playbook_registry.PLAYBOOKS[PLAYBOOK]['titles'], 1, 1, 'us-east-1')
+    finding = event['detail']['findings'][0]
+    backend.seed(finding)
+    assert module.lambda_handler(event, None)['results'][0]['status'] == 'SUCCESS'
+    assert len(backend.logGroups) == 1
+
+    #The log group is deleted and the trail stops logging, while the container still has the group cached
+    backend.logGroups.clear()
+    trail = next(iter(backend.trails.values()))
+    trail.pop('CloudWatchLogsLogGroupArn')
+    event = copy.deepcopy(event)
+    event['detail']['findings'][0]['Id'] = finding['Id'].rsplit('/', 1)[0] + '/' + str(uuid.uuid4())
+
+    assert module.lambda_handler(event, None)['results'][0]['status'] == 'SUCCESS'
+    assert len(backend.logGroups) == 1
+    assert trail['CloudWatchLogsLogGroupArn'].split(':')[6] == next(iter(backend.logGroups))[2]
+    assert backend.calls['logs.CreateLogGroup'] == 2
@@ -0,0 +1,36 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import replay_benchmark
+
+from cis import cis_playbook_registry
+
+PLAYBOOK = 'cis_2-9_RR_lambda'
+
+def test_flow_log_is_created_in_the_vpc_region(backend):
+    #Security Hub aggregates the finding into us-east-1, the VPC itself lives in eu-west-1
+    event = replay_benchmark.make_event(cis_playbook_registry.PLAYBOOKS[PLAYBOOK]['titles'], 1, 1, 'us-east-1')
+    finding = event['detail']['findings'][0]
+    finding['Resources'][0]['Region'] = 'eu-west-1'
+    backend.seed(finding)
+
+    assert cis_playbook_registry.load_playbook(PLAYBOOK).lambda_handler(event, None)['results'][0]['status'] == 'SUCCESS'
+    assert [region for (account, region), flowLogs in backend.flowLogs.items() if flowLogs] == ['eu-west-1']
+    assert [key[1] for key in backend.logGroups] == ['eu-west-1']
@@ -0,0 +1,50 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import boto3
+import pytest
+
+from common import client_registry
+from common import metrics
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    monkeypatch.setattr(client_registry, 'MAX_CACHED_CLIENTS', 2)
+    client_registry.clear()
+    yield boto3.Session(aws_access_key_id='AKIAEXAMPLE', aws_secret_access_key='secret', region_name='us-east-1')
+    client_registry.clear()
+
+def test_clients_are_evicted_least_recently_used(session):
+    ec2 = client_registry.get_client('ec2', session)
+    client_registry.get_client('iam', session)
+    assert client_registry.get_client('ec2', session) is ec2
+    client_registry.get_client('kms', session)
+    #iam was used least recently, so it was evicted instead of ec2
+    assert client_registry.get_client('ec2', session) is ec2
+    assert [key[1] for key in client_registry._clients] == ['kms', 'ec2']
+
+def test_resources_are_evicted_least_recently_used(session):
+    iam = client_registry.get_resource('iam', session)
+    client_registry.get_resource('s3', session)
+    assert client_registry.get_resource('iam', session) is iam
+    client_registry.get_resource('ec2', session)
+    assert client_registry.get_resource('iam', session) is iam
+    assert [key[1] for key in client_registry._resources.cache] == ['ec2', 'iam']
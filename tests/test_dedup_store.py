@@ -0,0 +1,152 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import re
+import time
+import types
+
+import pytest
+import yaml
+
+from common import deadline
+from common import event_pattern
+from common import dedup_store
+from common import finding_runner
+from local_dynamodb import LocalDynamoDB
+from conftest import ROOT
+
+TABLE = 'dedup'
+
+class Context:
+
+    def __init__(self, remainingMillis):
+        self.remainingMillis = remainingMillis
+
+    def get_remaining_time_in_millis(self):
+        return self.remainingMillis
+
+@pytest.fixture
+def store():
+    deadline.start(Context(60000))
+    return dedup_store.DynamoDBDedupStore(TABLE, ttlSeconds=3600, dynamodb=LocalDynamoDB())
+
+def expires_in(store, key):
+    item = store.dynamodb.get_item(TableName=TABLE, Key={'DedupKey': {'S': key}})['Item']
+    return int(item['ExpiresAt']['N']) - int(time.time())
+
+def test_claim_and_duplicate(store):
+    assert store.claim('cis_2-7#a#1')
+    assert not store.claim('cis_2-7#a#1')
+    assert store.claim('cis_2-7#a#2')
+    assert store.claim('cis_2-8#a#1')
+
+def test_release_allows_claim_again(store):
+    assert store.claim('key')
+    store.release('key')
+    assert store.dynamodb.tables[TABLE] == {}
+    assert store.claim('key')
+
+def test_claim_expires_with_the_invocation(store):
+    deadline.start(Context(20000))
+    assert store.claim('key')
+    assert 19 <= expires_in(store, 'key') <= 22
+
+def later(monkeypatch, seconds):
+    now = time.time() + seconds
+    monkeypatch.setattr(time, 'time', lambda: now)
+
+def test_timed_out_claim_can_be_claimed_again(store, monkeypatch):
+    deadline.start(Context(30000))
+    assert store.claim('key')
+    later(monkeypatch, 40)
+    assert store.claim('key')
+
+def test_complete_keeps_claim_for_ttl(store):
+    keys = [f'key{index}' for index in range(60)]
+    for key in keys:
+        assert store.claim(key)
+    calls = store.dynamodb.calls
+    store.complete(keys)
+    assert store.dynamodb.calls - calls == 3
+    assert all(3598 <= expires_in(store, key) <= 3600 for key in keys)
+    assert not store.claim('key0')
+
+def test_memory_store_in_progress_and_complete(monkeypatch):
+    deadline.start(Context(30000))
+    store = dedup_store.MemoryDedupStore(ttlSeconds=3600)
+    assert store.claim('done')
+    assert store.claim('crashed')
+    store.complete(['done'])
+    later(monkeypatch, 40)
+    assert not store.claim('done')
+    assert store.claim('crashed')
+
+def test_finish_releases_failed_and_completes_resolved(store):
+    dedup_store.set_store(store)
+    try:
+        for key in ('resolved', 'failed', 'pending'):
+            assert store.claim(key)
+        results = {
+            'a': {'findingId': 'a', 'status': 'SUCCESS'},
+            'b': {'findingId': 'b', 'status': 'FAILED'},
+            'c': {'findingId': 'c', 'status': 'PENDING'}
+        }
+        with pytest.raises(finding_runner.RemediationError):
+            finding_runner.finish(results, {'a': 'resolved', 'b': 'failed', 'c': 'pending'})
+        assert set(store.dynamodb.tables[TABLE]) == {'resolved'}
+        assert expires_in(store, 'resolved') >= 3598
+    finally:
+        dedup_store.set_store(None)
+
+def test_dedup_key():
+    finding = types.SimpleNamespace(id='arn:finding', updatedAt='2020-01-01T00:00:00Z')
+    assert dedup_store.dedup_key(finding, 'cis_2-7') == 'cis_2-7#arn:finding#2020-01-01T00:00:00Z'
+
+def _statements(node):
+    #Every IAM statement of the template, including those inside !If
+    if isinstance(node, dict):
+        if 'Action' in node and 'Resource' in node:
+            yield node
+        for value in node.values():
+            yield from _statements(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _statements(value)
+
+def test_roles_allow_every_table_call():
+    #LocalDynamoDB has no IAM, so the actions the stores call are checked against the template
+    calls = set()
+    for module in ('dedup_store.py', 'single_flight.py'):
+        with open(os.path.join(ROOT, 'Functions', 'master-account', 'common', module)) as f:
+            calls.update(re.findall(r'dynamodb\.(\w+)\(', f.read()))
+    actions = {'dynamodb:' + ''.join(part.capitalize() for part in call.split('_')) for call in calls}
+    assert 'dynamodb:BatchWriteItem' in actions
+
+    class TemplateLoader(yaml.SafeLoader):
+        pass
+    TemplateLoader.add_multi_constructor('!', event_pattern._intrinsic)
+    with open(os.path.join(ROOT, 'CloudFormation', 'master-account', 'response_cis-aws-benchmark.yaml')) as f:
+        template = yaml.load(f, Loader=TemplateLoader)
+
+    statements = [statement for statement in _statements(template['Resources']) if statement['Resource'] == {'Fn::GetAtt': ['DedupTable', 'Arn']}]
+    assert len(statements) == 14
+    for statement in statements:
+        assert actions <= set(statement['Action'])
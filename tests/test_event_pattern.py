@@ -0,0 +1,96 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import pytest
+
+from common import event_pattern
+from common.event_pattern import matches
+from cis import cis_playbook_registry
+
+FINDING = {
+    'Title': '2.7 Ensure CloudTrail logs are encrypted at rest using KMS CMKs',
+    'AwsAccountId': '111111111111',
+    'Severity': {'Normalized': 40, 'Label': 'MEDIUM'},
+    'Compliance': {'Status': 'FAILED'},
+    'Resources': [{'Type': 'AwsCloudTrailTrail', 'Region': 'us-east-1'}, {'Type': 'AwsAccount'}]
+}
+
+def test_value_list():
+    assert matches({'Compliance': {'Status': ['FAILED', 'WARNING']}}, FINDING)
+    assert not matches({'Compliance': {'Status': ['PASSED']}}, FINDING)
+    assert not matches({'Workflow': {'Status': ['NEW']}}, FINDING)
+
+def test_arrays_match_any_element():
+    assert matches({'Resources': {'Type': ['AwsAccount']}}, FINDING)
+    assert not matches({'Resources': {'Type': ['AwsS3Bucket']}}, FINDING)
+
+def test_exists():
+    assert matches({'Severity': {'Label': [{'exists': True}]}}, FINDING)
+    assert not matches({'Severity': {'Product': [{'exists': True}]}}, FINDING)
+    assert matches({'Severity': {'Product': [{'exists': False}]}}, FINDING)
+    assert not matches({'Severity': {'Label': [{'exists': False}]}}, FINDING)
+
+def test_prefix_and_suffix():
+    assert matches({'Title': [{'prefix': '2.7 '}]}, FINDING)
+    assert not matches({'Title': [{'prefix': '2.8 '}]}, FINDING)
+    assert matches({'Title': [{'suffix': 'KMS CMKs'}]}, FINDING)
+    assert not matches({'AwsAccountId': [{'suffix': '2'}]}, FINDING)
+
+def test_equals_ignore_case():
+    assert matches({'Severity': {'Label': [{'equals-ignore-case': 'medium'}]}}, FINDING)
+    assert not matches({'Severity': {'Label': [{'equals-ignore-case': 'high'}]}}, FINDING)
+
+def test_anything_but():
+    assert matches({'Compliance': {'Status': [{'anything-but': 'PASSED'}]}}, FINDING)
+    assert not matches({'Compliance': {'Status': [{'anything-but': ['PASSED', 'FAILED']}]}}, FINDING)
+    assert matches({'AwsAccountId': [{'anything-but': {'prefix': '2'}}]}, FINDING)
+    assert not matches({'Title': [{'anything-but': {'suffix': 'CMKs'}}]}, FINDING)
+
+def test_numeric():
+    assert matches({'Severity': {'Normalized': [{'numeric': ['>=', 40, '<', 70]}]}}, FINDING)
+    assert not matches({'Severity': {'Normalized': [{'numeric': ['>', 40]}]}}, FINDING)
+    assert matches({'Severity': {'Normalized': [{'numeric': ['=', 40]}]}}, FINDING)
+    assert not matches({'Severity': {'Label': [{'numeric': ['>', 0]}]}}, FINDING)
+
+def test_unsupported_operator():
+    with pytest.raises(event_pattern.PatternError):
+        matches({'Title': [{'wildcard': '2.*'}]}, FINDING)
+
+def test_index_routes_by_title_and_envelope():
+    index = event_pattern.PatternIndex()
+    index.add('encryption', 'cis_2-7', {'source': ['aws.securityhub'], 'detail': {'findings': {'Title': [FINDING['Title']], 'Compliance': {'Status': ['FAILED']}}}})
+    index.add('high', 'alerts', {'detail': {'findings': {'Severity': {'Label': ['HIGH']}}}})
+    assert index.match(FINDING).target == 'cis_2-7'
+    assert index.match(FINDING, {'source': 'aws.config'}) is None
+    passed = dict(FINDING, Compliance={'Status': 'PASSED'})
+    routes, unrouted = index.route({'source': 'aws.securityhub', 'detail': {'findings': [FINDING, passed]}})
+    assert routes == {'cis_2-7': [FINDING]}
+    assert unrouted == [passed]
+
+def test_registry_fallback_matches_template():
+    #The Lambda bundle routes with default_pattern, so it has to stay in sync with the deployed rules
+    patterns = {}
+    for ruleId, function, pattern in event_pattern.load_template_rules(cis_playbook_registry.EVENT_PATTERN_TEMPLATE):
+        name = function.get('Properties', {}).get('Handler', '').rsplit('.', 1)[0].split('/')[-1]
+        if name in cis_playbook_registry.PLAYBOOKS and event_pattern.split_pattern(pattern or {})[1] is not None:
+            patterns[name] = pattern
+    assert patterns.keys() == cis_playbook_registry.PLAYBOOKS.keys()
+    for name, pattern in patterns.items():
+        assert pattern == cis_playbook_registry.default_pattern(name), name
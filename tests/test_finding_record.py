@@ -0,0 +1,62 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import pytest
+
+from common.finding_record import parse_resource_id, MalformedFindingError
+
+def test_arn_with_type_and_name():
+    resource = parse_resource_id('arn:aws:cloudtrail:eu-west-1:111111111111:trail/management-events')
+    assert (resource.id, resource.partition, resource.service, resource.region, resource.account) == ('arn:aws:cloudtrail:eu-west-1:111111111111:trail/management-events', 'aws', 'cloudtrail', 'eu-west-1', '111111111111')
+    assert (resource.resourceType, resource.name) == ('trail', 'management-events')
+
+def test_arn_with_path_uses_last_part():
+    resource = parse_resource_id('arn:aws:iam::111111111111:user/division/alice')
+    assert resource.region is None
+    assert (resource.resourceType, resource.name) == ('user', 'alice')
+
+def test_arn_without_region_or_account():
+    resource = parse_resource_id('arn:aws:s3:::access-logs')
+    assert (resource.region, resource.account, resource.resourceType, resource.name) == (None, None, None, 'access-logs')
+
+def test_arn_with_colon_separated_type():
+    resource = parse_resource_id('arn:aws-us-gov:logs:us-gov-west-1:111111111111:log-group:CloudTrail')
+    assert (resource.partition, resource.resourceType, resource.name) == ('aws-us-gov', 'log-group', 'CloudTrail')
+
+def test_type_prefix_is_stripped():
+    key = parse_resource_id('AWS::KMS::Key:1234abcd-12ab-34cd-56ef-1234567890ab')
+    assert key.id == key.name == '1234abcd-12ab-34cd-56ef-1234567890ab'
+    assert key.service is None
+    account = parse_resource_id('AWS::::Account:111111111111')
+    assert account.id == account.name == '111111111111'
+
+def test_type_prefix_before_an_arn():
+    resource = parse_resource_id('AWS::EC2::VPC:arn:aws:ec2:us-east-1:111111111111:vpc/vpc-0abc')
+    assert (resource.service, resource.resourceType, resource.name) == ('ec2', 'vpc', 'vpc-0abc')
+
+def test_plain_id():
+    resource = parse_resource_id('sg-0123456789abcdef0')
+    assert resource.id == resource.name == 'sg-0123456789abcdef0'
+    assert resource.partition is None and resource.resourceType is None
+
+@pytest.mark.parametrize('value', [None, '', 'AWS::KMS::Key:', 'arn:aws:s3:::', 'arn:aws:s3', 'arn::s3:::bucket'])
+def test_malformed_ids(value):
+    with pytest.raises(MalformedFindingError):
+        parse_resource_id(value)
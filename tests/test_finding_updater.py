@@ -0,0 +1,42 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+from common import finding_updater
+
+class SecurityHub:
+
+    def __init__(self):
+        self.calls = []
+
+    def batch_update_findings(self, FindingIdentifiers, Note, Workflow):
+        self.calls.append((len(FindingIdentifiers), Note['Text'], Workflow['Status']))
+        return {'ProcessedFindings': FindingIdentifiers, 'UnprocessedFindings': []}
+
+def test_findings_with_the_same_note_share_calls():
+    securityhub = SecurityHub()
+    updater = finding_updater.FindingUpdater('test', securityhub)
+    for index in range(150):
+        updater.add(f'finding-{index}', 'arn:product', 'resolved')
+    updater.add('finding-compliant', 'arn:product', 'compliant')
+    updater.add('finding-pending', 'arn:product', 'running', 'NOTIFIED')
+    assert len(updater) == 152
+    assert updater.flush() == []
+    assert securityhub.calls == [(100, 'resolved', 'RESOLVED'), (50, 'resolved', 'RESOLVED'), (1, 'compliant', 'RESOLVED'), (1, 'running', 'NOTIFIED')]
+    assert len(updater) == 0
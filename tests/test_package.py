@@ -0,0 +1,45 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import os
+import re
+import zipfile
+
+import build_package
+
+from conftest import ROOT
+
+TEMPLATE = os.path.join(ROOT, 'CloudFormation', 'master-account', 'response_cis-aws-benchmark.yaml')
+
+def test_package_matches_sources():
+    #Fails when cis/ or common/ changed without running build_package.py
+    with zipfile.ZipFile(build_package.PACKAGE) as package:
+        assert sorted(package.namelist()) == sorted(build_package.sources())
+        for name, source in build_package.sources().items():
+            with open(source, 'rb') as f:
+                assert package.read(name) == f.read(), f'{name} is out of date'
+
+def test_package_holds_every_handler():
+    with open(TEMPLATE) as f:
+        handlers = set(re.findall(r'Handler:\s*"?(cis/[\w-]+)\.lambda_handler', f.read()))
+    assert handlers
+    with zipfile.ZipFile(build_package.PACKAGE) as package:
+        names = set(package.namelist())
+    assert {handler + '.py' for handler in handlers} <= names
@@ -0,0 +1,66 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import time
+
+import pytest
+
+from common import deadline
+from common import single_flight
+from local_dynamodb import LocalDynamoDB
+
+class Context:
+
+    def __init__(self, remainingMillis):
+        self.remainingMillis = remainingMillis
+
+    def get_remaining_time_in_millis(self):
+        return self.remainingMillis
+
+@pytest.fixture
+def table():
+    return LocalDynamoDB()
+
+def test_result_is_shared_between_containers(table):
+    deadline.start(Context(60000))
+    first = single_flight.SingleFlight(single_flight.LockTable('locks', table))
+    second = single_flight.SingleFlight(single_flight.LockTable('locks', table))
+    assert first.do('policy', lambda: 'updated') == 'updated'
+    assert second.do('policy', lambda: 'again') == 'updated'
+    assert (first.executions, second.executions) == (1, 0)
+
+def test_wait_for_other_container_stops_before_the_deadline(table):
+    #Another container holds the lock and does not finish within this invocation
+    assert single_flight.LockTable('locks', table).acquire('policy')
+    deadline.start(Context(deadline.SAFETY_MARGIN_SECONDS * 1000 + 500))
+    waiter = single_flight.SingleFlight(single_flight.LockTable('locks', table))
+    start = time.monotonic()
+    with pytest.raises(single_flight.LockWaitTimeout):
+        waiter.do('policy', lambda: 'updated')
+    assert time.monotonic() - start < 2
+    assert waiter.executions == 0
+
+def test_no_wait_once_the_deadline_passed(table):
+    assert single_flight.LockTable('locks', table).acquire('policy')
+    deadline.start(Context(0))
+    calls = table.calls
+    with pytest.raises(single_flight.LockWaitTimeout):
+        single_flight.SingleFlight(single_flight.LockTable('locks', table)).do('policy', lambda: 'updated')
+    assert table.calls - calls == 1
@@ -0,0 +1,70 @@
+ # Copyright 2020 Stefan Prioriello
+ # SPDX-License-Identifier: MIT
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a copy of this 
+ # software and associated documentation files (the "Software"), to deal in the Software 
+ # without restriction, including without limitation the rights to use, copy, modify, 
+ # merge, publish, distribute, sublicense, and/or sell copies of the Software, and to 
+ # permit persons to whom the Software is furnished to do so, subject to the following 
+ # conditions:
+ #
+ # The above copyright notice and this permission notice shall be included in all 
+ # copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ # INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ # PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ 
+import pytest
+
+from common import client_registry
+from common import sns_notification
+
+class SNS:
+
+    def __init__(self):
+        self.fail = False
+        self.messages = []
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        if self.fail:
+            return {'Successful': [], 'Failed': [{'Id': entry['Id'], 'Code': 'InternalError'} for entry in PublishBatchRequestEntries]}
+        self.messages.extend(entry['Message'] for entry in PublishBatchRequestEntries)
+        return {'Successful': [{'Id': entry['Id']} for entry in PublishBatchRequestEntries], 'Failed': []}
+
+@pytest.fixture
+def sns(monkeypatch):
+    client = SNS()
+    monkeypatch.setattr(client_registry, 'get_client', lambda serviceName, session=None, region=None: client)
+    return client
+
+def notifier(*keys, accountId='111111111111'):
+    notifier = sns_notification.SNSNotifier('arn:aws:sns:us-east-1:111111111111:alerts', mode='digest')
+    for key in keys:
+        notifier.add(key, f'resolved {key}', 'CIS 2.7', accountId)
+    return notifier
+
+def test_digest_per_control_and_account(sns):
+    digests = notifier('a', 'b')
+    digests.add('c', 'resolved c', 'CIS 2.7', '222222222222')
+    assert digests.flush() == []
+    assert len(sns.messages) == 2
+    assert 'Finding Id: a' in sns.messages[0] and 'Finding Id: b' in sns.messages[0]
+    assert 'Finding Id: c' in sns.messages[1]
+
+def test_digest_is_not_held_for_later_invocations(sns):
+    assert notifier('a').flush() == []
+    assert len(sns.messages) == 1
+    assert notifier().flush() == []
+    assert len(sns.messages) == 1
+
+def test_failed_digest_returns_its_keys(sns):
+    sns.fail = True
+    assert notifier('a', 'b').flush() == ['a', 'b']
+    #Nothing is left over for the next flush, the failed findings are reported by this invocation
+    sns.fail = False
+    assert notifier().flush() == []
+    assert sns.messages == []